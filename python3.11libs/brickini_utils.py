@@ -53,28 +53,46 @@ def upgrade_brickini_hdas():
 def reload_brickini_nodes():
     '''
     Evals and sets (same) value on specific parms to trigger a reload.
-    This can be helpful if you modified an ldraw file or the brick_properties.json or ld_colors.json and want to see its effect.
+    This can be helpful if you modified an ldraw file or the part_properties.json or ld_colors.json and want to see its effect.
+    Networks of a static model import are updated from their ldraw file first, only the bricks that changed get rebuilt.
+    Every node records the files it read while cooking, only nodes with a file that changed since then are reloaded.
     '''
+    import ldraw
+    import ldraw_model
+
+    # materials read ld_colors.json through their menus, so they only depend on the color table of the session
+    colors_changed = ldraw.colors_changed()
+
+    # part nodes only check the library index once per session, files added to the library since then are picked up here
+    ldraw.library_index(refresh=True)
+
     nodes = hou.selectedNodes()
     nodelist = list(nodes)
     for n in nodelist:        
         node_type = n.type().nameComponents()[2]
         if node_type == 'geo':
             nodelist.remove(n)
+            ldraw_model.reload_model(n)
             nodelist.extend(n.children())
         elif node_type == 'brickini_ldraw_lop':
             geo_node = hou.node(n.path() + '/sopcreate1/sopnet/create')
+            ldraw_model.reload_model(geo_node)
             nodelist.extend(geo_node.children())
 
     for n in nodelist:
         node_type = n.type().nameComponents()[2]       
         if node_type == 'brickini_ldraw_part':
+            if not ldraw.dependencies_changed(n):
+                continue
+            ldraw.forget_dependencies(n)
             part_parm = n.parm('part')
             part_number = part_parm.eval()
             part_parm.set(part_number)
             # print('reloading {}'.format(n))
 
         elif node_type == 'brickini_material':
+            if not colors_changed:
+                continue
             mat_parms = []
             all_parms = n.parms()
 
@@ -89,10 +107,20 @@ def reload_brickini_nodes():
             # print('reloading {}'.format(n))
 
         elif node_type == 'brickini_ldraw_model':
+            # the part nodes inside the hda count as dependencies of the model
+            parts = [c for c in n.allSubChildren() if c.type().nameComponents()[2] == 'brickini_ldraw_part']
+            if not any(ldraw.dependencies_changed(c) for c in [n] + parts):
+                continue
+            for c in [n] + parts:
+                ldraw.forget_dependencies(c)
             part_parm = n.parm('reload')
             part_parm.pressButton()
             # print('reloading {}'.format(n))
 
+    if colors_changed:
+        # load the changed colors, so the next reload doesn't touch the materials again
+        ldraw.color_table()
+
 def cam_auto_frame():
     from pxr import Sdf, UsdGeom
     import math
@@ -1,8 +1,22 @@
 # pyright: reportMissingImports=false
 from pathlib import Path
-import hou
+import ldraw_headless
+import os
 import re
+import hashlib
+import time
 import json
+import warnings
+import numpy as np
+import ldraw_library
+import ldraw_parser
+import ldraw_cache
+import ldraw_compiler
+import ldraw_deps
+import ldraw_metrics
+import ldraw_prefetch
+
+hou = ldraw_headless.backend()
 
 def ldraw_lib():
     '''Returns the path to the ldraw library. This is set as an environment variable in the houdini.env file.'''
@@ -15,13 +29,188 @@ def resources():
     resources = ldraw2houdini_path / 'resources'
     return resources
 
+def cache_dir():
+    '''Returns the directory brickini writes its caches to. Defaults to $LDRAW_LIB/brickini_cache and can be overridden with LDRAW_CACHE_DIR.'''
+    cache_dir = hou.getenv('LDRAW_CACHE_DIR')
+    if cache_dir:
+        return Path(cache_dir)
+    return ldraw_lib() / 'brickini_cache'
+
+# magenta for color codes that don't exist
+not_found_color = (1.0, 0.0, 0.5)
+
+class LdrawColorTable:
+    '''
+    All colors of ld_colors.json plus dense arrays indexed by color code, so colors can be looked up per primitive without dict access.
+    Codes that aren't in the json have a magenta color and a category and name id of -1.
+    '''
+    def __init__(self, color_config):
+        self.path = color_config
+        self.mtime = os.stat(color_config).st_mtime_ns
+
+        with open(color_config, 'r') as f:
+            self.colors = json.load(f)
+
+        # unique categories and names in order of first appearance
+        self.categories = []
+        self.names = []
+
+        size = max(int(code) for code in self.colors) + 1
+        self.known = np.zeros(size, dtype=bool)
+        self.rgb = np.tile(np.array(not_found_color), (size, 1))
+        self.category = np.full(size, -1, dtype=np.int32)
+        self.name_id = np.full(size, -1, dtype=np.int32)
+
+        for code, color_info in self.colors.items():
+            code = int(code)
+            category = color_info['category']
+            name = color_info.get('name')
+
+            if category not in self.categories:
+                self.categories.append(category)
+            if name not in self.names:
+                self.names.append(name)
+
+            self.known[code] = True
+            self.rgb[code] = color_info['rgb']
+            self.category[code] = self.categories.index(category)
+            self.name_id[code] = self.names.index(name)
+
+    def code_index(self, color_code):
+        '''returns the color code as int if it exists in the table, otherwise -1'''
+        try:
+            code = int(color_code)
+        except ValueError:
+            return -1
+
+        if 0 <= code < len(self.known) and self.known[code]:
+            return code
+        return -1
+
+    def lookup(self, codes):
+        '''
+        vectorised lookup for an array of int color codes
+        returns rgb, category and a mask of the codes that exist in the table
+        '''
+        codes = np.asarray(codes)
+        valid = (codes >= 0) & (codes < len(self.known))
+        index = np.where(valid, codes, 0)
+        valid &= self.known[index]
+        index = np.where(valid, index, 0)
+
+        rgb = np.where(valid[..., None], self.rgb[index], not_found_color)
+        category = np.where(valid, self.category[index], -1)
+        return rgb, category, valid
+
+# keep the table when this module gets reloaded by the sop modules
+_color_table = globals().get('_color_table')
+
+def color_table():
+    '''Returns the ldraw color table. It is loaded once per session and only reloaded if ld_colors.json changed on disk.'''
+    global _color_table
+    color_config = resources() / 'ld_colors.json'
+
+    if _color_table is None or _color_table.path != color_config or _color_table.mtime != os.stat(color_config).st_mtime_ns:
+        _color_table = LdrawColorTable(color_config)
+    return _color_table
+
+def colors_changed():
+    '''Returns True if ld_colors.json changed since the color table of this session was loaded, or if no table was loaded yet.'''
+    color_config = resources() / 'ld_colors.json'
+    if _color_table is None:
+        return True
+    return _color_table.path != color_config or _color_table.mtime != os.stat(color_config).st_mtime_ns
+
 def color_lib():
     '''Returns a dict of ldraw colors.'''
-    color_config = resources() / 'ld_colors.json'
+    return color_table().colors
+
+def parse_prim_ranges(prim_string):
+    '''
+    Converts a houdini list that looks like this: '1-3 6 9-12' into a sorted (N, 2) array of first and last primitive numbers.
+    Overlapping and adjacent ranges are merged.
+    '''
+    ranges = []
+    for part in prim_string.split():
+        if '-' in part:
+            start, end = map(int, part.split('-'))
+        else:
+            start = end = int(part)
+        ranges.append((min(start, end), max(start, end)))
 
-    with open(color_config, 'r') as f:
-        color_dict = json.load(f)
-    return color_dict
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return np.array(merged, dtype=np.int64).reshape(-1, 2)
+
+class LdrawPartProperties:
+    '''
+    part_properties.json indexed by part number, so a cook gets all properties of a part with a single lookup.
+    Every part maps to a dict with the keys of the properties it has:
+    slope: True, softness/roughness: float, graininess: (float, ranges or None), injection_point: list
+    Values are only parsed when a part is looked up, graininess ranges into the arrays of parse_prim_ranges.
+    A malformed entry is skipped with a warning, so it doesn't break the cook of every other part.
+    '''
+    def __init__(self, properties_file):
+        self.path = properties_file
+        self.mtime = os.stat(properties_file).st_mtime_ns
+
+        with open(properties_file) as f:
+            data = json.load(f)
+            ldraw_metrics.count('files_opened')
+            ldraw_metrics.count('bytes_read', os.fstat(f.fileno()).st_size)
+
+        # raw json values per part and property
+        self.entries = dict()
+        for part in data.get('slopes', []):
+            self.entries.setdefault(part, dict())['slope'] = True
+
+        for property in ('softness', 'roughness', 'graininess', 'injection_point'):
+            for part, value in data.get(property, dict()).items():
+                self.entries.setdefault(part, dict())[property] = value
+
+        # parsed properties of the parts that were looked up
+        self.parts = dict()
+
+    def parse(self, part):
+        properties = dict()
+        for property, value in self.entries.get(part, dict()).items():
+            try:
+                if property in ('softness', 'roughness'):
+                    # empty values are treated as if the part had no value
+                    if value:
+                        properties[property] = float(value)
+                elif property == 'graininess':
+                    value, prims = value
+                    properties[property] = (float(value), parse_prim_ranges(prims) if prims != '' else None)
+                else:
+                    properties[property] = value
+            except (TypeError, ValueError) as e:
+                warnings.warn('{0}: skipped {1} of part {2}, {3}'.format(self.path.name, property, part, e))
+        return properties
+
+    def lookup(self, part):
+        '''Returns the properties of a part, an empty dict if it has none.'''
+        properties = self.parts.get(part)
+        if properties is None:
+            properties = self.parse(part)
+            self.parts[part] = properties
+        return properties
+
+# keep the table when this module gets reloaded by the sop modules
+_part_properties = globals().get('_part_properties')
+
+def part_properties():
+    '''Returns the indexed part_properties.json. It is loaded once per session and only reloaded if the file changed on disk.'''
+    global _part_properties
+    properties_file = resources() / 'part_properties.json'
+
+    if _part_properties is None or _part_properties.path != properties_file or _part_properties.mtime != os.stat(properties_file).st_mtime_ns:
+        _part_properties = LdrawPartProperties(properties_file)
+    return _part_properties
 
 # ldraw paths shortcuts
 p = ldraw_lib() / 'parts'
@@ -37,26 +226,306 @@ pr48_u = ldraw_lib() / 'UnOfficial' / 'p' / '48'
 pr8_u = ldraw_lib() / 'UnOfficial' / 'p' / '8'
 pr_l2h = resources() / 'ldraw' / 'p'
 
-def material_group():
-    """Return a list of unique material categories in order of first appearance."""
-    result_list = []
-    # Iterate over the color data
-    for color_info in color_lib().values():
-        category = color_info['category']
+# parts embedded in mpd files, they are kept in the cache with the layout of the library instead of being written into the library
+# every model gets a folder of its own, see mpd_overlay
+mpd_parts = cache_dir() / 'mpd_parts'
+
+# lookup order for referenced files as (directory, highres directory) tuples
+# p/8 and p/48 are covered by p since names like 48\\1-4cyli.dat are indexed relative to it
+search_paths = [
+    (p, None),
+    (ps, None),
+    (pr, pr48),
+    (p_u, None),
+    (ps_u, None),
+    (pr_u, pr48_u),
+    (pr_l2h, None),
+]
+
+# the embedded parts of a model are looked up after the official library and before the unofficial parts
+overlay_position = 3
+
+# the index objects, so a lookup doesn't have to build the key of the session wide index, see ldraw_library.library_index
+_library_index = None
+_overlay_indexes = {}
+
+def library_index(refresh=False):
+    '''
+    Returns the session wide file index of the ldraw library.
+    It's only checked for changes once per session and if refresh is True, e.g. on a model import or a reload of the brickini nodes.
+    '''
+    global _library_index
+    if _library_index is None or refresh:
+        _library_index = ldraw_library.library_index(search_paths, cache_dir() / 'library_index.json', refresh)
+    return _library_index
+
+def mpd_overlay(file):
+    '''
+    Returns the folder the embedded parts of an mpd file are stored in.
+    It's named after the path of the file, so models that embed different parts with the same name don't overwrite each other.
+    '''
+    file = Path(os.path.normcase(os.path.abspath(file)))
+    digest = hashlib.blake2b(str(file).encode('utf-8'), digest_size=8).hexdigest()
+    return mpd_parts / '{0}_{1}'.format(strip_special_characters(file.stem), digest)
+
+def overlay_paths(overlay):
+    '''Returns the search paths of the embedded parts of a model, they have the layout of the library.'''
+    return [(overlay / 'parts', None), (overlay / 'parts' / 's', None), (overlay / 'p', overlay / 'p' / '48')]
+
+def overlay_index(overlay, refresh=False):
+    '''Returns the session wide index that resolves through the library and the embedded parts of a model, see library_index.'''
+    index = _overlay_indexes.get(overlay)
+    if index is None or refresh:
+        index = ldraw_library.overlay_index(library_index(), overlay_paths(overlay), overlay_position, refresh)
+        _overlay_indexes[overlay] = index
+    return index
+
+def set_model_overlay(node, overlay):
+    '''Marks the nodes of a model with the folder of its embedded parts, the part nodes inside of it resolve through it.'''
+    node.setUserData('ldraw_mpd_parts', str(overlay))
+
+def model_overlay(node):
+    '''Returns the embedded parts folder of the model a node belongs to or None, see set_model_overlay.'''
+    while node is not None:
+        overlay = node.userData('ldraw_mpd_parts')
+        if overlay:
+            return Path(overlay)
+        node = node.parent()
+    return None
 
-        # Check if the category is new
-        if category not in result_list:
-            result_list.append(category)
+def brickini_node(node):
+    '''Returns the brickini hda a python sop belongs to or the node itself if it isn't inside of one.'''
+    parent = node
+    while parent is not None:
+        if parent.type().nameComponents()[2].startswith('brickini_'):
+            return parent
+        parent = parent.parent()
+    return node
 
-    return result_list
+def record_dependencies(node, paths):
+    '''Records files a python sop read while cooking, they count as dependencies of the brickini hda it belongs to.'''
+    ldraw_deps.record(brickini_node(node).sessionId(), node.sessionId(), paths)
+
+def dependencies_changed(node):
+    '''
+    Returns True if a file a brickini hda read while cooking changed since then.
+    Nodes without a record count as changed, e.g. nodes of a loaded hip file that didn't cook yet, their files could have changed on disk.
+    '''
+    key = node.sessionId()
+    return not ldraw_deps.recorded(key) or len(ldraw_deps.changed_files(key)) > 0
+
+def forget_dependencies(node):
+    '''Forgets the dependencies of a brickini hda, its next cook records them again.'''
+    ldraw_deps.forget(node.sessionId())
+
+def part_cache():
+    '''Returns the on-disk cache of compiled parts or None if it's disabled by setting LDRAW_PART_CACHE to 0.'''
+    if hou.getenv('LDRAW_PART_CACHE', '1') == '0':
+        return None
+    return ldraw_cache.LdrawPartCache(cache_dir() / 'parts')
+
+def resolve_part(part, highres=0, overlay=None):
+    '''
+    Finds a referenced file in the library index, files that don't exist resolve to box-part-not-found.dat.
+    overlay is the folder of the embedded parts of the model the part belongs to, see mpd_overlay.
+    '''
+    index = library_index() if overlay is None else overlay_index(overlay)
+    part_path = index.resolve(part, highres)
+    if part_path is None:
+        return pr_l2h / 'box-part-not-found.dat'
+    return part_path
+
+def compile_part(part, options, resolve, instance_policy=None, weld=False):
+    '''
+    Returns the compiled mesh, the description and the dependencies of a part, it's loaded from the part cache if it was compiled before.
+    options are the options of the part nodes: (highres, logo, stud, edges, print_handling)
+    welding and the instance policy are only part of the cache key if they're on, so the other entries stay shared with prefetch_parts
+    '''
+    key = tuple(options)
+    if weld:
+        key += ('weld',)
+    if instance_policy is not None:
+        key += ('instance', instance_policy.key())
+
+    cache = part_cache()
+    if cache is not None:
+        with ldraw_metrics.stage('cache'):
+            cached = cache.load(part, key, resolve)
+        ldraw_metrics.count('part_cache_hits' if cached is not None else 'part_cache_misses')
+        if cached is not None:
+            return cached
+
+    highres, logo, stud, edges, print_handling = options
+    compiler = ldraw_compiler.LdrawPartCompiler(resolve, part, highres, logo, stud, edges, instance_policy)
+    mesh = compiler.compile(print_handling)
+    if weld:
+        with ldraw_metrics.stage('weld'):
+            mesh = ldraw_compiler.weld_mesh(mesh)
+    if cache is not None:
+        with ldraw_metrics.stage('cache'):
+            cache.save(part, key, mesh, compiler.description, compiler.dependencies)
+    return mesh, compiler.description, compiler.dependencies
+
+def compact_instancing():
+    '''Returns True if the compact import instances primitives, it's turned on by setting LDRAW_INSTANCE to 1.'''
+    return hou.getenv('LDRAW_INSTANCE', '0') == '1'
+
+def instancing(node):
+    '''
+    Returns 1 if a part node instances primitives, 0 otherwise.
+    The part hda has no step that copies the primitives onto the instance points, so it's only turned on for the part nodes of the compact import.
+    It marks them with the ldraw_instance user data and copies the primitives itself, see LdrawInstanceHelper.
+    '''
+    while node is not None:
+        if node.userData('ldraw_instance') == '1':
+            return 1
+        node = node.parent()
+    return 0
+
+def welding(node):
+    '''
+    Returns 1 if a part node welds its corners, see ldraw_compiler.weld_mesh.
+    The part hda has no weld parm, a weld spare parm on the hda or ldraw_weld user data on it or a parent turns it on or off for that node.
+    Otherwise LDRAW_WELD sets it for all part nodes. Welding takes about 7 times as long as compiling the part.
+    '''
+    weld_parm = brickini_node(node).parm('weld')
+    if weld_parm is not None:
+        return int(weld_parm.eval())
+
+    while node is not None:
+        weld = node.userData('ldraw_weld')
+        if weld in ('0', '1'):
+            return int(weld)
+        node = node.parent()
+    return int(hou.getenv('LDRAW_WELD', '0'))
+
+def instance_policy(part=None):
+    '''
+    Returns the policy of part nodes that instance primitives instead of merging them into the part.
+    Primitives referenced more than LDRAW_INSTANCE_THRESHOLD times (8 by default, 0 disables it) are instanced,
+    the ones listed in LDRAW_INSTANCE_PRIMITIVES always, e.g. "4-4cyli box5 48/4-4edge".
+    Parts with graininess ranges get None, the ranges address primitives by number and instancing would shift them.
+    '''
+    if part is not None:
+        graininess = part_properties().lookup(part).get('graininess')
+        if graininess is not None and graininess[1] is not None:
+            return None
+
+    threshold = int(hou.getenv('LDRAW_INSTANCE_THRESHOLD', '8'))
+    primitives = hou.getenv('LDRAW_INSTANCE_PRIMITIVES', '').replace(',', ' ').split()
+    return ldraw_compiler.LdrawInstancePolicy(threshold, primitives)
+
+def prefetch_parts(parts, options, overlay=None):
+    '''
+    Compiles all given parts that aren't cached yet in worker processes, so the part nodes only have to load them.
+    It's called by the import step, not from a cook, the workers are started by ldraw_prefetch_worker.py.
+    options are the options of the part nodes: (highres, logo, stud, edges, print_handling)
+    overlay is the folder of the embedded parts of the model, see mpd_overlay.
+    '''
+    if part_cache() is None:
+        return []
+    library = (search_paths, cache_dir() / 'library_index.json', overlay_paths(overlay) if overlay is not None else None, overlay_position)
+    with ldraw_metrics.stage('prefetch'):
+        compiled = ldraw_prefetch.prefetch_parts(parts, options, library, pr_l2h / 'box-part-not-found.dat', cache_dir() / 'parts', hou.getenv('HFS'))
+    ldraw_metrics.count('parts_prefetched', len(compiled))
+    return compiled
+
+def begin_metrics(kind, name):
+    '''
+    Starts the metrics report of a cook, returns None if metrics and tracing are disabled.
+    They are opt-in, set LDRAW_METRICS to 1 to collect wall times per stage and counters of every cook.
+    Set LDRAW_TRACE to 1 to write a chrome trace of every cook, with a span for each file a part is read from.
+    '''
+    report = hou.getenv('LDRAW_METRICS', '0') == '1'
+    trace = hou.getenv('LDRAW_TRACE', '0') == '1'
+    if not report and not trace:
+        return None
+    return ldraw_metrics.begin(kind, name, report, trace)
+
+def end_metrics(metrics, geo=None):
+    '''
+    Finishes a metrics report, it's written to detail attributes of geo and appended to the report file.
+    The report file is metrics.jsonl in the cache dir, set LDRAW_METRICS_FILE to write it somewhere else.
+    Traces are written to the traces folder of the cache dir, set LDRAW_TRACE_DIR to write them somewhere else.
+    '''
+    if metrics is None:
+        return
+    ldraw_metrics.end(metrics)
+
+    if metrics.trace is not None:
+        trace_dir = Path(hou.getenv('LDRAW_TRACE_DIR') or cache_dir() / 'traces')
+        trace_name = '{}_{}_{}.json'.format(metrics.kind, strip_special_characters(metrics.name), int(time.time() * 1000))
+        ldraw_metrics.write_trace(metrics, str(trace_dir / trace_name))
+
+    if not metrics.report_enabled:
+        return
+
+    if geo is not None:
+        for name, value in metrics.attributes():
+            if geo.findGlobalAttrib(name) is None:
+                geo.addAttrib(hou.attribType.Global, name, 0.0 if isinstance(value, float) else 0)
+            geo.setGlobalAttribValue(name, value)
+
+    report_file = hou.getenv('LDRAW_METRICS_FILE') or str(cache_dir() / 'metrics.jsonl')
+    ldraw_metrics.write_report(metrics, report_file)
+
+def material_group():
+    """Return a list of unique material categories in order of first appearance."""
+    return color_table().categories
 
 def get_matrix(line):
     '''Returns a houdini matrix from a line of an ldraw file.'''
-    line = line[2:14]
-    l = list(map(float, line))
+    return matrix_from_values(line[2:14])
+
+def matrix_from_values(values):
+    '''Returns a houdini matrix from the 12 values of a type 1 line (x y z a b c d e f g h i).'''
+    l = list(map(float, values))
     m4 = hou.Matrix4(((l[3], l[6], l[9], 0), (l[4], l[7], l[10], 0), (l[5], l[8], l[11], 0), (l[0], l[1], l[2], 1)))
     return m4
 
+# (N, 4, 4) numpy matrices laid out like the ones of matrix_from_values
+matrices_from_values = ldraw_parser.matrices_from_values
+
+# the matrix of xform_to_houdini as a constant, so batches of matrices can be converted without building it for every brick
+houdini_basis = np.diag([0.004, -0.004, -0.004, 1.0])
+houdini_basis_inverted = np.linalg.inv(houdini_basis)
+
+def matrices_to_houdini(m4):
+    '''Converts (N, 4, 4) numpy matrices from the ldraw to the houdini coord sys.'''
+    return houdini_basis_inverted @ m4 @ houdini_basis
+
+def houdini_matrices(values):
+    '''Returns (N, 4, 4) numpy matrices in the houdini coord sys from the (N, 12) values of type 1 lines.'''
+    return matrices_to_houdini(matrices_from_values(values))
+
+def explode_matrices(m4):
+    '''
+    Returns translate, rotate and scale (N, 3) arrays of (N, 4, 4) matrices, like hou.Matrix4.explode() with srt and xyz order.
+    Rotations are in degrees. Mirrored matrices get a negative scale, shear is dropped.
+    '''
+    m4 = np.asarray(m4, dtype=np.float64).reshape(-1, 4, 4)
+    translate = m4[:, 3, :3].copy()
+
+    m3 = m4[:, :3, :3]
+    scale = np.linalg.norm(m3, axis=2)
+    scale[np.linalg.det(m3) < 0] *= -1
+    scale[scale == 0] = 1.0
+    r = m3 / scale[:, :, None]
+
+    # r = rx * ry * rz for row vectors
+    sin_y = np.clip(-r[:, 0, 2], -1.0, 1.0)
+    ry = np.arcsin(sin_y)
+    rx = np.arctan2(r[:, 1, 2], r[:, 2, 2])
+    rz = np.arctan2(r[:, 0, 1], r[:, 0, 0])
+
+    # gimbal lock, the z rotation can be folded into x
+    lock = np.abs(np.cos(ry)) < 1e-9
+    rx[lock] = np.arctan2(r[lock, 1, 0] * sin_y[lock], r[lock, 1, 1])
+    rz[lock] = 0.0
+
+    rotate = np.degrees(np.stack((rx, ry, rz), axis=1))
+    return translate, rotate, scale
+
 def strip_special_characters(input_string):
     return re.sub('[^0-9a-zA-Z_-]+', '', input_string)
 
@@ -67,9 +536,10 @@ def find_value_index(list_of_lists, search_value):
     return 0 # if not found we fallback to solid material group
 
 def get_color_name(color_code):
-    entry = color_lib().get(color_code)
-    if entry:
-        color_name = entry.get('name')
+    table = color_table()
+    code = table.code_index(color_code)
+    if code >= 0:
+        color_name = table.names[table.name_id[code]]
     else:
         color_name = 'Not_Found'
     return color_name
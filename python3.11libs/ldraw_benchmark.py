@@ -0,0 +1,455 @@
+'''
+Houdini independent benchmark suite of the part and model engines.
+It generates a synthetic ldraw library and synthetic ldr/mpd models, times the engines on them and writes the results as json.
+Geometry is created with ldraw_headless, so it runs on any machine with python and numpy:
+
+    python ldraw_benchmark.py --output after.json --baseline before.json
+
+The library has a deep primitive hierarchy with mixed BFC windings, INVERTNEXT and mirrored references, studs with logos and printed parts.
+Models range from 1k to 500k bricks, mpd models nest their submodels a few levels deep.
+Parts are only timed up to the compiled mesh (part_compile), creating it with ldraw_headless would say nothing about hou.
+With a baseline every benchmark that got slower than its threshold counts as a regression and the exit code is 1.
+'''
+import argparse
+import importlib
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# bump this if the layout of the result file changes
+RESULT_VERSION = 1
+
+# relative slowdown that counts as a regression, can be overridden per benchmark with --threshold name=value
+DEFAULT_THRESHOLD = 0.2
+
+# part properties that are assigned in the property benchmark, they cover every property type
+PROPERTY_PARTS = ('3742', '2524', '3040', '3001')
+
+def fmt(*values):
+    return ' '.join('{:g}'.format(v) for v in values)
+
+def circle(segments, radius=1.0, y=0.0):
+    return [(radius * math.cos(2 * math.pi * i / segments), y, radius * math.sin(2 * math.pi * i / segments)) for i in range(segments)]
+
+class LdrawSyntheticLibrary:
+    '''
+    Writes a synthetic ldraw library with the folder layout of the official one.
+    depth: levels of primitives that reference the level below, every level mixes windings
+    parts: number of parts, every fourth part also gets a printed variant
+    '''
+    def __init__(self, root, depth=4, parts=32, seed=0):
+        self.root = Path(root)
+        self.depth = depth
+        self.random = random.Random(seed)
+        self.parts = ['b{:04d}'.format(i) for i in range(parts)]
+        self.printed = [part + 'p01' for part in self.parts[::4]]
+
+    def write(self, rel, text):
+        path = self.root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+
+    def cylinder(self, segments):
+        bottom = circle(segments)
+        top = circle(segments, y=1.0)
+        lines = ['0 Cylinder 1.0', '0 BFC CERTIFY CCW']
+        for i in range(segments):
+            j = (i + 1) % segments
+            lines.append('4 16 ' + fmt(*bottom[i], *top[i], *top[j], *bottom[j]))
+            lines.append('5 24 ' + fmt(*bottom[i], *top[i], *bottom[i - 1], *bottom[j]))
+        return '\n'.join(lines) + '\n'
+
+    def disc(self, segments):
+        ring = circle(segments)
+        lines = ['0 Disc 1.0', '0 BFC CERTIFY CCW']
+        lines.extend('3 16 0 0 0 ' + fmt(*ring[i], *ring[(i + 1) % segments]) for i in range(segments))
+        return '\n'.join(lines) + '\n'
+
+    def edge(self, segments):
+        ring = circle(segments)
+        lines = ['0 Circle 1.0', '0 BFC CERTIFY CCW']
+        lines.extend('2 24 ' + fmt(*ring[i], *ring[(i + 1) % segments]) for i in range(segments))
+        return '\n'.join(lines) + '\n'
+
+    def primitives(self):
+        self.write('p/4-4cyli.dat', self.cylinder(16))
+        self.write('p/4-4disc.dat', self.disc(16))
+        self.write('p/4-4edge.dat', self.edge(16))
+        self.write('p/48/4-4cyli.dat', self.cylinder(48))
+        self.write('p/48/4-4disc.dat', self.disc(48))
+        self.write('p/box5.dat', (
+            '0 Box 5\n0 BFC CERTIFY CCW\n'
+            '4 16 1 1 1 -1 1 1 -1 1 -1 1 1 -1\n'
+            '4 16 1 0 1 1 1 1 1 1 -1 1 0 -1\n'
+            '4 16 -1 0 1 -1 1 1 1 1 1 1 0 1\n'
+            '4 16 -1 0 -1 -1 1 -1 -1 1 1 -1 0 1\n'
+            '4 16 1 0 -1 1 1 -1 -1 1 -1 -1 0 -1\n'
+            '2 24 1 1 1 -1 1 1\n2 24 -1 1 1 -1 1 -1\n'
+        ))
+        self.write('p/logo.dat', '0 Logo\n0 BFC CERTIFY CCW\n' + ''.join('3 16 0 0 0 {} 0 0 0 0 1\n'.format(x) for x in range(1, 9)))
+
+        # every level references the one below a few times, certified CW and CCW files, INVERTNEXT and mirrored matrices alternate
+        self.write('p/deep0.dat', '0 Deep 0\n0 BFC CERTIFY CCW\n1 16 0 0 0 1 0 0 0 1 0 0 0 1 box5.dat\n1 16 0 0 0 1 0 0 0 1 0 0 0 1 4-4cyli.dat\n')
+        for level in range(1, self.depth + 1):
+            winding = 'CW' if level % 2 else 'CCW'
+            lines = ['0 Deep {}'.format(level), '0 BFC CERTIFY {}'.format(winding)]
+            lines.append('1 16 0 0 0 1 0 0 0 1 0 0 0 1 deep{}.dat'.format(level - 1))
+            lines.append('0 BFC INVERTNEXT')
+            lines.append('1 16 2 0 0 0.5 0 0 0 0.5 0 0 0 0.5 deep{}.dat'.format(level - 1))
+            lines.append('1 16 -2 0 0 -1 0 0 0 1 0 0 0 1 deep{}.dat'.format(level - 1))
+            lines.append('0 BFC CW' if winding == 'CCW' else '0 BFC CCW')
+            lines.append('3 16 0 0 0 1 0 0 0 0 1')
+            self.write('p/deep{}.dat'.format(level), '\n'.join(lines) + '\n')
+
+    def studs(self):
+        self.write('p/stud.dat', (
+            '0 Stud\n0 BFC CERTIFY CCW\n'
+            '1 16 0 -4 0 6 0 0 0 1 0 0 0 6 4-4edge.dat\n'
+            '1 16 0 0 0 6 0 0 0 1 0 0 0 6 4-4edge.dat\n'
+            '0 BFC INVERTNEXT\n'
+            '1 16 0 -4 0 6 0 0 0 4 0 0 0 6 4-4cyli.dat\n'
+            '1 16 0 -4 0 6 0 0 0 1 0 0 0 6 4-4disc.dat\n'
+            '0 // 1 16 0 -4 0 1 0 0 0 1 0 0 0 1 logo.dat\n'
+        ))
+        self.write('p/stud2.dat', '0 Stud Open\n0 BFC CERTIFY CCW\n1 16 0 -4 0 6 0 0 0 4 0 0 0 6 4-4cyli.dat\n0 BFC INVERTNEXT\n1 16 0 -4 0 4 0 0 0 4 0 0 0 4 4-4cyli.dat\n')
+        self.write('p/stud4.dat', '0 Stud Tube\n0 BFC CERTIFY CCW\n1 16 0 0 0 8 0 0 0 -4 0 0 0 8 4-4cyli.dat\n0 BFC INVERTNEXT\n1 16 0 0 0 6 0 0 0 -4 0 0 0 6 4-4cyli.dat\n')
+
+    def part(self, part):
+        '''a brick of random size with a subpart, studs, tubes and a deep primitive'''
+        width = self.random.randint(1, 4)
+        length = self.random.randint(1, 8)
+        sx = width * 10
+        sz = length * 10
+
+        lines = ['0 ~Brick {} Body'.format(part), '0 BFC CERTIFY CW']
+        lines.append('1 16 0 24 0 {} 0 0 0 -24 0 0 0 {} box5.dat'.format(-sx, sz))
+        lines.append('0 BFC INVERTNEXT')
+        lines.append('1 16 0 24 0 {} 0 0 0 -20 0 0 0 {} box5.dat'.format(sx - 4, sz - 4))
+        lines.append('1 16 0 12 0 1 0 0 0 1 0 0 0 1 deep{}.dat'.format(self.depth))
+        lines.extend('1 16 {} 4 {} 1 0 0 0 1 0 0 0 1 stud4.dat'.format(x, z) for x in range(-sx + 20, sx, 20) for z in range(-sz + 20, sz, 20))
+        self.write('parts/s/{}s01.dat'.format(part), '\n'.join(lines) + '\n')
+
+        lines = ['0 Brick {} x {}'.format(width, length), '0 Name: {}.dat'.format(part), '0 BFC CERTIFY CCW']
+        lines.append('1 16 0 0 0 1 0 0 0 1 0 0 0 1 s\\{}s01.dat'.format(part))
+        lines.extend('1 16 {} 0 {} 1 0 0 0 1 0 0 0 1 stud.dat'.format(x, z) for x in range(-sx + 10, sx, 20) for z in range(-sz + 10, sz, 20))
+        lines.append('1 16 0 0 0 1 0 0 0 1 0 0 0 1 stud2.dat')
+        lines.append('2 24 {0} 0 {1} -{0} 0 {1}'.format(sx, sz))
+        return lines
+
+    def __call__(self):
+        '''writes the library and returns its root'''
+        self.primitives()
+        self.studs()
+        for part in self.parts:
+            lines = self.part(part)
+            self.write('parts/{}.dat'.format(part), '\n'.join(lines) + '\n')
+
+            printed = part + 'p01'
+            if printed in self.printed:
+                lines[0] = '0 Brick {} with Print'.format(part)
+                lines.append('4 4 10 20 -20 -10 20 -20 -10 10 -20 10 10 -20')
+                lines.append('3 15 0 0 -20 1 0 -20 0 1 -20')
+                self.write('parts/{}.dat'.format(printed), '\n'.join(lines) + '\n')
+        return self.root
+
+def random_reference(rnd, parts, colors, spread):
+    '''a type 1 line of a random part, color, position and one of the 4 upright rotations'''
+    rotation = rnd.choice(('1 0 0 0 1 0 0 0 1', '0 0 1 0 1 0 -1 0 0', '-1 0 0 0 1 0 0 0 -1', '0 0 -1 0 1 0 1 0 0'))
+    x = rnd.randrange(-spread, spread) * 20
+    y = rnd.randrange(0, 32) * -24
+    z = rnd.randrange(-spread, spread) * 20
+    return '1 {} {} {} {} {} {}.dat'.format(rnd.choice(colors), x, y, z, rotation, rnd.choice(parts))
+
+def write_ldr(path, parts, bricks, seed=0):
+    '''writes an ldr model with the given number of bricks'''
+    rnd = random.Random(seed)
+    colors = ('1', '4', '14', '15', '16', '71', '72', '0x2FF8800')
+    spread = max(int(math.sqrt(bricks)), 1)
+    with open(path, 'w') as f:
+        f.write('0 Synthetic model {}\n0 Name: {}\n'.format(bricks, Path(path).name))
+        for _ in range(bricks):
+            f.write(random_reference(rnd, parts, colors, spread) + '\n')
+    return path
+
+def write_mpd(path, parts, bricks, depth=3, fanout=4, seed=0):
+    '''
+    writes an mpd model with about the given number of bricks as a tree of submodels
+    every submodel references fanout submodels of the next level until depth is reached, the last level holds the bricks.
+    every submodel is also referenced a second time by the main model, so half of the bricks come from reused submodels.
+    submodels inherit color 16 and there's an embedded part as well.
+    '''
+    rnd = random.Random(seed)
+    colors = ('1', '4', '14', '15', '16', '16', '71', '72')
+    leaves = fanout ** depth
+    leaf_bricks = max(int(math.ceil(bricks / (2 * leaves))), 1)
+    spread = max(int(math.sqrt(leaf_bricks)), 1)
+
+    def name(level, index):
+        return 'main.ldr' if level == 0 else 'sub_{}_{}.ldr'.format(level, index)
+
+    with open(path, 'w') as f:
+        for level in range(depth + 1):
+            for index in range(fanout ** level):
+                f.write('0 FILE {0}\n0 Level {1}\n0 Name: {0}\n'.format(name(level, index), level))
+                if level < depth:
+                    for child in range(index * fanout, (index + 1) * fanout):
+                        f.write('1 16 {} 0 {} 1 0 0 0 1 0 0 0 1 {}\n'.format(child * spread * 40, -level * 24, name(level + 1, child)))
+                    if level == 0:
+                        for child in range(fanout):
+                            f.write('1 4 {} -480 0 -1 0 0 0 1 0 0 0 -1 {}\n'.format(child * spread * 40, name(1, child)))
+                else:
+                    for _ in range(leaf_bricks):
+                        f.write(random_reference(rnd, parts + ['embedded'], colors, spread) + '\n')
+                f.write('0 NOFILE\n')
+
+        f.write('0 FILE embedded.dat\n0 Embedded part\n0 Name: embedded.dat\n0 !LDRAW_ORG Unofficial_Part\n0 BFC CERTIFY CCW\n')
+        f.write('1 16 0 0 0 1 0 0 0 1 0 0 0 1 box5.dat\n1 16 0 0 0 1 0 0 0 1 0 0 0 1 stud.dat\n0 NOFILE\n')
+    return path
+
+def timed(function, repeat):
+    '''returns the best wall time of repeated calls and the result of the last one'''
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+class LdrawBenchmark:
+    '''
+    Runs the benchmarks on a synthetic library and models in work_dir.
+    The environment of the ldraw modules is set up before they get imported, they read it on import.
+    '''
+    def __init__(self, work_dir, sizes, depth=4, parts=32, repeat=3, seed=0):
+        self.work_dir = Path(work_dir)
+        self.sizes = sizes
+        self.repeat = repeat
+        self.library = LdrawSyntheticLibrary(self.work_dir / 'ldraw', depth, parts, seed)
+        self.seed = seed
+        self.results = {}
+
+    def setup(self):
+        self.library()
+        os.environ['LDRAW_LIB'] = str(self.library.root)
+        os.environ['LDRAW2HOUDINI'] = str(Path(__file__).resolve().parent.parent)
+        os.environ['LDRAW_CACHE_DIR'] = str(self.work_dir / 'cache')
+        os.environ['LDRAW_PART_CACHE'] = '0'
+        os.environ['LDRAW_PREFETCH_WORKERS'] = '0'
+        os.environ.setdefault('LDRAW_HEADLESS', '1')
+
+        self.ldraw_headless = importlib.import_module('ldraw_headless')
+        self.ldraw = importlib.import_module('ldraw')
+        self.ldraw_compiler = importlib.import_module('ldraw_compiler')
+        self.ldraw_part = importlib.import_module('ldraw_part')
+        self.ldraw_part_properties = importlib.import_module('ldraw_part_properties')
+        self.ldraw_model = importlib.import_module('ldraw_model')
+
+    def add(self, name, seconds, items):
+        self.results[name] = {
+            'seconds': seconds,
+            'items': items,
+            'per_second': items / seconds if seconds > 0 else None,
+        }
+        print('{:<40} {:>10.4f} s {:>12.0f} /s'.format(name, seconds, self.results[name]['per_second'] or 0))
+
+    def part_node(self, part, **parms):
+        options = dict(parm_part=part, parm_highres=0, parm_logo=1, parm_stud=1, parm_pack=0, parm_print=0, parm_edges=1, parm_material_group=0, parm_material=4)
+        options.update(parms)
+        return self.ldraw_part.ldrawPart(self.ldraw_headless.Node(part), options)
+
+    def bench_path_resolve(self):
+        part = self.part_node(self.library.parts[0])
+        names = [p + '.dat' for p in self.library.parts + self.library.printed]
+        names += ['s\\{}s01.dat'.format(p) for p in self.library.parts]
+        names += ['stud.dat', 'stud2.dat', 'stud4.dat', '4-4cyli.dat', '4-4disc.dat', 'box5.dat', 'missing.dat']
+        names += ['deep{}.dat'.format(level) for level in range(self.library.depth + 1)]
+        names = names * max(1, 20000 // len(names))
+
+        seconds, _ = timed(lambda: [part.path_resolve(name) for name in names], self.repeat)
+        self.add('path_resolve', seconds, len(names))
+
+    def bench_read_part(self):
+        subpart_cache = self.ldraw_compiler.subpart_cache
+
+        def compile_parts(print_handling):
+            prims = 0
+            for part in self.library.parts + self.library.printed:
+                resolve = self.part_node(part).path_resolve
+                compiler = self.ldraw_compiler.LdrawPartCompiler(resolve, part)
+                prims += len(compiler.compile(print_handling))
+            return prims
+
+        def cold():
+            subpart_cache.clear()
+            return compile_parts(0)
+
+        parts = len(self.library.parts) + len(self.library.printed)
+        seconds, _ = timed(cold, self.repeat)
+        self.add('read_part.cold', seconds, parts)
+
+        seconds, _ = timed(lambda: compile_parts(0), self.repeat)
+        self.add('read_part.warm', seconds, parts)
+
+        seconds, _ = timed(lambda: compile_parts(1), self.repeat)
+        self.add('read_part.print_separate', seconds, parts)
+
+    def bench_part_compile(self):
+        '''
+        the compile step of a part node cook, with welding and the instance policy it applies
+        geometry creation isn't timed, the lists of ldraw_headless say nothing about the speed of hou
+        '''
+        resolve = self.part_node(self.library.parts[0]).path_resolve
+        options = (0, 1, 1, 1, 0)
+
+        def compile_parts(weld=False, instance=False):
+            for part in self.library.parts:
+                instance_policy = self.ldraw.instance_policy(part) if instance else None
+                self.ldraw.compile_part(part, options, resolve, instance_policy, weld)
+
+        seconds, _ = timed(compile_parts, self.repeat)
+        self.add('part_compile', seconds, len(self.library.parts))
+
+        seconds, _ = timed(lambda: compile_parts(weld=True), self.repeat)
+        self.add('part_compile.weld', seconds, len(self.library.parts))
+
+        seconds, _ = timed(lambda: compile_parts(instance=True), self.repeat)
+        self.add('part_compile.instance', seconds, len(self.library.parts))
+
+    def bench_properties(self):
+        part = self.part_node(self.library.parts[0])
+        part()
+        geometry = part.geo
+
+        def assign():
+            for base_part in PROPERTY_PARTS:
+                node = self.ldraw_headless.Node('properties')
+                node.geometry().merge(geometry)
+                self.ldraw_part_properties.ldrawPartProperties(node, {'parm_part': base_part})()
+
+        seconds, _ = timed(assign, self.repeat)
+        self.add('part_properties', seconds, len(PROPERTY_PARTS))
+
+    def bench_models(self):
+        models_dir = self.work_dir / 'models'
+        models_dir.mkdir(parents=True, exist_ok=True)
+        parts = self.library.parts + self.library.printed
+
+        for bricks in self.sizes:
+            ldr = write_ldr(models_dir / 'model_{}.ldr'.format(bricks), parts, bricks, self.seed)
+            mpd = write_mpd(models_dir / 'model_{}.mpd'.format(bricks), parts, bricks, seed=self.seed)
+
+            def find_subfiles():
+                model = self.ldraw_model.ldrawModelDynamic(mpd, self.ldraw_headless.Node('loader'))
+                with model.mpd_helper.find_subfiles() as subfiles:
+                    # the subfiles are read lazily, so they are read once to include the decoding
+                    return sum(1 for key in subfiles for _ in subfiles[key])
+
+            seconds, lines = timed(find_subfiles, self.repeat)
+            self.add('find_subfiles.{}'.format(bricks), seconds, lines)
+
+            def build_points(file):
+                model = self.ldraw_model.ldrawModelDynamic(file, self.ldraw_headless.Node('loader'))
+                model.build_model_points()
+                return len(model.geo.points())
+
+            seconds, points = timed(lambda: build_points(ldr), self.repeat)
+            self.add('build_model_points.ldr.{}'.format(bricks), seconds, points)
+
+            seconds, points = timed(lambda: build_points(mpd), self.repeat)
+            self.add('build_model_points.mpd.{}'.format(bricks), seconds, points)
+
+    def __call__(self):
+        self.setup()
+        self.bench_path_resolve()
+        self.bench_read_part()
+        self.bench_part_compile()
+        self.bench_properties()
+        self.bench_models()
+        return self.results
+
+def compare(results, baseline, thresholds):
+    '''
+    compares results to the ones of a baseline run, returns a dict of benchmark names and their comparison
+    a benchmark regressed if it takes longer than its baseline time plus the threshold, thresholds are relative
+    '''
+    comparison = {}
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if base is None or not base['seconds']:
+            continue
+        threshold = thresholds.get(name, thresholds.get('default', DEFAULT_THRESHOLD))
+        ratio = result['seconds'] / base['seconds']
+        comparison[name] = {
+            'baseline_seconds': base['seconds'],
+            'ratio': ratio,
+            'threshold': threshold,
+            'regressed': ratio > 1.0 + threshold,
+        }
+    return comparison
+
+def parse_thresholds(values):
+    '''parses name=value pairs, a value without a name sets the default threshold'''
+    thresholds = {'default': DEFAULT_THRESHOLD}
+    for value in values:
+        name, _, threshold = value.rpartition('=')
+        thresholds[name or 'default'] = float(threshold)
+    return thresholds
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the ldraw engines on a synthetic library and models.')
+    parser.add_argument('-o', '--output', type=str, default='ldraw_benchmark.json', help='json file the results are written to')
+    parser.add_argument('-b', '--baseline', type=str, help='json file of a previous run to compare against')
+    parser.add_argument('-t', '--threshold', action='append', default=[], help='relative slowdown that counts as a regression, e.g. 0.2 or read_part.cold=0.1')
+    parser.add_argument('-s', '--sizes', type=str, default='1000,10000,100000', help='comma separated brick counts of the models, up to 500000')
+    parser.add_argument('-d', '--depth', type=int, default=4, help='levels of the primitive hierarchy')
+    parser.add_argument('-p', '--parts', type=int, default=32, help='number of parts in the library')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per benchmark, the best one counts')
+    parser.add_argument('-w', '--work-dir', type=str, help='directory for the library and models, a temporary one by default')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    thresholds = parse_thresholds(args.threshold)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        benchmark = LdrawBenchmark(args.work_dir or temp_dir, sizes, args.depth, args.parts, args.repeat, args.seed)
+        results = benchmark()
+
+    numpy = sys.modules.get('numpy')
+    report = {
+        'version': RESULT_VERSION,
+        'time': time.time(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__ if numpy else None,
+        'backend': 'headless' if os.environ.get('LDRAW_HEADLESS') == '1' else 'hou',
+        'settings': {'sizes': sizes, 'depth': args.depth, 'parts': args.parts, 'repeat': args.repeat, 'seed': args.seed},
+        'thresholds': thresholds,
+        'results': results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report['comparison'] = compare(results, baseline, thresholds)
+        regressions = [name for name, entry in report['comparison'].items() if entry['regressed']]
+        for name in regressions:
+            entry = report['comparison'][name]
+            print('regression: {} is {:.0%} slower than the baseline'.format(name, entry['ratio'] - 1.0))
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+'''
+Houdini independent on-disk cache of compiled parts.
+Every part is stored as an uncompressed npz file with the arrays of its LdrawMesh and a manifest of all files it was built from.
+An entry is only used if every file still resolves to the same path and has the same content.
+'''
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+import numpy as np
+import ldraw_compiler
+
+# bump this if the layout of the cache files or the output of the compiler changes
+CACHE_VERSION = 6
+
+# content digests of the files seen this session, keyed by path: (mtime, size, digest)
+_digests = {}
+
+def file_digest(path):
+    '''
+    returns the blake2b digest of a file or None if it doesn't exist
+    files are only rehashed if their mtime or size changed since the last call
+    '''
+    path = str(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    cached = _digests.get(path)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        h.update(f.read())
+    digest = h.hexdigest()
+
+    _digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+class LdrawPartCache:
+    '''
+    Compiled parts stored in cache_dir.
+    options is a tuple of all node options the compiled part depends on, e.g. (highres, logo, stud, edges, print_handling).
+    resolve is the same callable that was handed to the compiler, it's used to check if a file would resolve differently now.
+    '''
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+
+    def entry_path(self, part, options):
+        key = json.dumps([part] + list(options))
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+        name = re.sub(r'[^\w.-]', '_', part)
+        return self.cache_dir / '{}_{}.npz'.format(name, digest)
+
+    def valid_manifest(self, data, part, options, resolve):
+        '''returns the manifest of an opened entry or None if it's outdated'''
+        manifest = json.loads(str(data['manifest']))
+        if manifest['version'] != CACHE_VERSION or manifest['part'] != part or manifest['options'] != list(options):
+            return None
+
+        for name, dependency, digest in manifest['dependencies']:
+            if str(resolve(name)) != dependency or file_digest(dependency) != digest:
+                return None
+        return manifest
+
+    def contains(self, part, options, resolve):
+        '''checks if there is a valid entry without loading its arrays'''
+        path = self.entry_path(part, options)
+        if not path.exists():
+            return False
+
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                return self.valid_manifest(data, part, options, resolve) is not None
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def load(self, part, options, resolve):
+        '''returns (mesh, description, dependencies) or None if there is no valid entry, dependencies like they were handed to save'''
+        path = self.entry_path(part, options)
+        if not path.exists():
+            return None
+
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                manifest = self.valid_manifest(data, part, options, resolve)
+                if manifest is None:
+                    return None
+
+                instances = None
+                if 'instance_part' in data.files:
+                    instances = ldraw_compiler.LdrawInstances(
+                        data['instance_part'],
+                        data['instance_matrix'],
+                        data['instance_color'],
+                        data['instance_info'],
+                        data['instance_flip'],
+                    )
+
+                mesh = ldraw_compiler.LdrawMesh(
+                    data['points'],
+                    data['vertices'],
+                    data['prim_sizes'],
+                    data['prim_color'],
+                    data['prim_info'],
+                    data['prim_closed'],
+                    data['prim_flip'],
+                    instances,
+                )
+        except (OSError, ValueError, KeyError):
+            return None
+
+        dependencies = {name: Path(dependency) for name, dependency, _ in manifest['dependencies']}
+        return mesh, manifest['description'], dependencies
+
+    def save(self, part, options, mesh, description, dependencies):
+        '''
+        writes a compiled part, dependencies is a dict of referenced names and the paths they resolved to
+        skipped if the cache dir isn't writable
+        '''
+        manifest = {
+            'version': CACHE_VERSION,
+            'part': part,
+            'options': list(options),
+            'description': description,
+            'dependencies': [(name, str(path), file_digest(path)) for name, path in dependencies.items()],
+        }
+
+        # instances are only stored by parts that have them, so entries without stay readable
+        instances = dict()
+        if mesh.instances is not None:
+            instances = dict(
+                instance_part=mesh.instances.part,
+                instance_matrix=mesh.instances.matrix,
+                instance_color=mesh.instances.color,
+                instance_info=mesh.instances.info,
+                instance_flip=mesh.instances.flip,
+            )
+
+        path = self.entry_path(part, options)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # write to a temp file first so other sessions never read a half written entry
+            temp_file = path.with_name('{}.{}.tmp'.format(path.name, os.getpid()))
+            with open(temp_file, 'wb') as f:
+                np.savez(
+                    f,
+                    manifest=np.array(json.dumps(manifest)),
+                    points=mesh.points,
+                    vertices=mesh.vertices,
+                    prim_sizes=mesh.prim_sizes,
+                    prim_color=mesh.prim_color,
+                    prim_info=mesh.prim_info,
+                    prim_closed=mesh.prim_closed,
+                    prim_flip=mesh.prim_flip,
+                    **instances,
+                )
+            os.replace(temp_file, path)
+        except OSError:
+            pass
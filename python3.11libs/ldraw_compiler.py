@@ -0,0 +1,793 @@
+'''
+Houdini independent part compiler.
+Flattens the subpart hierarchy of a part into flat numpy arrays, so the sop only has to create the geometry in one go.
+'''
+import os
+import re
+from collections import Counter, OrderedDict
+import numpy as np
+import ldraw_parser
+import ldraw_metrics
+
+# values of the info attribute, meshes store the index per primitive
+INFO = ('', 'base', 'print', 'stud', 'stud-instance', 'stud2-instance', 'logo')
+
+# grid in ldraw units corners are snapped to when welding, ldraw files rarely have more than 3 decimals
+WELD_TOLERANCE = 1e-3
+
+class LdrawMesh:
+    '''
+    Flattened part geometry in ldraw units.
+
+    points: (P, 3) float64 positions
+    vertices: (V,) int64 point number of every vertex
+    prim_sizes: (N,) int64 number of vertices per primitive
+    prim_color: (N,) int64 color code, 16 as long as it isn't resolved by a parent
+    prim_info: (N,) uint8 index into INFO
+    prim_closed: (N,) bool, False for ldraw lines
+    prim_flip: (N,) bool, True if the winding follows the winding the file is read with, False for BFC CW/CCW faces and lines
+    instances: LdrawInstances of the primitives that are placed instead of merged or None, see LdrawInstancePolicy
+    '''
+    def __init__(self, points, vertices, prim_sizes, prim_color, prim_info, prim_closed, prim_flip, instances=None):
+        self.points = points
+        self.vertices = vertices
+        self.prim_sizes = prim_sizes
+        self.prim_color = prim_color
+        self.prim_info = prim_info
+        self.prim_closed = prim_closed
+        self.prim_flip = prim_flip
+        self.instances = instances
+
+    def __len__(self):
+        return len(self.prim_sizes)
+
+    def nbytes(self):
+        arrays = (self.points, self.vertices, self.prim_sizes, self.prim_color, self.prim_info, self.prim_closed, self.prim_flip)
+        size = sum(a.nbytes for a in arrays)
+        if self.instances is not None:
+            size += self.instances.nbytes()
+        return size
+
+    def prim_offsets(self):
+        '''returns the index of the first vertex of every primitive'''
+        offsets = np.zeros(len(self.prim_sizes), dtype=np.int64)
+        if len(self.prim_sizes):
+            offsets[1:] = np.cumsum(self.prim_sizes[:-1])
+        return offsets
+
+    def polygons(self):
+        '''returns the point numbers of every primitive as a list of tuples'''
+        vertices = self.vertices.tolist()
+        polygons = []
+        start = 0
+        for size in self.prim_sizes.tolist():
+            polygons.append(tuple(vertices[start:start + size]))
+            start += size
+        return polygons
+
+class LdrawInstances:
+    '''
+    Primitives of a part that are placed like type 1 lines instead of being merged into its mesh.
+    Their prototype is compiled once per session like a subpart, see LdrawPartCompiler.read_prototype.
+
+    part: (N,) str referenced file name of the prototype
+    matrix: (N, 12) float64 type 1 line values that place the prototype in the part
+    color: (N,) int64 color code, 16 as long as it isn't resolved by a parent
+    info: (N,) uint8 index into INFO, the prototype is compiled with it
+    flip: (N,) bool, True if the flipped prototype has to be used, like for CW references
+    '''
+    def __init__(self, part, matrix, color, info, flip):
+        self.part = part
+        self.matrix = matrix
+        self.color = color
+        self.info = info
+        self.flip = flip
+
+    def __len__(self):
+        return len(self.part)
+
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.part, self.matrix, self.color, self.info, self.flip))
+
+    def select(self, keep):
+        return LdrawInstances(self.part[keep], self.matrix[keep], self.color[keep], self.info[keep], self.flip[keep])
+
+    def place(self, values, color):
+        '''returns the instances transformed by the 12 values of a type 1 line, instances with color 16 get its color'''
+        rotation = values[3:12].reshape(3, 3)
+        matrix = np.empty_like(self.matrix)
+        matrix[:, 0:3] = self.matrix[:, 0:3] @ rotation.T + values[0:3]
+        matrix[:, 3:12] = (rotation @ ref_rotations(self.matrix)).reshape(-1, 9)
+        return LdrawInstances(self.part, matrix, np.where(self.color == 16, color, self.color), self.info, self.flip)
+
+def merge_instances(instances):
+    '''concatenates LdrawInstances, None entries are skipped and None is returned if there are none'''
+    instances = [i for i in instances if i is not None]
+    if not instances:
+        return None
+    if len(instances) == 1:
+        return instances[0]
+
+    return LdrawInstances(
+        np.concatenate([i.part for i in instances]),
+        np.concatenate([i.matrix for i in instances]),
+        np.concatenate([i.color for i in instances]),
+        np.concatenate([i.info for i in instances]),
+        np.concatenate([i.flip for i in instances]),
+    )
+
+class LdrawInstancePolicy:
+    '''
+    Decides which primitives of a part stay instances, primitives are files from the p folders of the library.
+    A primitive is instanced if it's referenced more than threshold times in the part or if it's in primitives.
+    A threshold of 0 only instances the listed primitives.
+    Flipped references are always merged, instances get copied like the part nodes build their primitive, which has no flipped version.
+    '''
+    def __init__(self, threshold=0, primitives=()):
+        self.threshold = threshold
+        self.primitives = frozenset(primitive_name(p) for p in primitives)
+
+    def key(self):
+        '''returns the policy as a json serializable list, e.g. for the key of the part cache'''
+        return [self.threshold, sorted(self.primitives)]
+
+    def instanced(self, part, count):
+        return part in self.primitives or (self.threshold > 0 and count > self.threshold)
+
+def primitive_name(part):
+    '''returns a primitive like it's referenced in type 1 lines, e.g. 4-4cyli.dat for 4-4CYLI'''
+    part = part.strip().lower().replace('/', '\\')
+    return part if part.endswith('.dat') else part + '.dat'
+
+def is_primitive(path):
+    '''checks if a resolved file is in a p folder of a library, including p/48 and p/8'''
+    parent = path.parent
+    return parent.name.lower() == 'p' or (parent.name in ('48', '8') and parent.parent.name.lower() == 'p')
+
+def empty_mesh():
+    return LdrawMesh(
+        np.zeros((0, 3), dtype=np.float64),
+        np.zeros(0, dtype=np.int64),
+        np.zeros(0, dtype=np.int64),
+        np.zeros(0, dtype=np.int64),
+        np.zeros(0, dtype=np.uint8),
+        np.zeros(0, dtype=bool),
+        np.zeros(0, dtype=bool),
+    )
+
+def merge_meshes(meshes):
+    '''concatenates meshes in order, point numbers are offset accordingly'''
+    meshes = [m for m in meshes if len(m) or m.instances is not None]
+    if not meshes:
+        return empty_mesh()
+    if len(meshes) == 1:
+        return meshes[0]
+
+    vertices = []
+    offset = 0
+    for m in meshes:
+        vertices.append(m.vertices + offset)
+        offset += len(m.points)
+
+    return LdrawMesh(
+        np.concatenate([m.points for m in meshes]),
+        np.concatenate(vertices),
+        np.concatenate([m.prim_sizes for m in meshes]),
+        np.concatenate([m.prim_color for m in meshes]),
+        np.concatenate([m.prim_info for m in meshes]),
+        np.concatenate([m.prim_closed for m in meshes]),
+        np.concatenate([m.prim_flip for m in meshes]),
+        merge_instances([m.instances for m in meshes]),
+    )
+
+def reverse_order(sizes, reverse):
+    '''
+    returns the vertex order that reverses the corners of the primitives in the reverse mask
+    the first corner stays, (0, 1, 2, 3) becomes (0, 3, 2, 1)
+    '''
+    offsets = np.zeros(len(sizes), dtype=np.int64)
+    if len(sizes):
+        offsets[1:] = np.cumsum(sizes[:-1])
+    starts = np.repeat(offsets, sizes)
+    corner = np.arange(len(starts)) - starts
+    flip = np.repeat(reverse, sizes) & (corner > 0)
+    return starts + np.where(flip, np.repeat(sizes, sizes) - corner, corner)
+
+def flip_mesh(mesh):
+    '''
+    returns the mesh as if it was read with the opposite winding
+    only the vertex order and the flip of instances change, all other arrays are shared with the original mesh
+    '''
+    instances = mesh.instances
+    if instances is not None:
+        instances = LdrawInstances(instances.part, instances.matrix, instances.color, instances.info, ~instances.flip)
+    elif not mesh.prim_flip.any():
+        return mesh
+
+    order = reverse_order(mesh.prim_sizes, mesh.prim_flip)
+    return LdrawMesh(mesh.points, mesh.vertices[order], mesh.prim_sizes, mesh.prim_color, mesh.prim_info, mesh.prim_closed, mesh.prim_flip, instances)
+
+def weld_mesh(mesh, tolerance=WELD_TOLERANCE):
+    '''
+    returns the mesh with all corners at the same position sharing one point, compiled meshes have a point per corner
+    positions are quantised to a grid of tolerance ldraw units and hashed with np.unique,
+    points keep the order they are first used in and all primitive arrays are shared with the original mesh
+    '''
+    if len(mesh.points) == 0:
+        return mesh
+
+    cells = np.round(mesh.points / tolerance).astype(np.int64)
+    _, first, inverse = np.unique(cells, axis=0, return_index=True, return_inverse=True)
+
+    # number the welded points in the order of their first corner
+    order = np.argsort(first)
+    number = np.empty_like(order)
+    number[order] = np.arange(len(order))
+
+    points = mesh.points[first[order]]
+    vertices = number[inverse.ravel()][mesh.vertices]
+    return LdrawMesh(points, vertices, mesh.prim_sizes, mesh.prim_color, mesh.prim_info, mesh.prim_closed, mesh.prim_flip, mesh.instances)
+
+def select_prims(mesh, keep):
+    '''returns a mesh of the primitives in the keep mask, points no kept primitive uses are removed'''
+    if keep.all():
+        return mesh
+
+    vertices = mesh.vertices[np.repeat(keep, mesh.prim_sizes)]
+    used = np.zeros(len(mesh.points), dtype=bool)
+    used[vertices] = True
+    number = np.cumsum(used) - 1
+
+    return LdrawMesh(
+        mesh.points[used],
+        number[vertices],
+        mesh.prim_sizes[keep],
+        mesh.prim_color[keep],
+        mesh.prim_info[keep],
+        mesh.prim_closed[keep],
+        mesh.prim_flip[keep],
+        mesh.instances,
+    )
+
+def unique_lines(mesh, tolerance=WELD_TOLERANCE):
+    '''
+    returns the primitive numbers of all lines that don't have the same two end points as an earlier line, in either direction
+    subparts often repeat the edges of their parent, e.g. the outline of a stud on top of a brick
+    end points are quantised like in weld_mesh and every line is hashed with its lower end point first
+    '''
+    lines = np.flatnonzero(~mesh.prim_closed)
+    if len(lines) < 2:
+        return lines
+
+    start = mesh.prim_offsets()[lines]
+    a = np.round(mesh.points[mesh.vertices[start]] / tolerance).astype(np.int64)
+    b = np.round(mesh.points[mesh.vertices[start + 1]] / tolerance).astype(np.int64)
+
+    # put the lexicographically lower end point first, so both directions hash the same
+    difference = b - a
+    first = np.argmax(difference != 0, axis=1)
+    swap = difference[np.arange(len(lines)), first] < 0
+    segments = np.where(swap[:, None], np.hstack((b, a)), np.hstack((a, b)))
+
+    # hash every segment as one 48 byte value, much faster than np.unique with axis=0
+    _, unique = np.unique(np.ascontiguousarray(segments).view(np.dtype((np.void, segments.itemsize * 6))), return_index=True)
+    ldraw_metrics.count('lines_deduped', len(lines) - len(unique))
+    return lines[np.sort(unique)]
+
+def dedupe_lines(mesh, tolerance=WELD_TOLERANCE):
+    '''
+    returns the mesh without the lines unique_lines leaves out
+    this renumbers every primitive after the first removed line, the part sop keeps all lines and only groups the unique ones,
+    part_properties.json addresses faces by primitive number
+    '''
+    keep = mesh.prim_closed.copy()
+    keep[unique_lines(mesh, tolerance)] = True
+    if keep.all():
+        return mesh
+    return select_prims(mesh, keep)
+
+def ref_rotations(values):
+    '''returns the (N, 3, 3) rotation/scale part of (N, 12) type 1 line values'''
+    return values[:, 3:12].reshape(-1, 3, 3)
+
+def transform_points(points, values):
+    '''
+    transforms points by a batch of (N, 12) type 1 line values at once
+    returns (N, P, 3)
+    '''
+    rotations = ref_rotations(values)
+    return np.einsum('pj,nij->npi', points, rotations) + values[:, None, 0:3]
+
+def place_mesh(subpart, values, colors, infos):
+    '''
+    returns a copy of subpart for every row of (N, 12) type 1 line values, the points are transformed in one go
+    primitives and instances with color 16 get the color of their reference, primitives without info also its info
+    '''
+    points = transform_points(subpart.points, values)
+    inherit = subpart.prim_color == 16
+    unset_info = inherit & (subpart.prim_info == 0)
+
+    meshes = []
+    for j in range(len(values)):
+        prim_color = subpart.prim_color
+        prim_info = subpart.prim_info
+        if inherit.any():
+            prim_color = np.where(inherit, colors[j], prim_color)
+            prim_info = np.where(unset_info, INFO.index(infos[j]), prim_info).astype(np.uint8)
+
+        instances = subpart.instances
+        if instances is not None:
+            instances = instances.place(values[j], colors[j])
+
+        meshes.append(LdrawMesh(points[j], subpart.vertices, subpart.prim_sizes, prim_color, prim_info, subpart.prim_closed, subpart.prim_flip, instances))
+    return meshes
+
+class LdrawSubpartCache:
+    '''
+    Session wide cache of compiled subparts, shared by the cooks of all brickini_ldraw_part nodes.
+    Entries are (mesh, dependencies, mtimes) tuples, dependencies are the files the subpart was built from,
+    mtimes their modification times when it was built, so a hit can be checked against edited files below it.
+    It is limited to a byte budget and evicts the least recently used subparts first.
+    Use stats() to inspect it from the python shell.
+    '''
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, mesh, dependencies, mtimes):
+        size = mesh.nbytes()
+        if size > self.max_bytes:
+            return
+
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[0].nbytes()
+
+        self.entries[key] = (mesh, dependencies, mtimes)
+        self.bytes += size
+        self.evict()
+
+    def evict(self):
+        while self.bytes > self.max_bytes and self.entries:
+            _, (mesh, _, _) = self.entries.popitem(last=False)
+            self.bytes -= mesh.nbytes()
+            self.evictions += 1
+
+    def set_budget(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.evict()
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+# budget in MB can be set with the LDRAW_SUBPART_CACHE_MB environment variable
+subpart_cache = LdrawSubpartCache(int(os.environ.get('LDRAW_SUBPART_CACHE_MB', 512)) * 1024 * 1024)
+
+class LdrawPartCompiler:
+    '''
+    Reads a part and all of its subparts and returns the flattened LdrawMesh.
+    resolve is a callable that returns the path of a referenced file.
+    '''
+    def __init__(self, resolve, part, highres=0, logo=1, stud=1, edges=1, instance_policy=None):
+        self.resolve = resolve
+        self.part = part
+        self.parm_highres = highres
+        self.parm_logo = logo
+        self.parm_stud = stud
+        self.parm_edges = edges
+        self.instance_policy = instance_policy
+
+        self.description = None
+        self.subpart_cache = {}
+        # flipped copies of CW instances per cook, so all of them share one mesh
+        self.flipped_cache = {}
+        # every referenced name and the path it resolved to, needed to validate the disk cache
+        self.dependencies = {}
+        # compiled prototypes of instanced primitives by (name, info)
+        self.prototypes = {}
+        # modification times of the files this compile looked at, every file is only checked once
+        self.mtimes = {}
+
+    def resolve_part(self, part):
+        '''resolves a referenced file and records it as a dependency of the compiled part'''
+        with ldraw_metrics.stage('resolve'):
+            part_path = self.resolve(part)
+        self.dependencies[part] = part_path
+        # taken before the file is read, so an edit while compiling makes the cached subpart stale
+        self.file_mtime(part_path)
+        return part_path
+
+    def determine_winding(self, winding_group, det, invert_next):
+        '''
+        this function determines winding order
+        invert winding again if orientation matrix is reversed (negative determinant)
+        cancel out inversion if INVERTNEXT statement is found before subpart reference
+        '''
+        if det < 0:
+            winding_group = ldraw_parser.flip_winding(winding_group)
+
+        if invert_next == True:
+            winding_group = ldraw_parser.flip_winding(winding_group)
+        return winding_group
+
+    def create_polys(self, ldraw_file, winding, color_group, info):
+        '''creates a mesh from all tris and quads of a file, corners are put into the correct winding order'''
+        sizes = ldraw_file.face_sizes.astype(np.int64)
+        colors = ldraw_file.face_color
+        keep = np.ones(len(sizes), dtype=bool)
+
+        # make sure in separate mode that studs are processed correctly
+        if info == 'print' and color_group == 16:
+            keep = colors != 16
+
+        bfc = ldraw_file.face_bfc
+        if winding == 'CCW':
+            reverse = (bfc == ldraw_parser.BFC_INHERIT) | (bfc == ldraw_parser.BFC_CCW)
+        else:
+            reverse = (bfc == ldraw_parser.BFC_INVERT) | (bfc == ldraw_parser.BFC_CCW)
+
+        points = ldraw_file.face_points[np.repeat(keep, sizes)]
+        sizes = sizes[keep]
+        reverse = reverse[keep]
+
+        # reverse point order according to winding
+        order = reverse_order(sizes, reverse)
+        relative = (bfc == ldraw_parser.BFC_INHERIT) | (bfc == ldraw_parser.BFC_INVERT)
+
+        return LdrawMesh(
+            points[order],
+            np.arange(len(points), dtype=np.int64),
+            sizes,
+            colors[keep],
+            np.full(len(sizes), INFO.index(info), dtype=np.uint8),
+            np.ones(len(sizes), dtype=bool),
+            relative[keep],
+        )
+
+    def create_lines(self, ldraw_file):
+        '''creates a mesh of open 2 point polygons from all lines of a file'''
+        count = len(ldraw_file.line_color)
+        return LdrawMesh(
+            ldraw_file.line_points,
+            np.arange(count * 2, dtype=np.int64),
+            np.full(count, 2, dtype=np.int64),
+            np.zeros(count, dtype=np.int64),
+            np.zeros(count, dtype=np.uint8),
+            np.zeros(count, dtype=bool),
+            np.zeros(count, dtype=bool),
+        )
+
+    def read_references(self, ldraw_file, winding, color_group, info, stud_processing):
+        '''
+        resolves all type 1 lines of a file and returns a list of (subpart mesh, line index, color, info) tuples
+        and a list of (name, line index, color, info, flip) tuples of the primitives that are instanced
+        subparts are stored in a dict and then reused for all remaining instances
+        only the CCW version of a subpart gets compiled, CW instances use a flipped copy of it
+        '''
+        references = []
+        instances = []
+        invert_next = False
+        info_group = info
+        dets = np.linalg.det(ref_rotations(ldraw_file.ref_matrix))
+
+        for i in range(len(ldraw_file.ref_name)):
+            flags = ldraw_file.ref_flags[i]
+
+            # subpart that we'll find in the line after this one needs to be inversed
+            if flags & ldraw_parser.REF_INVERTNEXT:
+                invert_next = True
+
+            # deactivated logo line, only used if the logo option is on
+            if flags & ldraw_parser.REF_DISABLED and self.parm_logo != 1:
+                continue
+
+            part = ldraw_file.names[ldraw_file.ref_name[i]]
+
+            # if separate mode we don't process studs from base part, but only from the printed one
+            if stud_processing == 0 and 'stu' in part:
+                continue
+
+            # load special stud-instance which is just a helper prim to be able to instance the actual stud geo in the hda network
+            if self.parm_stud:
+                if part == 'stud.dat':
+                    part = 'stud-instance.dat'
+                    info_group = 'stud-instance'
+                elif part == 'stud2.dat':
+                    part = 'stud-instance.dat'
+                    info_group = 'stud2-instance'
+                elif 'stu' in part:
+                    info_group = 'stud'
+                else:
+                    info_group = info
+
+            if 'logo' in part:
+                info_group = 'logo'
+
+            # we only process edges if checked.
+            # It's needed for beveling and consistent primitive count
+            if not self.parm_edges:
+                if 'edge' in part:
+                    continue
+
+            ref_color = int(ldraw_file.ref_color[i])
+            color_code = ref_color
+            # to allow group colors penetrating through sub files
+            if color_code == 16:
+                color_code = color_group
+
+            winding_group = self.determine_winding(winding, dets[i], invert_next)
+            invert_next = False
+
+            # stud-instance.dat is instanced by the hda already, print subparts depend on the order they are referenced in
+            if self.instance_policy is not None and info_group != 'print' and part != 'stud-instance.dat' and is_primitive(self.resolve_part(part)):
+                instances.append((part, i, ref_color, info_group, winding_group == 'CW'))
+                continue
+
+            # the key holds everything the compiled subpart depends on, the group color only matters for prints
+            part_name = (part, info_group, info_group == 'print' and color_code == 16, stud_processing)
+
+            # check if subpart was already built
+            if part_name in self.subpart_cache:
+                subpart = self.subpart_cache[part_name]
+                # make sure in separate mode that studs are processed correctly
+                if info_group == 'print' and color_code == 16 and (subpart.prim_color == 16).any():
+                    continue
+            else:
+                subpart = self.read_subpart(self.resolve_part(part), color_code, info_group, stud_processing)
+                #store subpart
+                if len(subpart) > 0:
+                    self.subpart_cache[part_name] = subpart
+
+            if winding_group == 'CW':
+                flipped = self.flipped_cache.get(part_name)
+                if flipped is None or flipped[0] is not subpart:
+                    flipped = (subpart, flip_mesh(subpart))
+                    self.flipped_cache[part_name] = flipped
+                subpart = flipped[1]
+
+            references.append((subpart, i, ref_color, info_group))
+
+        return references, instances
+
+    def create_instances(self, ldraw_file, instances):
+        '''creates a mesh without primitives that only holds the instances read_references found'''
+        part, lines, color, info, flip = zip(*instances)
+        mesh = empty_mesh()
+        mesh.instances = LdrawInstances(
+            np.array([primitive_name(p) for p in part]),
+            ldraw_file.ref_matrix[list(lines)],
+            np.array(color, dtype=np.int64),
+            np.array([INFO.index(i) for i in info], dtype=np.uint8),
+            np.array(flip, dtype=bool),
+        )
+        return mesh
+
+    def place_references(self, ldraw_file, references):
+        '''
+        sets the correct attributes based on parent parts/subparts and transforms all references
+        every subpart is transformed once for all of its instances
+        '''
+        meshes = [None] * len(references)
+
+        instances = {}
+        for n, reference in enumerate(references):
+            instances.setdefault(id(reference[0]), []).append(n)
+
+        for ref_list in instances.values():
+            subpart = references[ref_list[0]][0]
+            values = ldraw_file.ref_matrix[[references[n][1] for n in ref_list]]
+            colors = [references[n][2] for n in ref_list]
+            infos = [references[n][3] for n in ref_list]
+
+            for n, mesh in zip(ref_list, place_mesh(subpart, values, colors, infos)):
+                meshes[n] = mesh
+
+        return meshes
+
+    def read_prototype(self, part, info):
+        '''returns the CCW mesh of an instanced primitive, compiled like a subpart, primitives it references are instances again'''
+        key = (part, info)
+        if key not in self.prototypes:
+            self.prototypes[key] = self.read_subpart(self.resolve_part(part), 16, info, 1)
+        return self.prototypes[key]
+
+    def nested_counts(self, part, info):
+        '''returns how often every primitive is referenced by the prototype of a primitive and the prototypes below it'''
+        counts = Counter()
+        instances = self.read_prototype(part, info).instances
+        if instances is not None:
+            for nested, nested_info in zip(instances.part.tolist(), instances.info.tolist()):
+                counts[nested] += 1
+                counts.update(self.nested_counts(nested, INFO[nested_info]))
+        return counts
+
+    def expand_instances(self, instances):
+        '''returns the meshes of instances as if they were merged into the part, in groups of the same prototype'''
+        meshes = []
+        groups = {}
+        for n, key in enumerate(zip(instances.part.tolist(), instances.info.tolist(), instances.flip.tolist())):
+            groups.setdefault(key, []).append(n)
+
+        for (part, info, flip), ref_list in groups.items():
+            prototype = self.read_prototype(part, INFO[info])
+            if flip:
+                prototype = flip_mesh(prototype)
+            meshes.extend(place_mesh(prototype, instances.matrix[ref_list], instances.color[ref_list], [INFO[info]] * len(ref_list)))
+        return meshes
+
+    def apply_instance_policy(self, mesh):
+        '''
+        merges all instances into the mesh that the instance policy doesn't keep
+        primitives are counted through all levels, e.g. the cylinders of every stud4.dat,
+        expanding an instance brings up the primitives of its prototype, they are checked in the next round
+        '''
+        counts = Counter()
+        for part, info in zip(mesh.instances.part.tolist(), mesh.instances.info.tolist()):
+            counts[part] += 1
+            counts.update(self.nested_counts(part, INFO[info]))
+
+        kept = []
+        while mesh.instances is not None:
+            instances = mesh.instances
+            keep = np.array([self.instance_policy.instanced(part, counts[part]) for part in instances.part.tolist()], dtype=bool) & ~instances.flip
+            kept.append(instances.select(keep))
+
+            meshes = [LdrawMesh(mesh.points, mesh.vertices, mesh.prim_sizes, mesh.prim_color, mesh.prim_info, mesh.prim_closed, mesh.prim_flip)]
+            meshes.extend(self.expand_instances(instances.select(~keep)))
+            mesh = merge_meshes(meshes)
+
+        mesh.instances = merge_instances([instances for instances in kept if len(instances)])
+        if mesh.instances is not None:
+            ldraw_metrics.count('instances', len(mesh.instances))
+        return mesh
+
+    def file_mtime(self, path):
+        '''returns the modification time of a file or None if it doesn't exist'''
+        key = str(path)
+        if key not in self.mtimes:
+            try:
+                self.mtimes[key] = os.stat(path).st_mtime_ns
+            except (OSError, TypeError):
+                self.mtimes[key] = None
+        return self.mtimes[key]
+
+    def read_subpart(self, part, color_code, info, stud_processing):
+        '''
+        reads the CCW version of a subpart through the session wide subpart cache
+        print subparts are only cached per cook since which of them are skipped depends on the order they are referenced in
+        '''
+        if info == 'print':
+            return self.read_part(part, 'CCW', color_code, info, stud_processing)
+
+        mtime = self.file_mtime(part)
+        if mtime is None:
+            return empty_mesh()
+
+        key = (str(part), info, stud_processing, self.parm_edges, self.parm_stud, self.parm_logo, self.parm_highres, self.instance_policy is not None, mtime)
+        entry = subpart_cache.get(key)
+        # the key only has the mtime of the subpart itself, files it references could have been edited since
+        if entry is not None and any(self.file_mtime(path) != stamp for path, stamp in entry[2].items()):
+            ldraw_metrics.count('subpart_cache_stale')
+            entry = None
+        if entry is not None:
+            ldraw_metrics.count('subpart_cache_hits')
+            subpart, dependencies, _ = entry
+            with ldraw_metrics.span(part.name, winding='CCW', info=info, cache='hit') as span:
+                if span is not None:
+                    span['prims'] = len(subpart)
+            self.dependencies.update(dependencies)
+            return subpart
+
+        ldraw_metrics.count('subpart_cache_misses')
+
+        # collect the dependencies of this subpart on their own so they can be stored with it
+        outer_dependencies = self.dependencies
+        self.dependencies = {}
+        subpart = self.read_part(part, 'CCW', color_code, info, stud_processing, 'miss')
+        dependencies = self.dependencies
+        self.dependencies = outer_dependencies
+        self.dependencies.update(dependencies)
+
+        mtimes = {str(path): self.file_mtime(path) for path in dependencies.values() if path is not None}
+        subpart_cache.put(key, subpart, dependencies, mtimes)
+        return subpart
+
+    def read_part(self, part, winding, color_code, info, stud_processing, cache='off'):
+        '''
+        recursive function that reads the part and returns its tris, quads and lines
+        together with all subparts inside the part as one mesh
+        cache is only a label of the trace span, if the subpart cache was missed or not used
+        '''
+        if not part.exists():
+            return empty_mesh()
+
+        with ldraw_metrics.span(part.name, winding=winding, info=info, cache=cache) as span:
+            mesh = self.read_part_file(part, winding, color_code, info, stud_processing)
+            if span is not None:
+                span['prims'] = len(mesh)
+        return mesh
+
+    def read_part_file(self, part, winding, color_code, info, stud_processing):
+        ldraw_file = ldraw_parser.parse_file(part)
+
+        # write description from first line if it matches the part number
+        if self.part == part.stem:
+            self.description = ldraw_file.title.replace(' ', '_').strip()
+
+        polys = self.create_polys(ldraw_file, winding, color_code, info)
+        references, instances = self.read_references(ldraw_file, winding, color_code, info, stud_processing)
+        meshes = [polys] + self.place_references(ldraw_file, references)
+        if instances:
+            meshes.append(self.create_instances(ldraw_file, instances))
+
+        # lines
+        if self.parm_edges and info == 'base':
+            meshes.append(self.create_lines(ldraw_file))
+
+        return merge_meshes(meshes)
+
+    def compile(self, print_handling=0):
+        '''
+        print handling
+        load brick as set in parm parameter by default
+        load base brick if mode is set to separate and only keep print geo from actual brick
+        load base brick if mode is set to texture and we create uvs in the hda
+        '''
+        meshes = []
+        base_part = self.part
+        print_str = re.search('[pP].*', self.part)
+        composite_str = re.search('[cC].*', self.part)
+        stud_processing = 1
+
+        if print_str != None:
+            print_str = print_str.group()
+            base_part = self.part.replace(print_str, '')
+            base_part = re.sub(r'\d+-', '', base_part) # remove model string from unofficial mpd part files
+
+        # if part is a composite we won't apply separation since base composite part might not exist
+        if print_handling > 0 and print_str != None and composite_str == None:
+            if print_handling == 1:
+                part_path = self.resolve_part(self.part + '.dat')
+                meshes.append(self.read_part(part_path, 'CCW', 16, 'print', 1))
+                stud_processing = 0
+                # clear subpart cache so printed areas don't conflict with non printed ones
+                self.subpart_cache.clear()
+                self.flipped_cache.clear()
+
+            self.part = base_part
+
+        part_path = self.resolve_part(self.part + '.dat')
+        meshes.append(self.read_part(part_path, 'CCW', 16, 'base', stud_processing))
+
+        mesh = merge_meshes(meshes)
+        if mesh.instances is not None:
+            mesh = self.apply_instance_policy(mesh)
+        return mesh
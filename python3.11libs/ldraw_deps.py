@@ -0,0 +1,42 @@
+'''
+Houdini independent record of the files every cooked node read.
+Nodes are identified by a key of the caller, e.g. the session id of the brickini hda a python sop belongs to.
+A node can have several sources, like the python sops inside of it, and a source can cook several times, like a part node in a for each loop.
+All files they read are collected until the node gets reloaded and its record is forgotten.
+'''
+import os
+
+# node key: {source key: {path: (mtime, size) or None}}
+_records = {}
+
+def file_stat(path):
+    '''returns (mtime, size) of a file or directory or None if it doesn't exist'''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def record(key, source, paths):
+    '''adds files to the record of a node, they are stat'ed right away'''
+    files = _records.setdefault(key, {}).setdefault(source, {})
+    for path in paths:
+        path = str(path)
+        files[path] = file_stat(path)
+
+def recorded(key):
+    '''checks if a node has a record, nodes that didn't cook since they were loaded or forgotten have none'''
+    return key in _records
+
+def changed_files(key):
+    '''returns all files of a node that changed since they were recorded'''
+    changed = []
+    for files in _records.get(key, {}).values():
+        for path, stat in files.items():
+            if file_stat(path) != stat and path not in changed:
+                changed.append(path)
+    return changed
+
+def forget(key):
+    '''drops the record of a node, its next cook records it again'''
+    _records.pop(key, None)
@@ -0,0 +1,912 @@
+# pyright: reportMissingImports=false
+'''
+Houdini independent stand-in for the parts of hou the part and model engines use.
+ldraw, ldraw_part, ldraw_part_properties and ldraw_model get hou through backend(), which returns this module if hou can't be imported,
+so ldrawPart, ldrawPartProperties and ldrawModelDynamic run on machines without a houdini licence, e.g. to benchmark them on a build machine.
+Set LDRAW_HEADLESS to 1 to use it even if hou is available, e.g. in worker processes started with the python that ships with houdini.
+
+Geometry is stored in plain python lists, points are row vectors like in houdini.
+Only polygons and edge groups exist, there are no node cooks, parm expressions or ui.
+Nodes can be created and wired, so the network updates of the static model import can be checked.
+
+    import ldraw_headless
+    node = ldraw_headless.Node('part')
+    ldraw_part.ldrawPart(node, parms)()
+    node.geometry().primFloatAttribValues('Cd')
+'''
+import copy as _copy
+import itertools
+import math
+import numbers
+import os
+import sys
+import numpy as np
+
+def backend():
+    '''returns the hou module or this module if hou isn't available or LDRAW_HEADLESS is set to 1'''
+    if os.environ.get('LDRAW_HEADLESS', '0') != '1':
+        try:
+            import hou
+            return hou
+        except ImportError:
+            pass
+    return sys.modules[__name__]
+
+class OperationFailed(Exception):
+    pass
+
+class EnumValue:
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+    def __repr__(self):
+        return self._name
+
+class attribType:
+    Point = EnumValue('attribType.Point')
+    Prim = EnumValue('attribType.Prim')
+    Vertex = EnumValue('attribType.Vertex')
+    Global = EnumValue('attribType.Global')
+
+class attribData:
+    Float = EnumValue('attribData.Float')
+    Int = EnumValue('attribData.Int')
+    String = EnumValue('attribData.String')
+
+def getenv(name, default=None):
+    return os.environ.get(name, default)
+
+def expandString(text):
+    return os.path.expandvars(text)
+
+class Vector3:
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        if not isinstance(x, numbers.Real):
+            x, y, z = x
+        self._v = (float(x), float(y), float(z))
+
+    def __getitem__(self, index):
+        return self._v[index]
+
+    def __len__(self):
+        return 3
+
+    def __iter__(self):
+        return iter(self._v)
+
+    def __eq__(self, other):
+        return isinstance(other, Vector3) and self._v == other._v
+
+    def __hash__(self):
+        return hash(self._v)
+
+    def __add__(self, other):
+        return Vector3(*(a + b for a, b in zip(self._v, other)))
+
+    def __sub__(self, other):
+        return Vector3(*(a - b for a, b in zip(self._v, other)))
+
+    def __mul__(self, other):
+        if isinstance(other, Matrix4):
+            return Vector3(*(np.append(self._v, 1.0) @ other._m)[:3])
+        return Vector3(*(a * other for a in self._v))
+
+    def __repr__(self):
+        return '<hou.Vector3 [{}, {}, {}]>'.format(*self._v)
+
+    def x(self):
+        return self._v[0]
+
+    def y(self):
+        return self._v[1]
+
+    def z(self):
+        return self._v[2]
+
+    def length(self):
+        return math.sqrt(self.dot(self))
+
+    def dot(self, other):
+        return sum(a * b for a, b in zip(self._v, other))
+
+    def normalized(self):
+        length = self.length()
+        return self * (1.0 / length) if length else Vector3()
+
+class Matrix4:
+    '''4x4 matrix for row vectors, it's built from a scalar (diagonal), 16 values or 4 rows of 4 values'''
+    def __init__(self, values=0.0):
+        if isinstance(values, numbers.Real):
+            self._m = np.eye(4) * float(values)
+        elif isinstance(values, Matrix4):
+            self._m = values._m.copy()
+        else:
+            self._m = np.array(values, dtype=np.float64).reshape(4, 4)
+
+    def __mul__(self, other):
+        if isinstance(other, Matrix4):
+            return Matrix4(self._m @ other._m)
+        return Matrix4(self._m * other)
+
+    def __eq__(self, other):
+        return isinstance(other, Matrix4) and np.array_equal(self._m, other._m)
+
+    def __repr__(self):
+        return '<hou.Matrix4 {}>'.format(self.asTupleOfTuples())
+
+    def at(self, row, col):
+        return float(self._m[row, col])
+
+    def setAt(self, row, col, value):
+        self._m[row, col] = value
+
+    def asTuple(self):
+        return tuple(self._m.ravel().tolist())
+
+    def asTupleOfTuples(self):
+        return tuple(tuple(row) for row in self._m.tolist())
+
+    def determinant(self):
+        return float(np.linalg.det(self._m))
+
+    def inverted(self):
+        return Matrix4(np.linalg.inv(self._m))
+
+    def transposed(self):
+        return Matrix4(self._m.T)
+
+    def extractTranslates(self):
+        return Vector3(*self._m[3, :3])
+
+def rotation_matrix(axis, degrees):
+    '''rotation around x, y or z for row vectors'''
+    c = math.cos(math.radians(degrees))
+    s = math.sin(math.radians(degrees))
+    m = np.eye(4)
+    i, j = {'x': (1, 2), 'y': (2, 0), 'z': (0, 1)}[axis]
+    m[i, i] = c
+    m[i, j] = s
+    m[j, i] = -s
+    m[j, j] = c
+    return m
+
+class hmath:
+    @staticmethod
+    def identityTransform():
+        return Matrix4(1.0)
+
+    @staticmethod
+    def buildTranslate(x, y=None, z=None):
+        if y is None:
+            x, y, z = x
+        m = np.eye(4)
+        m[3, :3] = (x, y, z)
+        return Matrix4(m)
+
+    @staticmethod
+    def buildScale(x, y=None, z=None):
+        if y is None:
+            x, y, z = x
+        return Matrix4(np.diag((x, y, z, 1.0)))
+
+    @staticmethod
+    def buildRotate(x, y=None, z=None, order='xyz'):
+        if y is None:
+            x, y, z = x
+        angles = {'x': x, 'y': y, 'z': z}
+        m = np.eye(4)
+        for axis in order:
+            m = m @ rotation_matrix(axis, angles[axis])
+        return Matrix4(m)
+
+    @staticmethod
+    def buildTransform(values_dict, transform_order='srt', rotate_order='xyz'):
+        '''supports translate, rotate and scale, the matrices are combined in transform_order like in houdini'''
+        parts = {
+            't': hmath.buildTranslate(values_dict.get('translate', (0.0, 0.0, 0.0))),
+            'r': hmath.buildRotate(values_dict.get('rotate', (0.0, 0.0, 0.0)), order=rotate_order),
+            's': hmath.buildScale(values_dict.get('scale', (1.0, 1.0, 1.0))),
+        }
+        m = Matrix4(1.0)
+        for step in transform_order:
+            m = m * parts[step]
+        return m
+
+def data_type(value):
+    '''returns the attribData and tuple size of an attribute default'''
+    if isinstance(value, str):
+        return attribData.String, 1
+    if isinstance(value, numbers.Integral):
+        return attribData.Int, 1
+    if isinstance(value, numbers.Real):
+        return attribData.Float, 1
+
+    values = tuple(value)
+    data, _ = data_type(values[0])
+    if data is attribData.Int and any(isinstance(v, float) for v in values):
+        data = attribData.Float
+    return data, len(values)
+
+class Attrib:
+    '''an attribute with one value per element, values of tuple attributes are tuples'''
+    def __init__(self, geometry, attrib_type, name, default, data, size, is_array=False):
+        self._geometry = geometry
+        self._type = attrib_type
+        self._name = name
+        self._default = default
+        self._data = data
+        self._size = size
+        self._is_array = is_array
+        self.values = []
+
+    def name(self):
+        return self._name
+
+    def type(self):
+        return self._type
+
+    def dataType(self):
+        return self._data
+
+    def size(self):
+        return self._size
+
+    def isArrayType(self):
+        return self._is_array
+
+    def defaultValue(self):
+        return self._default
+
+    def cast(self, value):
+        '''converts a value to the data type of the attribute, tuples stay tuples'''
+        if self._is_array:
+            return tuple(value)
+        if self._size > 1:
+            return tuple(self.cast_single(v) for v in value)
+        return self.cast_single(value)
+
+    def cast_single(self, value):
+        if self._data is attribData.Float:
+            return float(value)
+        if self._data is attribData.Int:
+            return int(value)
+        return str(value)
+
+class Point:
+    def __init__(self, geometry, index):
+        self._geometry = geometry
+        self._index = index
+
+    def __eq__(self, other):
+        return isinstance(other, Point) and other._geometry is self._geometry and other._index == self._index
+
+    def __hash__(self):
+        return hash((id(self._geometry), self._index))
+
+    def geometry(self):
+        return self._geometry
+
+    def number(self):
+        return self._index
+
+    def position(self):
+        return Vector3(*self._geometry.attrib_values(attribType.Point, 'P')[self._index])
+
+    def setPosition(self, position):
+        self.setAttribValue('P', tuple(position))
+
+    def attribValue(self, name):
+        return self._geometry.attrib_values(attribType.Point, name)[self._index]
+
+    def setAttribValue(self, name, value):
+        self._geometry.set_element_value(attribType.Point, name, self._index, value)
+
+class Vertex:
+    def __init__(self, prim, index):
+        self._prim = prim
+        self._index = index
+
+    def prim(self):
+        return self._prim
+
+    def number(self):
+        '''index of the vertex in its primitive'''
+        return self._index
+
+    def linearNumber(self):
+        return self._prim.vertex_start() + self._index
+
+    def point(self):
+        return Point(self._prim.geometry(), self._prim.point_numbers()[self._index])
+
+    def attribValue(self, name):
+        return self._prim.geometry().attrib_values(attribType.Vertex, name)[self.linearNumber()]
+
+    def setAttribValue(self, name, value):
+        self._prim.geometry().set_element_value(attribType.Vertex, name, self.linearNumber(), value)
+
+class Polygon:
+    def __init__(self, geometry, index):
+        self._geometry = geometry
+        self._index = index
+
+    def __eq__(self, other):
+        return isinstance(other, Polygon) and other._geometry is self._geometry and other._index == self._index
+
+    def __hash__(self):
+        return hash((id(self._geometry), self._index))
+
+    def geometry(self):
+        return self._geometry
+
+    def number(self):
+        return self._index
+
+    def point_numbers(self):
+        return self._geometry._prim_points[self._index]
+
+    def vertex_start(self):
+        return self._geometry.vertex_offsets()[self._index]
+
+    def numVertices(self):
+        return len(self.point_numbers())
+
+    def vertices(self):
+        return tuple(Vertex(self, i) for i in range(self.numVertices()))
+
+    def points(self):
+        return tuple(Point(self._geometry, i) for i in self.point_numbers())
+
+    def isClosed(self):
+        return self._geometry._prim_closed[self._index]
+
+    def setIsClosed(self, closed):
+        self._geometry._prim_closed[self._index] = bool(closed)
+
+    def addVertex(self, point):
+        '''adds a vertex, this is only supported on the last primitive of the geometry'''
+        if self._index != len(self._geometry._prim_points) - 1:
+            raise OperationFailed('Vertices can only be added to the last primitive')
+
+        self._geometry._prim_points[self._index].append(point_number(point))
+        self._geometry._vertex_offsets = None
+        for attrib in self._geometry._attribs[attribType.Vertex].values():
+            attrib.values.append(attrib.defaultValue())
+        return Vertex(self, self.numVertices() - 1)
+
+    def attribValue(self, name):
+        return self._geometry.attrib_values(attribType.Prim, name)[self._index]
+
+    def setAttribValue(self, name, value):
+        self._geometry.set_element_value(attribType.Prim, name, self._index, value)
+
+class Edge:
+    '''an edge between two points, like in hou edges have no direction'''
+    def __init__(self, geometry, point_numbers):
+        self._geometry = geometry
+        self._points = tuple(point_numbers)
+
+    def __eq__(self, other):
+        return isinstance(other, Edge) and other._geometry is self._geometry and sorted(other._points) == sorted(self._points)
+
+    def __hash__(self):
+        return hash((id(self._geometry), tuple(sorted(self._points))))
+
+    def geometry(self):
+        return self._geometry
+
+    def points(self):
+        return tuple(Point(self._geometry, i) for i in self._points)
+
+class EdgeGroup:
+    def __init__(self, geometry, name):
+        self._geometry = geometry
+        self._name = name
+        self._edges = {}
+
+    def name(self):
+        return self._name
+
+    def geometry(self):
+        return self._geometry
+
+    def edges(self):
+        return tuple(self._edges.values())
+
+    def contains(self, edge):
+        return edge in self._edges
+
+    def add(self, edges):
+        if isinstance(edges, EdgeGroup):
+            edges = edges.edges()
+        elif isinstance(edges, Edge):
+            edges = (edges,)
+        for edge in edges:
+            self._edges.setdefault(edge, Edge(self._geometry, edge._points))
+
+def point_number(point):
+    return point if isinstance(point, int) else point.number()
+
+class Geometry:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._prim_points = []
+        self._prim_closed = []
+        self._vertex_offsets = None
+        self._globals = {}
+        self._attribs = {attribType.Point: {}, attribType.Prim: {}, attribType.Vertex: {}, attribType.Global: {}}
+        self._element_count = {attribType.Point: 0, attribType.Prim: 0}
+        self._edge_groups = {}
+        self.addAttrib(attribType.Point, 'P', (0.0, 0.0, 0.0))
+
+    def element_count(self, attrib_type):
+        if attrib_type is attribType.Vertex:
+            return sum(len(points) for points in self._prim_points)
+        if attrib_type is attribType.Global:
+            return 1
+        return self._element_count[attrib_type]
+
+    def vertex_offsets(self):
+        if self._vertex_offsets is None:
+            self._vertex_offsets = [0] + list(itertools.accumulate(len(points) for points in self._prim_points))
+        return self._vertex_offsets
+
+    # attributes
+
+    def addAttrib(self, attrib_type, name, default_value, transform_as_normal=False, create_local_variable=True):
+        if name in self._attribs[attrib_type]:
+            raise OperationFailed('Attribute {} already exists'.format(name))
+
+        data, size = data_type(default_value)
+        default = tuple(default_value) if size > 1 else default_value
+        attrib = Attrib(self, attrib_type, name, default, data, size)
+        attrib.values = [attrib.cast(default)] * self.element_count(attrib_type)
+        self._attribs[attrib_type][name] = attrib
+        return attrib
+
+    def addArrayAttrib(self, attrib_type, name, data_type, tuple_size=1):
+        if name in self._attribs[attrib_type]:
+            raise OperationFailed('Attribute {} already exists'.format(name))
+
+        attrib = Attrib(self, attrib_type, name, (), data_type, tuple_size, is_array=True)
+        attrib.values = [()] * self.element_count(attrib_type)
+        self._attribs[attrib_type][name] = attrib
+        return attrib
+
+    def find_attrib(self, attrib_type, name):
+        return self._attribs[attrib_type].get(name)
+
+    def findPointAttrib(self, name):
+        return self.find_attrib(attribType.Point, name)
+
+    def findPrimAttrib(self, name):
+        return self.find_attrib(attribType.Prim, name)
+
+    def findVertexAttrib(self, name):
+        return self.find_attrib(attribType.Vertex, name)
+
+    def findGlobalAttrib(self, name):
+        return self.find_attrib(attribType.Global, name)
+
+    def pointAttribs(self):
+        return tuple(self._attribs[attribType.Point].values())
+
+    def primAttribs(self):
+        return tuple(self._attribs[attribType.Prim].values())
+
+    def vertexAttribs(self):
+        return tuple(self._attribs[attribType.Vertex].values())
+
+    def globalAttribs(self):
+        return tuple(self._attribs[attribType.Global].values())
+
+    def attrib(self, attrib_type, name):
+        attrib = self.find_attrib(attrib_type, name)
+        if attrib is None:
+            raise OperationFailed('Attribute {} does not exist'.format(name))
+        return attrib
+
+    def attrib_values(self, attrib_type, name):
+        return self.attrib(attrib_type, name).values
+
+    def set_element_value(self, attrib_type, name, index, value):
+        attrib = self.attrib(attrib_type, name)
+        attrib.values[index] = attrib.cast(value)
+
+    def attribValue(self, name):
+        return self.attrib_values(attribType.Global, name)[0]
+
+    def setGlobalAttribValue(self, name, value):
+        self.set_element_value(attribType.Global, name, 0, value)
+
+    def set_attrib_values(self, attrib_type, name, values):
+        '''sets the values of all elements from a flat sequence, like the bulk setters of hou'''
+        attrib = self.attrib(attrib_type, name)
+        count = self.element_count(attrib_type)
+        values = list(values)
+        if len(values) != count * attrib.size():
+            raise OperationFailed('Expected {} values for {}, got {}'.format(count * attrib.size(), name, len(values)))
+
+        if attrib.size() > 1:
+            values = zip(*[iter(values)] * attrib.size())
+        attrib.values = [attrib.cast(value) for value in values]
+
+    def attrib_values_flat(self, attrib_type, name):
+        attrib = self.attrib(attrib_type, name)
+        if attrib.size() > 1:
+            return tuple(v for value in attrib.values for v in value)
+        return tuple(attrib.values)
+
+    def setPointFloatAttribValues(self, name, values):
+        self.set_attrib_values(attribType.Point, name, values)
+
+    def setPointIntAttribValues(self, name, values):
+        self.set_attrib_values(attribType.Point, name, values)
+
+    def setPointStringAttribValues(self, name, values):
+        self.set_attrib_values(attribType.Point, name, values)
+
+    def setPrimFloatAttribValues(self, name, values):
+        self.set_attrib_values(attribType.Prim, name, values)
+
+    def setPrimIntAttribValues(self, name, values):
+        self.set_attrib_values(attribType.Prim, name, values)
+
+    def setPrimStringAttribValues(self, name, values):
+        self.set_attrib_values(attribType.Prim, name, values)
+
+    def setVertexFloatAttribValues(self, name, values):
+        self.set_attrib_values(attribType.Vertex, name, values)
+
+    def setVertexIntAttribValues(self, name, values):
+        self.set_attrib_values(attribType.Vertex, name, values)
+
+    def setVertexStringAttribValues(self, name, values):
+        self.set_attrib_values(attribType.Vertex, name, values)
+
+    def pointFloatAttribValues(self, name):
+        return self.attrib_values_flat(attribType.Point, name)
+
+    def pointIntAttribValues(self, name):
+        return self.attrib_values_flat(attribType.Point, name)
+
+    def pointStringAttribValues(self, name):
+        return self.attrib_values_flat(attribType.Point, name)
+
+    def primFloatAttribValues(self, name):
+        return self.attrib_values_flat(attribType.Prim, name)
+
+    def primIntAttribValues(self, name):
+        return self.attrib_values_flat(attribType.Prim, name)
+
+    def primStringAttribValues(self, name):
+        return self.attrib_values_flat(attribType.Prim, name)
+
+    def vertexFloatAttribValues(self, name):
+        return self.attrib_values_flat(attribType.Vertex, name)
+
+    def vertexIntAttribValues(self, name):
+        return self.attrib_values_flat(attribType.Vertex, name)
+
+    def vertexStringAttribValues(self, name):
+        return self.attrib_values_flat(attribType.Vertex, name)
+
+    # elements
+
+    def points(self):
+        return tuple(Point(self, i) for i in range(self._element_count[attribType.Point]))
+
+    def prims(self):
+        return tuple(Polygon(self, i) for i in range(self._element_count[attribType.Prim]))
+
+    def iterPoints(self):
+        return self.points()
+
+    def iterPrims(self):
+        return self.prims()
+
+    def point(self, index):
+        return Point(self, index) if 0 <= index < self._element_count[attribType.Point] else None
+
+    def prim(self, index):
+        return Polygon(self, index) if 0 <= index < self._element_count[attribType.Prim] else None
+
+    def createPoint(self):
+        return self.createPoints([(0.0, 0.0, 0.0)])[0]
+
+    def createPoints(self, positions):
+        start = self._element_count[attribType.Point]
+        positions = [tuple(map(float, position)) for position in positions]
+        for attrib in self._attribs[attribType.Point].values():
+            if attrib.name() == 'P':
+                attrib.values.extend(positions)
+            else:
+                attrib.values.extend([attrib.cast(attrib.defaultValue())] * len(positions))
+        self._element_count[attribType.Point] += len(positions)
+        return tuple(Point(self, i) for i in range(start, start + len(positions)))
+
+    def createPolygon(self, is_closed=True):
+        return self.createPolygons([()], is_closed)[0]
+
+    def createPolygons(self, points, is_closed=True):
+        start = self._element_count[attribType.Prim]
+        vertex_count = 0
+        for prim_points in points:
+            numbers = [point_number(point) for point in prim_points]
+            self._prim_points.append(numbers)
+            self._prim_closed.append(bool(is_closed))
+            vertex_count += len(numbers)
+
+        count = len(self._prim_points) - start
+        for attrib in self._attribs[attribType.Prim].values():
+            attrib.values.extend([attrib.cast(attrib.defaultValue())] * count)
+        for attrib in self._attribs[attribType.Vertex].values():
+            attrib.values.extend([attrib.cast(attrib.defaultValue())] * vertex_count)
+
+        self._element_count[attribType.Prim] += count
+        self._vertex_offsets = None
+        return tuple(Polygon(self, i) for i in range(start, start + count))
+
+    # groups
+
+    def createEdgeGroup(self, name):
+        if name in self._edge_groups:
+            raise OperationFailed('Group {} already exists'.format(name))
+        group = EdgeGroup(self, name)
+        self._edge_groups[name] = group
+        return group
+
+    def findEdgeGroup(self, name):
+        return self._edge_groups.get(name)
+
+    def edgeGroups(self):
+        return tuple(self._edge_groups.values())
+
+    def findEdge(self, p0, p1):
+        '''returns the edge between two points or None if no primitive connects them'''
+        edge = {point_number(p0), point_number(p1)}
+        for points, closed in zip(self._prim_points, self._prim_closed):
+            pairs = zip(points, points[1:] + points[:1] if closed else points[1:])
+            if any({a, b} == edge for a, b in pairs):
+                return Edge(self, (point_number(p0), point_number(p1)))
+        return None
+
+    def globEdges(self, pattern):
+        '''
+        returns the edges of a pattern, only point paths like p0-1 p2-3-4 are supported
+        edges are not checked against the primitives, unlike in hou a path between unconnected points doesn't fail
+        '''
+        edges = []
+        for token in pattern.split():
+            if not token.startswith('p'):
+                raise OperationFailed('Unsupported edge pattern {}'.format(token))
+            numbers = [int(number) for number in token[1:].split('-')]
+            edges.extend(Edge(self, pair) for pair in zip(numbers, numbers[1:]))
+        return tuple(edges)
+
+    # whole geometry
+
+    def merge(self, geometry):
+        '''appends the points and primitives of another geometry, attributes only one of them has get their default on the other'''
+        point_offset = self._element_count[attribType.Point]
+
+        for attrib_type in (attribType.Point, attribType.Prim, attribType.Vertex):
+            counts = (self.element_count(attrib_type), geometry.element_count(attrib_type))
+            for name, other in geometry._attribs[attrib_type].items():
+                if name not in self._attribs[attrib_type]:
+                    attrib = _copy.copy(other)
+                    attrib._geometry = self
+                    attrib.values = [attrib.cast(other.defaultValue())] * counts[0]
+                    self._attribs[attrib_type][name] = attrib
+            for name, attrib in self._attribs[attrib_type].items():
+                other = geometry._attribs[attrib_type].get(name)
+                if other is None:
+                    attrib.values = attrib.values + [attrib.cast(attrib.defaultValue())] * counts[1]
+                else:
+                    attrib.values = attrib.values + [attrib.cast(value) for value in other.values]
+
+        for name, other in geometry._attribs[attribType.Global].items():
+            if name not in self._attribs[attribType.Global]:
+                attrib = _copy.copy(other)
+                attrib._geometry = self
+                attrib.values = list(other.values)
+                self._attribs[attribType.Global][name] = attrib
+
+        for name, other in geometry._edge_groups.items():
+            group = self._edge_groups.get(name) or self.createEdgeGroup(name)
+            group.add(Edge(self, [number + point_offset for number in edge._points]) for edge in other.edges())
+
+        self._prim_points.extend([number + point_offset for number in points] for points in geometry._prim_points)
+        self._prim_closed.extend(geometry._prim_closed)
+        self._element_count[attribType.Point] += geometry._element_count[attribType.Point]
+        self._element_count[attribType.Prim] += geometry._element_count[attribType.Prim]
+        self._vertex_offsets = None
+
+    def copy(self, geometry):
+        '''replaces this geometry with a copy of another one'''
+        self.clear()
+        self._attribs[attribType.Point].clear()
+        self.merge(geometry)
+
+    def freeze(self):
+        '''returns a copy of this geometry'''
+        geometry = Geometry()
+        geometry.copy(self)
+        return geometry
+
+    def transform(self, matrix):
+        '''transforms all points with a Matrix4, like hou points are row vectors'''
+        if not self._element_count[attribType.Point]:
+            return
+        m = matrix._m
+        positions = np.array(self.attrib_values(attribType.Point, 'P'))
+        positions = positions @ m[:3, :3] + m[3, :3]
+        self.attrib(attribType.Point, 'P').values = [tuple(p) for p in positions.tolist()]
+
+    def boundingBox(self):
+        '''returns the min and max corner of all points as two Vector3'''
+        positions = np.array(self.attrib_values(attribType.Point, 'P')).reshape(-1, 3)
+        if not len(positions):
+            return Vector3(), Vector3()
+        return Vector3(*positions.min(axis=0)), Vector3(*positions.max(axis=0))
+
+# nodes
+
+class NodeType:
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+    def nameComponents(self):
+        return ('', '', self._name, '')
+
+class Parm:
+    def __init__(self, node, name, value):
+        self._node = node
+        self._name = name
+        self._value = value
+
+    def name(self):
+        return self._name
+
+    def node(self):
+        return self._node
+
+    def eval(self):
+        return self._value
+
+    def set(self, value):
+        self._value = value
+
+_session_ids = itertools.count(1)
+
+class Node:
+    '''
+    a node with its own geometry, like the python sop a cook runs in
+    parms is a dict of parm names and values, nodes without a parent are children of the root node
+    '''
+    def __init__(self, name='python1', type_name='python', parent=None, parms=None):
+        self._name = name
+        self._type = NodeType(type_name)
+        self._parent = parent if parent is not None or type_name == 'root' else root()
+        self._children = []
+        self._parms = {key: Parm(self, key, value) for key, value in (parms or {}).items()}
+        self._geometry = Geometry()
+        self._user_data = {}
+        self._inputs = []
+        self._session_id = next(_session_ids)
+        if self._parent is not None:
+            self._parent._children.append(self)
+
+    def __repr__(self):
+        return '<hou.Node {}>'.format(self.path())
+
+    def name(self):
+        return self._name
+
+    def path(self):
+        if self._parent is None:
+            return '/'
+        return self._parent.path().rstrip('/') + '/' + self._name
+
+    def type(self):
+        return self._type
+
+    def sessionId(self):
+        return self._session_id
+
+    def parent(self):
+        return self._parent
+
+    def children(self):
+        return tuple(self._children)
+
+    def allSubChildren(self):
+        return tuple(node for child in self._children for node in (child,) + child.allSubChildren())
+
+    def parm(self, name):
+        return self._parms.get(name)
+
+    def parms(self):
+        return tuple(self._parms.values())
+
+    def geometry(self):
+        return self._geometry
+
+    def userData(self, name):
+        return self._user_data.get(name)
+
+    def setUserData(self, name, value):
+        self._user_data[name] = value
+
+    def createNode(self, type_name, node_name=None, run_init_scripts=True):
+        '''like in houdini a taken name gets its trailing number increased'''
+        name = node_name or type_name + '1'
+        taken = {child.name() for child in self._children}
+        if name in taken:
+            base = name.rstrip('0123456789')
+            start = int(name[len(base):] or 0) + 1
+            name = next(base + str(n) for n in itertools.count(start) if base + str(n) not in taken)
+        return Node(name, type_name, self)
+
+    def node(self, name):
+        return next((child for child in self._children if child.name() == name), None)
+
+    def input(self, index):
+        return self._inputs[index] if index < len(self._inputs) else None
+
+    def inputs(self):
+        return tuple(self._inputs)
+
+    def outputs(self):
+        if self._parent is None:
+            return ()
+        return tuple(child for child in self._parent.children() if self in child.inputs())
+
+    def setInput(self, index, node, output_index=0):
+        self._inputs.extend([None] * (index + 1 - len(self._inputs)))
+        self._inputs[index] = node
+        while self._inputs and self._inputs[-1] is None:
+            self._inputs.pop()
+
+    def setNextInput(self, node):
+        self._inputs.append(node)
+
+    def destroy(self):
+        for child in self._parent.children():
+            child._inputs = [None if i is self else i for i in child._inputs]
+            while child._inputs and child._inputs[-1] is None:
+                child._inputs.pop()
+        self._parent._children.remove(self)
+
+_root = None
+_pwd = None
+
+def root():
+    global _root
+    if _root is None:
+        _root = Node('', 'root')
+    return _root
+
+def node(path):
+    '''returns the node of an absolute path or None'''
+    current = root()
+    for name in [name for name in path.split('/') if name]:
+        current = next((child for child in current.children() if child.name() == name), None)
+        if current is None:
+            return None
+    return current
+
+def pwd():
+    return _pwd if _pwd is not None else root()
+
+def setPwd(node):
+    global _pwd
+    _pwd = node
@@ -0,0 +1,218 @@
+import json
+import os
+from pathlib import Path
+
+# bump this if the layout of the index file changes
+INDEX_VERSION = 1
+
+def normalize_name(name):
+    '''
+    normalizes a file reference from an ldraw file into the key used by the index
+    e.g. 'S\\3001S01.DAT' -> 's/3001s01.dat'
+    '''
+    return name.replace('\\', '/').replace(' ', '').lower()
+
+def scan_dir(root):
+    '''
+    walks a library root and returns a dict of directory mtimes and a list of all files relative to the root.
+    a missing root is recorded with a mtime of None so we notice once it gets created.
+    '''
+    dirs = {}
+    files = []
+    # (directory, its path relative to the root in posix form)
+    stack = [(str(root), '')]
+
+    while stack:
+        current, prefix = stack.pop()
+        try:
+            dirs[current] = os.stat(current).st_mtime_ns
+            entries = list(os.scandir(current))
+        except OSError:
+            dirs[current] = None
+            continue
+
+        for entry in entries:
+            if entry.is_dir():
+                stack.append((entry.path, prefix + entry.name + '/'))
+            else:
+                files.append(prefix + entry.name)
+
+    return dirs, files
+
+class LdrawLibraryIndex:
+    '''
+    Case-insensitive index of all files in the ldraw library roots.
+    Resolving a part becomes a dict lookup instead of probing the filesystem for every candidate path.
+    The index is stored on disk and only the roots whose directory mtimes changed get rescanned.
+    '''
+    def __init__(self, search_paths, index_file=None):
+        # list of (directory, highres_directory) tuples in lookup order
+        self.search_paths = [(Path(base), Path(highres) if highres else None) for base, highres in search_paths]
+        self.index_file = Path(index_file) if index_file else None
+
+        self.roots = []
+        for base, highres in self.search_paths:
+            for root in (base, highres):
+                if root is not None and str(root) not in self.roots:
+                    self.roots.append(str(root))
+
+        # search paths with the root names the keys are stored under, so a lookup doesn't have to convert paths
+        self.lookup = [(base, str(base), highres, str(highres) if highres else None) for base, highres in self.search_paths]
+
+        self.dirs = {}
+        self.files = {}
+        self.keys = {}
+        # resolved paths by name, highres and search path range, they are forgotten once a root is rescanned
+        self.resolved = {}
+
+        self.load()
+        self.refresh()
+
+    def set_root(self, root, dirs, files):
+        self.dirs[root] = dirs
+        self.files[root] = files
+        # first file wins if the filesystem is case sensitive and names only differ in case
+        keys = {}
+        for f in files:
+            keys.setdefault(f.lower(), f)
+        self.keys[root] = keys
+        self.resolved = {}
+
+    def load(self):
+        '''reads a previously stored index, silently ignores missing or outdated files'''
+        if self.index_file is None or not self.index_file.exists():
+            return
+
+        try:
+            with open(self.index_file, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if data.get('version') != INDEX_VERSION:
+            return
+
+        for root, entry in data.get('roots', {}).items():
+            if root in self.roots:
+                self.set_root(root, entry['dirs'], entry['files'])
+
+    def save(self):
+        '''writes the index next to the other caches, skipped if the cache dir isn't writable'''
+        if self.index_file is None:
+            return
+
+        data = {'version': INDEX_VERSION, 'roots': {}}
+        for root in self.roots:
+            data['roots'][root] = {'dirs': self.dirs[root], 'files': self.files[root]}
+
+        try:
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            # write to a temp file first so other sessions never read a half written index
+            temp_file = self.index_file.with_name('{}.{}.tmp'.format(self.index_file.name, os.getpid()))
+            with open(temp_file, 'w') as f:
+                json.dump(data, f)
+            os.replace(temp_file, self.index_file)
+        except OSError:
+            pass
+
+    def is_stale(self, root):
+        dirs = self.dirs.get(root)
+        if dirs is None:
+            return True
+
+        for d, mtime in dirs.items():
+            try:
+                current = os.stat(d).st_mtime_ns
+            except OSError:
+                current = None
+            if current != mtime:
+                return True
+        return False
+
+    def refresh(self):
+        '''rescans every root that changed on disk since it was indexed, returns True if anything was rescanned'''
+        changed = False
+        for root in self.roots:
+            if self.is_stale(root):
+                dirs, files = scan_dir(root)
+                self.set_root(root, dirs, files)
+                changed = True
+
+        if changed:
+            self.save()
+        return changed
+
+    def resolve(self, name, highres=False, start=0, stop=None):
+        '''returns the path of a referenced file or None if it isn't part of the library, start and stop limit the search paths that are looked at'''
+        resolved_key = (name, bool(highres), start, stop)
+        if resolved_key in self.resolved:
+            return self.resolved[resolved_key]
+
+        key = normalize_name(name)
+        path = None
+        for base_dir, base_root, highres_dir, highres_root in self.lookup[start:stop]:
+            rel = self.keys[base_root].get(key)
+            if rel is None:
+                continue
+
+            # check for highres override if requested
+            if highres and highres_dir is not None:
+                highres_rel = self.keys[highres_root].get(key)
+                if highres_rel is not None:
+                    path = highres_dir / highres_rel
+                    break
+            path = base_dir / rel
+            break
+
+        self.resolved[resolved_key] = path
+        return path
+
+class LdrawOverlayIndex:
+    '''
+    Resolves through an index with the index of an overlay inserted into its lookup order at position.
+    The parts embedded in an mpd file are an overlay, they come after the official library and before the unofficial parts.
+    '''
+    def __init__(self, index, overlay, position):
+        self.index = index
+        self.overlay = overlay
+        self.position = position
+
+    def resolve(self, name, highres=False):
+        path = self.index.resolve(name, highres, 0, self.position)
+        if path is None:
+            path = self.overlay.resolve(name, highres)
+        if path is None:
+            path = self.index.resolve(name, highres, self.position)
+        return path
+
+# indexes are shared by all cooks of a session
+_indexes = {}
+
+def library_index(search_paths, index_file=None, refresh=False):
+    '''
+    returns the session wide index for the given search paths
+    it's checked against the library when it's created and if refresh is True, not on every call,
+    checking means a stat of every library directory, which is slow on network shares
+    '''
+    key = (tuple((str(b), str(h)) for b, h in search_paths), str(index_file))
+    index = _indexes.get(key)
+    if index is None:
+        index = LdrawLibraryIndex(search_paths, index_file)
+        _indexes[key] = index
+    elif refresh:
+        index.refresh()
+    return index
+
+def overlay_index(index, overlay_paths, position, refresh=False):
+    '''
+    returns the session wide LdrawOverlayIndex of an index and the search paths of an overlay
+    the overlay isn't stored on disk, it's scanned when it's first used and if refresh is True
+    '''
+    key = (id(index), tuple((str(b), str(h)) for b, h in overlay_paths), position)
+    overlay = _indexes.get(key)
+    if overlay is None:
+        overlay = LdrawOverlayIndex(index, LdrawLibraryIndex(overlay_paths), position)
+        _indexes[key] = overlay
+    elif refresh:
+        overlay.overlay.refresh()
+    return overlay
@@ -0,0 +1,163 @@
+'''
+Houdini independent metrics of the import pipeline, see ldraw.begin_metrics for how they are switched on.
+A cook starts a report with begin() and finishes it with end(). While no report is running stage() and count() return right away.
+stage() adds the wall time of a block and count() adds to a counter of every running report,
+so the report of a model also contains the part cooks that happen inside of it.
+Stages can be nested, e.g. instance runs the cache, read and parse stages of the parts it compiles.
+A stage only gets its exclusive time, the time of the stages inside it is subtracted, so the stages of a report add up to less than its total.
+The time that isn't part of a stage only shows up in the total.
+Reports can also trace a cook, every stage, span() and the cook itself are then recorded as chrome trace events.
+The trace files can be opened in chrome://tracing, ui.perfetto.dev or speedscope as a flame graph.
+'''
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+# reports of the cooks that are running, the innermost one is last
+_running = []
+# seconds of the nested stages of every stage that is running, the innermost one is last
+_nested = []
+
+class LdrawMetrics:
+    '''
+    wall time in seconds per stage and counters of a single cook
+    report is False if the cook is only traced, trace holds the trace events or is None if it isn't traced
+    '''
+    def __init__(self, kind, name, report=True, trace=False):
+        self.kind = kind
+        self.name = name
+        self.report_enabled = report
+        self.trace = [] if trace else None
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+        self.stages = {}
+        self.counters = {}
+
+    def report(self):
+        '''returns the report as a json serializable dict'''
+        return {
+            'kind': self.kind,
+            'name': self.name,
+            'time': time.time(),
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'seconds': self.seconds,
+            'stages': dict(self.stages),
+            'counters': dict(self.counters),
+        }
+
+    def attributes(self):
+        '''returns the names and values of the detail attributes, stage times are floats and counters ints'''
+        attributes = [('metrics_seconds', self.seconds)]
+        attributes.extend(('metrics_{}_seconds'.format(stage), seconds) for stage, seconds in self.stages.items())
+        attributes.extend(('metrics_{}'.format(counter), value) for counter, value in self.counters.items())
+        return attributes
+
+def begin(kind, name, report=True, trace=False):
+    '''starts a report, kind is what cooks (part, properties, model) and name what it cooks'''
+    metrics = LdrawMetrics(kind, name, report, trace)
+    _running.append(metrics)
+    return metrics
+
+def end(metrics):
+    '''finishes a report and returns it, the cook is added as a span to its own trace and the ones of the cooks around it'''
+    end_time = time.perf_counter()
+    metrics.seconds = end_time - metrics.start
+    add_span('{}:{}'.format(metrics.kind, metrics.name), metrics.start, end_time, {'kind': metrics.kind})
+
+    for i, running in enumerate(_running):
+        if running is metrics:
+            del _running[i]
+            break
+    return metrics
+
+def add_span(name, start, end_time, args):
+    '''adds a complete event to every running trace, times are perf_counter seconds'''
+    event = None
+    for metrics in _running:
+        if metrics.trace is None:
+            continue
+        if event is None:
+            event = {
+                'name': name,
+                'ph': 'X',
+                'ts': start * 1e6,
+                'dur': (end_time - start) * 1e6,
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': args,
+            }
+        metrics.trace.append(event)
+
+def tracing():
+    return any(metrics.trace is not None for metrics in _running)
+
+@contextmanager
+def span(name, **args):
+    '''
+    traces a block, yields the dict of span arguments so the block can add to them or None if nothing is traced
+    unlike stages spans can be nested, e.g. every recursive read of a part
+    '''
+    if not tracing():
+        yield None
+        return
+
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        add_span(name, start, time.perf_counter(), args)
+
+@contextmanager
+def stage(name):
+    '''
+    adds the wall time of a block without the time of the stages inside it to a stage, traced cooks also get a span of it
+    the span covers the whole block, the trace shows the nesting
+    '''
+    if not _running:
+        yield
+        return
+
+    start = time.perf_counter()
+    _nested.append(0.0)
+    try:
+        yield
+    finally:
+        end_time = time.perf_counter()
+        seconds = end_time - start
+        nested = _nested.pop()
+        if _nested:
+            _nested[-1] += seconds
+        for metrics in _running:
+            metrics.stages[name] = metrics.stages.get(name, 0.0) + seconds - nested
+        add_span(name, start, end_time, {'stage': name})
+
+def count(name, value=1):
+    for metrics in _running:
+        metrics.counters[name] = metrics.counters.get(name, 0) + value
+
+def write_report(metrics, path):
+    '''appends a report to a json lines file, one line per cook, so reports of many sessions can be collected in one file'''
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(json.dumps(metrics.report()) + '\n')
+    except OSError:
+        pass
+
+def write_trace(metrics, path):
+    '''writes the trace events of a cook as a chrome trace json file'''
+    trace = {
+        'traceEvents': metrics.trace,
+        'displayTimeUnit': 'ms',
+        'otherData': {'kind': metrics.kind, 'name': metrics.name, 'host': socket.gethostname()},
+    }
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(trace, f)
+    except OSError:
+        pass
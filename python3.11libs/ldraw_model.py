@@ -1,18 +1,29 @@
 # pyright: reportMissingImports=false
 from pathlib import Path
-import hou
-import re
+import ldraw_headless
+import json
 import ldraw
+import ldraw_parser
+import ldraw_mpd
+import ldraw_metrics
+import numpy as np
 import importlib
 
+hou = ldraw_headless.backend()
+
 importlib.reload(ldraw)
 
+# options the static import creates its part nodes with: highres, logo, instance stud, edges, print handling
+static_part_options = (0, 1, 1, 1, 1)
+
 class LdrawMpdHelper:
     def __init__(self, model):
         self.model = model
+        # folder of the embedded parts, it's set once they are stored, see ldraw.mpd_overlay
+        self.overlay = None
 
-    def create_part(self, subfiles, key):
-        '''Creates an unofficial part from an .mpd subfile.'''
+    def create_part(self, subfiles, key, overlay):
+        '''Stores a part embedded in an .mpd file in the mpd parts folder of the model in the cache, the library itself is never written to.'''
         key_name = key.replace('s\\', '').replace('s/', '').replace('8\\', '').replace('8/', '').replace('48\\', '').replace('48/', '')
         file = Path()
 
@@ -24,91 +35,103 @@ class LdrawMpdHelper:
                 part_type = line_split[2]
                 
                 if part_type == 'Unofficial_Part':
-                    file = ldraw.p_u / key_name
+                    file = overlay / 'parts' / key_name
                 elif part_type == 'Unofficial_Subpart':
-                    file = ldraw.ps_u / key_name
+                    file = overlay / 'parts' / 's' / key_name
                 elif part_type == 'Unofficial_Primitive':
-                    file = ldraw.pr_u / key_name
+                    file = overlay / 'p' / key_name
                 elif part_type == 'Unofficial_48_Primitive':
-                    file = ldraw.pr48_u / key_name
+                    file = overlay / 'p' / '48' / key_name
                 elif part_type == 'Unofficial_8_Primitive':
-                    file = ldraw.pr8_u / key_name
+                    file = overlay / 'p' / '8' / key_name
                 else:
-                    file = ldraw.p_u / key_name
+                    file = overlay / 'parts' / key_name
                 break
             else:
                 # if meta not present we just have to assume it's a part
-                file = ldraw.p_u / key_name
+                file = overlay / 'parts' / key_name
 
-        # write list to file
-        if self.model.unofficial_file_rewrite or file.exists() == False:
-            with open(file, 'w') as f:
-                for line in subfiles[key]:
-                    f.write(line)
+        # the file is only written if its content changed, so repeated imports of the same model don't touch it
+        ldraw_mpd.write_subfile(file, subfiles[key])
 
     def find_subfiles(self):
-        '''Returns a dict of subfiles from an mpd file.'''
-        subfiles = dict()
-        name = ''
-        
-        with open(self.model.file) as f:
-            for line in f:
-                line_split = line.split()
-
-                if len(line_split) < 3:
-                    continue
-
-                if line_split[0] == '0' and line_split[1] == 'FILE':
-                    # we remove any spaces for filenames
-                    # add name as the key to the dict
-                    name = ''.join(line_split[2:])                
-                    subfiles[name] = []
-                
-                if line_split[0] == '0' or line_split[0] == '1' or line_split[0] == '3' or line_split[0] == '4':
-                    # we reconstruct the line but remove spaces from subfile references
-                    # add line to the value of the key name
-                    part = ''.join(line_split[14:])
-                    line = ' '.join(line_split[:14]) + ' ' + part + '\n'
-                    subfiles[name].append(line)                 
-
+        '''
+        Returns a mapping of all subfiles in an mpd file, their lines are read lazily from the file.
+        The file stays mapped until the reader is closed, use it as a context manager so windows doesn't keep the file locked.
+        '''
+        with ldraw_metrics.stage('read'):
+            subfiles = ldraw_mpd.LdrawMpdReader(self.model.file)
+        ldraw_metrics.count('files_opened')
+        ldraw_metrics.count('bytes_read', len(subfiles.data))
         return subfiles
-    
-    def build_subfiles(self, subfiles):
-        # create unofficial directories if they don't exist
-        dirs=[ldraw.ps_u, ldraw.pr48_u, ldraw.pr8_u]
-        for d in dirs:
-            d.mkdir(parents=True, exist_ok=True)
 
-        #find dat subfile and create unofficial parts in ldraw lib
+    def main_subfile(self, subfiles):
+        '''Returns the name of the subfile that contains the main model.'''
+        # we assume it's the first one, but for safety we still check if there's one with 'main' in its name
+        main_subfile = next(iter(subfiles))
+
+        for key in subfiles:
+            if 'main' in key.lower():
+                main_subfile = key
+                break
+
+        return main_subfile
+
+    def build_subfiles(self, subfiles, node):
+        '''
+        Stores the embedded parts in the folder of the model and marks node with it, the part nodes inside of it resolve through it.
+        The index of the folder is refreshed right away, the library index was already checked before the import.
+        '''
+        self.overlay = ldraw.mpd_overlay(self.model.file)
+
+        #find dat subfiles and store them as parts
         for key in subfiles:
             if '.dat' in key or '.DAT' in key:
-                self.create_part(subfiles, key)
+                self.create_part(subfiles, key, self.overlay)
+
+        ldraw.overlay_index(self.overlay, refresh=True)
+        ldraw.set_model_overlay(node, self.overlay)
 
 class ldrawModel:
-    def __init__(self, file, context_node=None):
+    def __init__(self, file, context_node=None, geo_node=None):
         self.file = file
         self.main_model_name = self.file.stem
         self.main_model_name = ldraw.strip_special_characters(self.main_model_name)
         self.context_node = context_node
-        self.unofficial_file_rewrite = False
+        # an existing network to update, see reload_model()
+        self.geo_node = geo_node
+
+    def load_state(self, geo_node):
+        '''Returns True if the network of a previous import can be updated instead of being rebuilt.'''
+        return False
 
     def build_context(self):
-        if self.context_node is None:
-            geo_node = hou.node('/obj').createNode('geo', 'brickini_ldraw_model_{}'.format(self.main_model_name))
+        if self.geo_node is not None:
+            geo_node = self.geo_node
+        elif self.context_node is None:
+            return hou.node('/obj').createNode('geo', 'brickini_ldraw_model_{}'.format(self.main_model_name))
         else:
             geo_node = hou.node(self.context_node.path() + '/sopcreate1/sopnet/create')
+            hou.node(self.context_node.path() + '/sopcreate1').parm('pathprefix').set('/geo/brickini_ldraw_model/m_' + self.main_model_name)
+
+        if not self.load_state(geo_node):
             # clean up existing nodes
             for child in geo_node.children():
                 child.destroy()
 
-            hou.node(self.context_node.path() + '/sopcreate1').parm('pathprefix').set('/geo/brickini_ldraw_model/m_' + self.main_model_name)
-
         return geo_node
 
     def build_network(self, geo_node):
         raise NotImplementedError
     
     def build_end_of_network(self, geo_node, last_node):
+        # an updated network already has its end
+        # new nodes of an update aren't laid out, the layout of a big network takes longer than the update itself
+        i = geo_node.node('brickini_imperfections1')
+        if i is not None:
+            i.setInput(0, last_node, 0)
+            return
+
         i = last_node.createOutputNode('brickini_imperfections', 'brickini_imperfections1')
         o = i.createOutputNode('null', 'OUT')
         o.setRenderFlag(True)
@@ -116,45 +139,65 @@ class ldrawModel:
         geo_node.layoutChildren()
 
     def __call__(self):
-        geo_node = self.build_context()
-        last_node = self.build_network(geo_node)
-        self.build_end_of_network(geo_node, last_node)
+        metrics = ldraw.begin_metrics('model', self.main_model_name)
+        try:
+            geo_node = self.build_context()
+            existing = {child.sessionId() for child in geo_node.children()}
+
+            last_node = self.build_network(geo_node)
+            self.build_end_of_network(geo_node, last_node)
+
+            children = {child.sessionId() for child in geo_node.children()}
+            ldraw_metrics.count('nodes_created', len(children - existing))
+            ldraw_metrics.count('nodes_destroyed', len(existing - children))
+        finally:
+            ldraw.end_metrics(metrics)
 
 class LdrawStaticHelper():
     def __init__(self, model):
         self.model = model
         self.part_list = dict()
 
-    def transform_part(self, node, m4, geo_node):
-        '''Transforms the part according to the ldraw matrix and adjusts for the houdini coord sys.'''
-        hxform = ldraw.xform_to_houdini()
-        m4 = hxform.inverted() * m4 * hxform
-        tr = m4.explode()
-
+    def transform_part(self, node, translate, rotate, scale, geo_node):
+        '''Transforms the part, the values come from ldraw.explode_matrices so they are already in the houdini coord sys.'''
         t = geo_node.createNode('xform', 'transform1', run_init_scripts=False)
         t.setInput(0, node, 0)
-        t.parm('prexform_tx').set(tr.get('translate')[0])
-        t.parm('prexform_ty').set(tr.get('translate')[1])
-        t.parm('prexform_tz').set(tr.get('translate')[2])
-        t.parm('prexform_rx').set(tr.get('rotate')[0])
-        t.parm('prexform_ry').set(tr.get('rotate')[1])
-        t.parm('prexform_rz').set(tr.get('rotate')[2])
-        t.parm('prexform_sx').set(tr.get('scale')[0])
-        t.parm('prexform_sy').set(tr.get('scale')[1])
-        t.parm('prexform_sz').set(tr.get('scale')[2])
+        t.parm('prexform_tx').set(translate[0])
+        t.parm('prexform_ty').set(translate[1])
+        t.parm('prexform_tz').set(translate[2])
+        t.parm('prexform_rx').set(rotate[0])
+        t.parm('prexform_ry').set(rotate[1])
+        t.parm('prexform_rz').set(rotate[2])
+        t.parm('prexform_sx').set(scale[0])
+        t.parm('prexform_sy').set(scale[1])
+        t.parm('prexform_sz').set(scale[2])
 
         return t
 
-    def place_part(self, color_code, part, geo_node):
-        '''Places a part + color sop in the nodegraph.'''
+    def prefetch_parts(self, references):
+        '''Compiles all referenced parts in parallel before any part node gets created.'''
+        parts = []
+        for part in references:
+            if '.dat' in part or '.DAT' in part:
+                parts.append(part.replace('.dat', '').replace('.DAT', ''))
 
-        # add part as key to self.part_list dict if it doesn't exist
-        if part not in self.part_list:
-            self.part_list[part] = None
+        ldraw.prefetch_parts(parts, static_part_options, self.model.mpd_helper.overlay)
 
+    def find_parts(self, geo_node):
+        '''Adds the part sops of an existing network to the part list, so an updated network reuses them.'''
+        for child in geo_node.children():
+            if child.type().nameComponents()[2] == 'brickini_ldraw_part':
+                self.part_list[child.parm('part').eval()] = child
+
+    def create_part(self, part, geo_node):
+        '''Returns the part sop of a part, it's only created once per part.'''
         part_name = part.replace('.dat', '').replace('.DAT', '')
 
-        if not self.part_list[part]:
+        # add part as key to self.part_list dict if it doesn't exist
+        if part_name not in self.part_list:
+            self.part_list[part_name] = None
+
+        if not self.part_list[part_name]:
             part_sop_name = ldraw.strip_special_characters(part_name)
             part_sop_name = 'bldp_{0}_'.format(part_sop_name)              
             part_sop = geo_node.createNode('brickini_ldraw_part', part_sop_name)
@@ -164,9 +207,14 @@ class LdrawStaticHelper():
             part_sop.parm('gap').set(1)
             part_sop.parm('part').set(part_name)
 
-            self.part_list[part] = part_sop
+            self.part_list[part_name] = part_sop
         else:
-            part_sop = self.part_list[part]
+            part_sop = self.part_list[part_name]
+
+        return part_sop
+
+    def create_material(self, color_code, part_sop, geo_node):
+        '''Creates a color sop for a part sop.'''
 
         # Deliberately not using the more convenient .createOutputNode() method as for some reason it's much slower than connecting it manually afterwards
         color_name = ldraw.get_color_name(color_code)
@@ -193,157 +241,518 @@ class LdrawStaticHelper():
 
         return material_sop
 
-class ldrawModelMpd(ldrawModel):
-    def __init__(self, file, context_node=None):
-        super().__init__(file, context_node)
+    def place_part(self, color_code, part, geo_node):
+        '''Places a part + color sop in the nodegraph.'''
+        part_sop = self.create_part(part, geo_node)
+        return self.create_material(color_code, part_sop, geo_node)
+
+    def destroy_reference(self, node):
+        '''Destroys the transform of a removed reference and the color and part sops that aren't used by anything else anymore.'''
+        inputs = [i for i in node.inputs() if i is not None]
+        node.destroy()
+
+        for i in inputs:
+            self.destroy_unused(i)
+
+    def destroy_unused(self, node):
+        '''Destroys a color or part sop that isn't connected to anything anymore, a color sop takes its part sop with it.'''
+        node_type = node.type().nameComponents()[2]
+        if node_type not in ('brickini_material', 'brickini_ldraw_part') or node.outputs():
+            return
+
+        if node_type == 'brickini_ldraw_part':
+            self.part_list.pop(node.parm('part').eval(), None)
+            node.destroy()
+        else:
+            self.destroy_reference(node)
+
+    def replace_input(self, node, output):
+        '''Connects a reused transform to another sop, the color and part sops it used before are destroyed if nothing else uses them.'''
+        previous = node.input(0)
+        node.setInput(0, output, 0)
+        if previous is not None:
+            self.destroy_unused(previous)
+
+    def is_material(self, node):
+        return node is not None and node.type().nameComponents()[2] == 'brickini_material'
+
+class LdrawInstanceHelper():
+    '''Flattens a model into a list of part instances, used by the compact import.'''
+    def __init__(self, model):
+        self.model = model
+        # primitives the parts instance, they get part nodes of their own
+        self.primitives = set()
+
+    def variant(self, part, color_code):
+        '''Returns the name of a unique part/color pair, it's used to match the instance points to their part.'''
+        part_name = part.replace('.dat', '').replace('.DAT', '')
+        return '{0}_{1}'.format(ldraw.strip_special_characters(part_name), color_code)
+
+    def resolve(self, part):
+        '''Resolves like the part nodes of the model, through its embedded parts.'''
+        return ldraw.resolve_part(part, 0, self.model.mpd_helper.overlay)
+
+    def collect_instances(self, subfiles=None):
+        '''
+        Returns an ldraw_mpd.LdrawFlatModel with every part of the model and its matrix in ldraw space.
+        An ldr file is treated like an mpd file with a single subfile.
+        '''
+        if subfiles is None:
+            with self.model.mpd_helper.find_subfiles() as subfiles:
+                return self.collect_instances(subfiles)
+        main_subfile = self.model.mpd_helper.main_subfile(subfiles)
+
+        with ldraw_metrics.stage('flatten'):
+            instances = ldraw_mpd.LdrawMpdFlattener(subfiles).flatten(main_subfile)
+
+        if ldraw.compact_instancing():
+            with ldraw_metrics.stage('instance'):
+                instances = self.add_primitives(instances)
+        return instances
+
+    def add_primitives(self, instances):
+        '''
+        Adds the primitives the part nodes instance to the flattened model, so they're copied onto points like parts.
+        Every part is compiled once with the options of the part nodes, its instances are placed with the matrix and color of every brick.
+        '''
+        rows = dict()
+        for n, part in enumerate(instances.parts):
+            rows.setdefault(part, []).append(n)
+
+        models = [instances]
+        for part, ref_list in rows.items():
+            part_name = part.replace('.dat', '').replace('.DAT', '')
+            instance_policy = ldraw.instance_policy(part_name)
+            if instance_policy is None:
+                continue
+
+            mesh, _, _ = ldraw.compile_part(part_name, static_part_options, self.resolve, instance_policy)
+            if mesh.instances is None:
+                continue
+
+            names = mesh.instances.part.tolist()
+            self.primitives.update(names)
+
+            # every brick gets all instances of its part, brick by brick
+            refs = np.array(ref_list)
+            local = ldraw_parser.matrices_from_values(mesh.instances.matrix)
+            matrices = local[None] @ instances.matrices[refs][:, None]
+            colors = np.where(mesh.instances.color[None] == 16, instances.colors[refs][:, None], mesh.instances.color[None])
+            submodels = [instances.submodels[n] for n in ref_list for _ in names]
+            models.append(ldraw_mpd.LdrawFlatModel(names * len(refs), colors.ravel(), matrices.reshape(-1, 4, 4), submodels))
+
+        return ldraw_mpd.concatenate(models)
+
+class ldrawModelStatic(ldrawModel):
+    '''
+    Static import with a node network of part, color and transform sops.
+    Every submodel is built once per color into a merge, references to it just transform that merge.
+    The fingerprints of all references are stored on the geo node, so a reload only touches the references that changed.
+    '''
+    state_name = 'brickini_model'
+
+    def __init__(self, file, context_node=None, geo_node=None):
+        super().__init__(file, context_node, geo_node)
         self.mpd_helper = LdrawMpdHelper(self)
         self.static_helper = LdrawStaticHelper(self)
 
-    def build_mpd_model(self, subfiles, color_code, subfile, geo_node):
-        '''Builds a model from an mpd file.'''
-        t_list = []
+        # merge node of every submodel and color it was built with
+        self.submodels = dict()
+        # submodels that are being built, a reference back to one of them would feed a merge into itself
+        self.building = set()
+        # parsed subfiles, every subfile is only decoded and parsed once per import
+        self.parsed = dict()
+        # fingerprints of the previous and the current import per submodel and color
+        self.previous = dict()
+        self.state = dict()
+
+    def load_state(self, geo_node):
+        data = geo_node.userData(self.state_name)
+        if not data:
+            return False
+
+        try:
+            state = json.loads(data)
+        except ValueError:
+            return False
+
+        if state.get('version') != 1 or state.get('file') != str(self.file):
+            return False
+
+        for entry in state['submodels']:
+            self.previous[(entry['subfile'], entry['color'])] = entry
+
+        self.static_helper.find_parts(geo_node)
+        return True
+
+    def save_state(self, geo_node):
+        submodels = [dict(subfile=subfile, color=color, **entry) for (subfile, color), entry in self.state.items()]
+        state = {'version': 1, 'file': str(self.file), 'submodels': submodels}
+        geo_node.setUserData(self.state_name, json.dumps(state))
+
+    def build_submodel(self, subfiles, color_code, subfile, geo_node):
+        '''
+        Returns the merge of a submodel, it's only built once per submodel and color, every other reference just transforms it.
+        If the network was built before, only the references whose fingerprint changed are replaced.
+        '''
+        key = (subfile, color_code)
+        if key in self.submodels:
+            return self.submodels[key]
+
+        previous = self.previous.pop(key, None)
+        m = geo_node.node(previous['merge']) if previous else None
+        if m is None:
+            m = geo_node.createNode('merge', 'merge1')
+            previous = None
+        self.submodels[key] = m
+
+        previous_lines = previous['lines'] if previous else []
+        self.building.add(subfile)
+        t_list, lines = self.build_mpd_model(subfiles, color_code, subfile, previous_lines, geo_node)
+        self.building.discard(subfile)
+
+        # keep the connections if nothing changed, rewiring makes houdini recook the merge
+        if list(m.inputs()) != t_list:
+            for i in reversed(range(len(m.inputs()))):
+                m.setInput(i, None)
+            for t in t_list:
+                m.setNextInput(t)
+
+        self.state[key] = {'merge': m.name(), 'lines': lines}
+        return m
+
+    def parse_subfile(self, subfiles, key):
+        '''Returns the LdrawFile of a subfile, the tokens of its lines are streamed from the reader into the parser.'''
+        ldraw_file = self.parsed.get(key)
+        if ldraw_file is None:
+            with ldraw_metrics.stage('parse'):
+                ldraw_file = ldraw_mpd.parse_subfile(subfiles[key])
+            self.parsed[key] = ldraw_file
+        return ldraw_file
+
+    def build_mpd_model(self, subfiles, color_code, subfile, previous_lines, geo_node):
+        '''
+        Builds a model from an mpd subfile.
+        Returns the transforms of all references and their fingerprints with the transform names.
+        '''
         t_list_master = []
+        lines = []
         color_group = color_code
 
-        for line in subfiles[subfile]:
-            if len(line) < 3:
+        ldraw_file = self.parse_subfile(subfiles, subfile)
+        translate, rotate, scale = ldraw.explode_matrices(ldraw.houdini_matrices(ldraw_file.ref_matrix))
+
+        # commented out logo lines are only relevant for parts
+        enabled = [i for i in range(len(ldraw_file.ref_color)) if not ldraw_file.ref_flags[i] & ldraw_parser.REF_DISABLED]
+        fingerprints = ldraw_mpd.ref_fingerprints(ldraw_file)
+        fingerprints = [fingerprints[i] for i in enabled]
+        reuse, removed = ldraw_mpd.match_fingerprints([fingerprint for fingerprint, _ in previous_lines], fingerprints)
+
+        keys = ldraw_mpd.subfile_keys(subfiles)
+        names = ldraw_file.ref_names()
+
+        for index, i in enumerate(enabled):
+            part = names[i]
+            submodel = ldraw_mpd.submodel_key(keys, part)
+            if submodel in self.building:
                 continue
 
-            if line[0] == '1':
-                line = line.split()
-                part = ' '.join(line[14:])
+            color_code = ldraw_parser.color_token(ldraw_file.ref_color[i])
+            # to allow group colors penetrating through sub files
+            if color_code == '16':
+                color_code = color_group
 
-                color_code = line[1]
-                # to allow group colors penetrating through sub files
-                if color_code == '16':
-                    color_code = color_group
+            # submodels are always visited, they might have changed even if the reference didn't
+            output = None
+            if submodel is not None:
+                output = self.build_submodel(subfiles, color_code, submodel, geo_node)
 
-                if '.dat' in part or '.DAT' in part:
-                    output = self.static_helper.place_part(color_code, part, geo_node)
-                else:
-                    t_list = self.build_mpd_model(subfiles, color_code, part, geo_node)
-                    m = geo_node.createNode('merge', 'merge1')
-                    for t in t_list:
-                        m.setNextInput(t)
-                    output = m
+            t = None
+            if reuse[index] >= 0:
+                t = geo_node.node(previous_lines[reuse[index]][1])
 
-                m4 = ldraw.get_matrix(line)
-                t = self.static_helper.transform_part(output, m4, geo_node)
-                t_list_master.append(t)
+            if t is None:
+                if output is None:
+                    output = self.static_helper.place_part(color_code, part, geo_node)
+                t = self.static_helper.transform_part(output, translate[i], rotate[i], scale[i], geo_node)
+            else:
+                # the same line can change between part and submodel when a subfile is added to or removed from the mpd file
+                if output is None and not self.static_helper.is_material(t.input(0)):
+                    output = self.static_helper.place_part(color_code, part, geo_node)
+                if output is not None and t.input(0) != output:
+                    self.static_helper.replace_input(t, output)
 
-        return(t_list_master)
+            t_list_master.append(t)
+            lines.append((fingerprints[index], t.name()))
 
-    def build_network(self, geo_node):
-        subfiles = self.mpd_helper.find_subfiles()
-        self.mpd_helper.build_subfiles(subfiles)
+        for index in removed:
+            t = geo_node.node(previous_lines[index][1])
+            if t is not None:
+                self.static_helper.destroy_reference(t)
 
-        # find subfile that contains the main model
-        # we assume it's the first one, but for safety we still check if there's one with 'main' in its name
-        main_subfile = next(iter(subfiles))
+        return t_list_master, lines
 
+    def build_model(self, subfiles, geo_node):
+        '''Builds or updates the network of the main model, submodels that aren't used anymore are removed.'''
+        # models can only reference parts, so the embedded parts don't need to be scanned
+        references = []
         for key in subfiles:
-            if 'main' in key.lower():
-                main_subfile = key
-                break
+            if '.dat' not in key and '.DAT' not in key:
+                references.extend(self.parse_subfile(subfiles, key).ref_names())
+        self.static_helper.prefetch_parts(references)
+
+        # find subfile that contains the main model
+        main_subfile = self.mpd_helper.main_subfile(subfiles)
 
         # build model
-        t_list_master = self.build_mpd_model(subfiles, '16', main_subfile, geo_node)
+        last_node = self.build_submodel(subfiles, '16', main_subfile, geo_node)
 
-        last_node = geo_node.createNode('merge', 'merge1')
-        for t in t_list_master:
-            last_node.setNextInput(t)
+        for entry in self.previous.values():
+            m = geo_node.node(entry['merge'])
+            if m is None:
+                continue
+            for t in m.inputs():
+                if t is not None:
+                    self.static_helper.destroy_reference(t)
+            m.destroy()
 
+        self.save_state(geo_node)
         return last_node
 
-class ldrawModelLdr(ldrawModel):
+class ldrawModelMpd(ldrawModelStatic):
+    def build_network(self, geo_node):
+        with self.mpd_helper.find_subfiles() as subfiles:
+            self.mpd_helper.build_subfiles(subfiles, geo_node)
+            return self.build_model(subfiles, geo_node)
+
+class ldrawModelLdr(ldrawModelStatic):
+    def build_network(self, geo_node):
+        # an ldr file reads as an mpd file with a single subfile, other ldr files it references are loaded as parts
+        with self.mpd_helper.find_subfiles() as subfiles:
+            return self.build_model(subfiles, geo_node)
+
+class ldrawModelCompact(ldrawModel):
+    '''
+    Static import that scales with the number of unique parts instead of the number of bricks.
+    There is one part sop per part and one color sop per part/color pair, copied onto a single point cloud of all bricks.
+    '''
     def __init__(self, file, context_node=None):
         super().__init__(file, context_node)
+        self.mpd_helper = LdrawMpdHelper(self)
         self.static_helper = LdrawStaticHelper(self)
+        self.instance_helper = LdrawInstanceHelper(self)
+
+    def build_instance_points(self, geo_node):
+        '''Creates the python sop that creates one point per brick.'''
+        points = geo_node.createNode('python', 'instance_points')
+        code = (
+            'import ldraw_model\n'
+            'from pathlib import Path\n'
+            '\n'
+            'node = hou.pwd()\n'
+            'load_instances = ldraw_model.ldrawModelInstances(Path({0!r}), node)\n'
+            'load_instances()'
+        ).format(str(self.file))
+        points.parm('python').set(code)
+        return points
 
-    def build_ldr_model(self, geo_node):
-        '''Builds a model from an ldr file.'''
-        t_list_master = []
+    def build_network(self, geo_node):
+        with self.mpd_helper.find_subfiles() as subfiles:
+            if self.file.suffix == '.mpd':
+                self.mpd_helper.build_subfiles(subfiles, geo_node)
+            instances = self.instance_helper.collect_instances(subfiles)
 
-        with open(self.file) as f:
-            for line in f:
-                line = line.split()
+        self.static_helper.prefetch_parts(instances.parts)
 
-                if len(line) < 3:
-                    continue
+        points = self.build_instance_points(geo_node)
+        last_node = geo_node.createNode('merge', 'merge1')
 
-                if line[0] == '1':
-                    part = ' '.join(line[14:])
+        variants = dict()
+        for part, code in zip(instances.parts, instances.colors.tolist()):
+            color_code = ldraw_parser.color_token(code)
+            variant = self.instance_helper.variant(part, color_code)
+            if variant in variants:
+                continue
 
-                    color_code = line[1]
-                    output = self.static_helper.place_part(color_code, part, geo_node)
+            material_sop = self.static_helper.place_part(color_code, part, geo_node)
+            if ldraw.compact_instancing() and part not in self.instance_helper.primitives:
+                # the primitives it instances are copied onto points of their own
+                self.static_helper.create_part(part, geo_node).setUserData('ldraw_instance', '1')
 
-                    m4 = ldraw.get_matrix(line)
-                    t = self.static_helper.transform_part(output, m4, geo_node)
-                    t_list_master.append(t)
+            copy = geo_node.createNode('copytopoints', 'copy_{0}'.format(variant))
+            copy.setInput(0, material_sop, 0)
+            copy.setInput(1, points, 0)
+            copy.parm('targetgroup').set('@variant={0}'.format(variant))
+            # the points only carry the transform, attributes come from the part
+            copy.parm('targetattribs').set(0)
+            last_node.setNextInput(copy)
 
-        return(t_list_master)
+            variants[variant] = copy
 
-    def build_network(self, geo_node):
-        # build model       
-        t_list_master = self.build_ldr_model(geo_node)
+        return last_node
 
-        last_node = geo_node.createNode('merge', 'merge1')
-        for t in t_list_master:
-            last_node.setNextInput(t)
+class ldrawModelInstances():
+    '''Python sop of the compact import, creates one point per brick with the transform and the variant that gets copied onto it.'''
+    def __init__(self, file, node):
+        self.file = file
+        self.mpd_helper = LdrawMpdHelper(self)
+        # the embedded parts were stored by the import, the sop only resolves through them
+        self.mpd_helper.overlay = ldraw.model_overlay(node)
+        self.instance_helper = LdrawInstanceHelper(self)
+        self.geo = node.geometry()
 
-        return last_node
+    def __call__(self):
+        metrics = ldraw.begin_metrics('instances', self.file.stem)
+        try:
+            self.build_points()
+        finally:
+            ldraw.end_metrics(metrics, self.geo)
+
+    def build_points(self):
+        self.geo.addAttrib(hou.attribType.Point, 'variant', '')
+        self.geo.addAttrib(hou.attribType.Point, 'transform', (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0))
+
+        instances = self.instance_helper.collect_instances()
+        if not len(instances):
+            return
+
+        # transform to houdini coord sys
+        matrices = ldraw.matrices_to_houdini(instances.matrices)
+        variants = [self.instance_helper.variant(part, ldraw_parser.color_token(code)) for part, code in zip(instances.parts, instances.colors.tolist())]
+
+        with ldraw_metrics.stage('geometry'):
+            self.geo.createPoints(matrices[:, 3, :3].tolist())
+        ldraw_metrics.count('points_created', len(matrices))
+        self.geo.setPointFloatAttribValues('transform', matrices[:, :3, :3].ravel().tolist())
+        self.geo.setPointStringAttribValues('variant', variants)
+
+def dynamic_part_name(part):
+    '''Returns the name a part point of the dynamic import gets and if it's a part or a subcomponent.'''
+    part = part.replace('s\\', '').replace('s/', '').replace('8\\', '').replace('8/', '').replace('48\\', '').replace('48/', '')
+
+    part_name = part.lower()
+    isdat = '.dat' in part_name
+    if isdat:
+        part_name = part_name.replace('.dat', '').replace(' ', '')
+
+    return part_name, isdat
 
 class ldrawModelDynamicShelf(ldrawModel):
+    def __init__(self, file, context_node=None):
+        super().__init__(file, context_node)
+        self.mpd_helper = LdrawMpdHelper(self)
+
     def build_network(self, geo_node):
         last_node = geo_node.createNode('brickini_ldraw_model', 'bldm_' + self.main_model_name)
         last_node.parm('ldrawfile').set(str(self.file))
+        self.prefetch_parts(last_node)
 
         return last_node
 
+    def prefetch_parts(self, node):
+        '''
+        Compiles all parts of the model in parallel while it gets imported, the hda never starts the worker processes while it cooks.
+        The embedded parts are stored for that first, the hda stores them again when it cooks, which leaves unchanged files alone.
+        '''
+        with self.mpd_helper.find_subfiles() as subfiles:
+            if self.file.suffix == '.mpd':
+                self.mpd_helper.build_subfiles(subfiles, node)
+            with ldraw_metrics.stage('flatten'):
+                model = ldraw_mpd.LdrawMpdFlattener(subfiles).flatten(self.mpd_helper.main_subfile(subfiles))
+
+        parts = dict()
+        for part in model.parts:
+            part_name, isdat = dynamic_part_name(part)
+            if isdat:
+                parts[part_name] = None
+
+        # the parts are loaded with the logo setting of the hda
+        logo_parm = node.parm('logo')
+        logo = logo_parm.eval() if logo_parm is not None else 1
+        ldraw.prefetch_parts(list(parts), (0, logo, 1, 1, 1), self.mpd_helper.overlay)
+
 class ldrawModelDynamic():
     def __init__(self, file, node):
         self.mpd_helper = LdrawMpdHelper(self)
         self.file = file
         self.file_type = file.suffix
 
-        self.color_dict = ldraw.color_lib()
-        self.material_group = ldraw.material_group()
+        self.color_table = ldraw.color_table()
 
+        self.node = node
         self.geo = node.geometry()
 
-        self.unofficial_file_rewrite = False
-
-    def transform_part_point(self, pt, m4):
-        '''Transforms the part according to the ldraw matrix and adjusts for the houdini coord sys.'''
-        m4_part = ldraw.xform_to_houdini()
-        m4 = m4_part.inverted() * m4 * m4_part
-
-        pt.setAttribValue("xform", m4.asTuple())
-
-    def create_part_point(self, color_code, part, m4):
-        '''Creates a point representing a part.'''
-
-        part_name = part.lower()
-        isdat = '.dat' in part_name
-        if isdat:
-            part_name = part_name.replace('.dat', '').replace('.DAT', '')
-            part_name = part_name.replace(' ', '')
-
-        part_point = self.geo.createPoint()
-        material_type = self.material_group.index(self.color_dict[color_code]["category"])
-
-        point_type = "part" if isdat else "subcomponent"
-        part_point.setAttribValue("type", point_type)
-        part_point.setAttribValue('part', part_name)
-        part_point.setAttribValue('Cd', self.color_dict[color_code]["rgb"])
-        part_point.setAttribValue('color_code', int(color_code))
-        part_point.setAttribValue('material_type', material_type)
-
-        self.transform_part_point(part_point, m4)
+    def read_model_points(self, subfiles):
+        '''
+        Reads all part references of the model into flat lists, one entry per point.
+        In mpd files only the references inside of submodels are read, a reference to a submodel becomes a subcomponent point
+        that the hda assembles from the points with its modelname.
+        The lines come from the reader the subfiles were indexed with, so the file isn't read a second time.
+        Returns part names, point types, color codes, matrices in ldraw space and model names.
+        '''
+        parts = []
+        types = []
+        colors = []
+        values = []
+        model_names = []
+
+        model_name = ""
+        for line_type, lineparts in subfiles.file_records():
+            if line_type == '0' and lineparts[1] == 'FILE':
+                model_name = ' '.join(lineparts[2:]).lower()
+
+            # we only look for file references inside subcomponents in mpd files.
+            if self.file_type == '.mpd' and 'ldr' not in model_name:
+                continue
 
-        return part_point
+            if line_type == '1' and len(lineparts) >= 15:
+                part_name, isdat = dynamic_part_name(' '.join(lineparts[14:]))
+
+                parts.append(part_name)
+                types.append("part" if isdat else "subcomponent")
+                colors.append(ldraw_parser.color_code(lineparts[1]))
+                values.append(lineparts[2:14])
+                model_names.append(model_name.replace('.dat', '').replace('.DAT', ''))
+
+        return parts, types, np.array(colors, dtype=np.int64), ldraw.matrices_from_values(values), model_names
+
+    def read_mpd_points(self, subfiles):
+        '''
+        Flattens all submodels of an mpd file, so every point is a part placed in world space.
+        The points belong to the main model, as if all parts were placed there directly.
+        The hda doesn't need to assemble subcomponents then, but the points lose the submodel they belong to, see flatten_mpd().
+        '''
+        main_subfile = self.mpd_helper.main_subfile(subfiles)
+        with ldraw_metrics.stage('flatten'):
+            model = ldraw_mpd.LdrawMpdFlattener(subfiles).flatten(main_subfile)
+
+        parts = []
+        types = []
+        for part in model.parts:
+            part_name, isdat = dynamic_part_name(part)
+            parts.append(part_name)
+            types.append("part" if isdat else "subcomponent")
+
+        model_name = main_subfile.lower().strip().replace('.dat', '')
+        return parts, types, model.colors, model.matrices, [model_name] * len(parts)
+
+    def flatten_mpd(self):
+        '''
+        Returns 1 if the points of an mpd file are flattened to world space.
+        It's off by default, the hda assembles the subcomponents of a model by their modelname.
+        It can be turned on with a flatten_mpd spare parm on the hda or for all of them with LDRAW_FLATTEN_MPD.
+        '''
+        flatten_parm = self.node.parent().parm('flatten_mpd')
+        if flatten_parm is not None:
+            return flatten_parm.eval()
+        return int(hou.getenv('LDRAW_FLATTEN_MPD', '0'))
+
+    def build_model_points(self, subfiles=None):
+        '''Creates one point per reference, subfiles is the open reader of the file or None to open it here.'''
+        if subfiles is None:
+            with self.mpd_helper.find_subfiles() as subfiles:
+                return self.build_model_points(subfiles)
 
-    def build_model_points(self):        
         self.geo.addAttrib(hou.attribType.Point, "type", "")
         self.geo.addAttrib(hou.attribType.Point, "part", "")
         self.geo.addAttrib(hou.attribType.Point, "Cd", hou.Vector3(1.0, 1.0, 1.0))
@@ -352,41 +761,65 @@ class ldrawModelDynamic():
         self.geo.addAttrib(hou.attribType.Point, 'color_code', 0)
         self.geo.addAttrib(hou.attribType.Point, 'material_type', 0)
 
-        pattern = re.compile(r"0 FILE (.+)$") 
-
-        with open(self.file) as f:
-            model_name = ""
-            for line in f:
-                lineparts = line.split()
-
-                if len(line) < 3:
-                    continue
+        if self.file_type == '.mpd' and self.flatten_mpd():
+            parts, types, codes, matrices, model_names = self.read_mpd_points(subfiles)
+        else:
+            parts, types, codes, matrices, model_names = self.read_model_points(subfiles)
 
-                match = re.search(pattern, line)
-                if match:
-                    model_name = match.group(1).lower().strip()
+        if not parts:
+            return
 
-                # we only look for file references inside subcomponents in mpd files.
-                if self.file_type == '.mpd' and 'ldr' not in model_name:
-                    continue
+        # color and material come straight from the dense arrays of the color table
+        with ldraw_metrics.stage('colors'):
+            rgb, material_type, valid = self.color_table.lookup(codes)
+            material_type = np.where(valid, material_type, 0)
 
-                if line[0] == '1':
-                    part = ' '.join(lineparts[14:])
-                    part = part.replace('s\\', '').replace('s/', '').replace('8\\', '').replace('8/', '').replace('48\\', '').replace('48/', '')
+        with ldraw_metrics.stage('geometry'):
+            # the points stay at the origin, they are placed by their xform
+            self.geo.createPoints(np.zeros((len(parts), 3)).tolist())
 
-                    color_code = lineparts[1]
-                    m4 = ldraw.get_matrix(lineparts)
-                    point = self.create_part_point(color_code, part, m4)
-                    model_name = model_name.replace('.dat', '').replace('.DAT', '')
-                    point.setAttribValue("modelname", model_name)
+            self.geo.setPointStringAttribValues("type", types)
+            self.geo.setPointStringAttribValues("part", parts)
+            self.geo.setPointFloatAttribValues("Cd", rgb.ravel().tolist())
+            self.geo.setPointIntAttribValues('color_code', codes.tolist())
+            self.geo.setPointIntAttribValues('material_type', material_type.tolist())
+            self.geo.setPointStringAttribValues("modelname", model_names)
+            self.geo.setPointFloatAttribValues("xform", ldraw.matrices_to_houdini(matrices).ravel().tolist())
+        ldraw_metrics.count('points_created', len(parts))
 
-    def __call__(self):  
-        if self.file_type == '.mpd':
-            subfiles = self.mpd_helper.find_subfiles()
-            self.mpd_helper.build_subfiles(subfiles)
+    def __call__(self):
+        metrics = ldraw.begin_metrics('model', self.file.stem)
+        try:
+            self.build()
+        finally:
+            ldraw.end_metrics(metrics, self.geo)
 
+    def build(self):
         # build model
-        self.build_model_points()
+        with self.mpd_helper.find_subfiles() as subfiles:
+            if self.file_type == '.mpd':
+                self.mpd_helper.build_subfiles(subfiles, ldraw.brickini_node(self.node))
+            self.build_model_points(subfiles)
+
+        ldraw.record_dependencies(self.node, [self.file, self.color_table.path])
+
+def reload_model(geo_node):
+    '''
+    Updates the network of a static import from its file, only the references that changed since the last import are rebuilt.
+    Returns False if the geo node wasn't built by a static import.
+    '''
+    data = geo_node.userData(ldrawModelStatic.state_name)
+    if not data:
+        return False
+
+    file = Path(json.loads(data)['file'])
+    if file.suffix == '.mpd':
+        load_model = ldrawModelMpd(file, geo_node=geo_node)
+    else:
+        load_model = ldrawModelLdr(file, geo_node=geo_node)
+
+    load_model()
+    return True
 
 def main(mode=0, context_node=None):
     if context_node is None:
@@ -398,7 +831,9 @@ def main(mode=0, context_node=None):
     
     file_type = file.suffix
 
-    if file_type == '.mpd' and mode != 1:
+    if (file_type == '.mpd' or file_type == '.ldr' or file_type == '.l3b') and mode == 2:
+        load_model = ldrawModelCompact(file, context_node)
+    elif file_type == '.mpd' and mode != 1:
         load_model = ldrawModelMpd(file, context_node)
     elif (file_type == '.ldr' or file_type == '.l3b') and mode != 1:
         load_model = ldrawModelLdr(file, context_node)
@@ -409,5 +844,7 @@ def main(mode=0, context_node=None):
     else:
         hou.ui.displayMessage('Please choose one of the following file types: ldr, l3b or mpd', buttons=('OK',), severity=hou.severityType.Error, default_choice=0, close_choice=-1, title='Wrong File Type', )
         return
-    
+
+    # pick up files that were added to the library since the index was checked
+    ldraw.library_index(refresh=True)
     load_model()
\ No newline at end of file
@@ -0,0 +1,291 @@
+'''
+Houdini independent reading and flattening of mpd files.
+LdrawMpdReader indexes the 0 FILE blocks of a memory mapped file in one pass and reads subfiles lazily.
+LdrawMpdFlattener resolves the submodels into one list of parts with world matrices in ldraw space.
+Every submodel is only flattened once, references to it just transform its part list.
+'''
+import hashlib
+import mmap
+import os
+import re
+from collections import defaultdict, deque
+from collections.abc import Mapping
+import numpy as np
+import ldraw_parser
+
+# a 0 FILE line, the name may contain spaces
+FILE_PATTERN = re.compile(rb'^[ \t]*0[ \t]+FILE[ \t]+(\S[^\r\n]*)', re.MULTILINE)
+
+# subfiles are decoded in chunks of this size, so reading a huge subfile never holds more than one chunk as text
+CHUNK_SIZE = 1 << 20
+
+def is_part(name):
+    return '.dat' in name.lower()
+
+def subfile_keys(subfiles):
+    '''returns a dict of lowercase subfile names and their keys, ldraw names are case insensitive'''
+    return {key.lower(): key for key in subfiles}
+
+def submodel_key(keys, name):
+    '''returns the subfile key of a submodel reference or None if it's a part'''
+    if is_part(name):
+        return None
+    return keys.get(name.lower())
+
+def ref_fingerprints(ldraw_file):
+    '''returns a fingerprint of every type 1 line of an LdrawFile, it changes with the referenced name, color or matrix'''
+    fingerprints = []
+    for name, color, matrix in zip(ldraw_file.ref_names(), ldraw_file.ref_color.tolist(), ldraw_file.ref_matrix):
+        h = hashlib.blake2b(digest_size=8)
+        h.update(name.lower().encode('utf-8'))
+        h.update(color.to_bytes(8, 'little', signed=True))
+        h.update(matrix.tobytes())
+        fingerprints.append(h.hexdigest())
+    return fingerprints
+
+def match_fingerprints(previous, current):
+    '''
+    matches the fingerprints of a new parse against the ones of the previous parse
+    returns the index into previous every current entry can reuse or -1 if it's new, and the previous indices that are gone
+    duplicates are matched in order, so unchanged lines always keep their counterpart
+    '''
+    available = defaultdict(deque)
+    for i, fingerprint in enumerate(previous):
+        available[fingerprint].append(i)
+
+    reuse = []
+    for fingerprint in current:
+        candidates = available.get(fingerprint)
+        reuse.append(candidates.popleft() if candidates else -1)
+
+    removed = sorted(i for candidates in available.values() for i in candidates)
+    return reuse, removed
+
+def same_content(path, lines):
+    '''checks if a file holds exactly the given lines, they are compared one by one without reading the file in one go'''
+    try:
+        with open(path, 'r') as f:
+            for line in lines:
+                if f.readline() != line:
+                    return False
+            return f.read(1) == ''
+    except (OSError, UnicodeDecodeError):
+        return False
+
+def write_subfile(path, lines):
+    '''
+    writes an embedded subfile, returns False if the file already has the same content
+    lines can be any iterable that can be iterated twice, like an LdrawSubfile, they are streamed to the file
+    unchanged files aren't touched, so the library index doesn't have to rescan their folder
+    '''
+    if same_content(path, lines):
+        return False
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # write to a temp file first so other sessions never read a half written file
+    temp_file = path.with_name('{}.{}.tmp'.format(path.name, os.getpid()))
+    with open(temp_file, 'w') as f:
+        f.writelines(lines)
+    os.replace(temp_file, path)
+    return True
+
+class LdrawSubfile:
+    '''lazy view of one 0 FILE block, it can be iterated any number of times'''
+    def __init__(self, reader, start, end):
+        self.reader = reader
+        self.start = start
+        self.end = end
+
+    def __iter__(self):
+        for tokens in self.tokens():
+            yield ' '.join(tokens) + '\n'
+
+    def tokens(self):
+        '''yields the tokens of every line, the parser takes them without joining them into lines again'''
+        for line_type, tokens in self.reader.records(self.start, self.end):
+            # subfile references may contain spaces, they are removed like in the subfile names
+            if len(tokens) > 15:
+                tokens[14:] = [''.join(tokens[14:])]
+            yield tokens
+
+def parse_subfile(lines):
+    '''parses the lines of a subfile, an LdrawSubfile hands its tokens to the parser directly'''
+    if isinstance(lines, LdrawSubfile):
+        return ldraw_parser.parse_tokens(lines.tokens())
+    return ldraw_parser.parse_lines(lines)
+
+class LdrawMpdReader(Mapping):
+    '''
+    Read only mapping of subfile names to LdrawSubfile views of a memory mapped ldraw file.
+    The file is scanned once for 0 FILE lines, only their byte offsets are kept.
+    Names have their spaces removed, if a name is used twice the last block wins.
+    A file without 0 FILE lines, like an ldr file, is a single subfile named after the file.
+    Subfiles only contain type 0, 1, 3 and 4 lines with at least 3 tokens.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.offsets = {}
+
+        with open(path, 'rb') as f:
+            try:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty files can't be mapped
+                self.data = b''
+
+        starts = []
+        for match in FILE_PATTERN.finditer(self.data):
+            name = ''.join(match.group(1).decode('utf-8', 'replace').split())
+            starts.append((name, match.start()))
+
+        if not starts:
+            starts.append((os.path.basename(path), 0))
+
+        ends = [start for _, start in starts[1:]] + [len(self.data)]
+        for (name, start), end in zip(starts, ends):
+            # keep the order of first appearance like a dict that got overwritten
+            self.offsets[name] = (start, end)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getitem__(self, name):
+        start, end = self.offsets[name]
+        return LdrawSubfile(self, start, end)
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def lines(self, start, end):
+        '''yields the decoded lines between two byte offsets, without line endings'''
+        pos = start
+        while pos < end:
+            stop = min(pos + CHUNK_SIZE, end)
+            if stop < end:
+                # chunks end after a line break, lines longer than a chunk extend it
+                newline = self.data.rfind(b'\n', pos, stop)
+                if newline == -1:
+                    newline = self.data.find(b'\n', stop, end)
+                stop = end if newline == -1 else newline + 1
+
+            for line in self.data[pos:stop].decode('utf-8', 'replace').split('\n'):
+                yield line
+            pos = stop
+
+    def file_records(self):
+        '''yields the records of the whole file in one pass, including the lines before the first 0 FILE line'''
+        return self.records(0, len(self.data))
+
+    def records(self, start, end):
+        '''yields (line type, tokens) of every type 0, 1, 3 and 4 line between two byte offsets'''
+        for line in self.lines(start, end):
+            tokens = line.split()
+            if len(tokens) < 3:
+                continue
+            if tokens[0] in ('0', '1', '3', '4'):
+                yield tokens[0], tokens
+
+class LdrawFlatModel:
+    '''
+    Flattened parts of a model.
+    parts: referenced part names, in file order with submodels expanded in place
+    colors: (N,) int64 color codes, 16 is left for the referencing model to resolve
+    matrices: (N, 4, 4) float64 matrices relative to the model, see ldraw_parser.matrices_from_values
+    submodels: name of the submodel each part is placed in
+    '''
+    def __init__(self, parts, colors, matrices, submodels):
+        self.parts = parts
+        self.colors = colors
+        self.matrices = matrices
+        self.submodels = submodels
+
+    def __len__(self):
+        return len(self.parts)
+
+    def transformed(self, matrix, color):
+        '''returns a copy placed with a reference matrix, color 16 inherits the color of the reference'''
+        colors = np.where(self.colors == 16, color, self.colors)
+        return LdrawFlatModel(self.parts, colors, self.matrices @ matrix, self.submodels)
+
+def concatenate(models):
+    models = [model for model in models if len(model)]
+    if not models:
+        return LdrawFlatModel([], np.zeros(0, dtype=np.int64), np.zeros((0, 4, 4)), [])
+
+    parts = []
+    submodels = []
+    for model in models:
+        parts.extend(model.parts)
+        submodels.extend(model.submodels)
+
+    colors = np.concatenate([model.colors for model in models])
+    matrices = np.concatenate([model.matrices for model in models])
+    return LdrawFlatModel(parts, colors, matrices, submodels)
+
+class LdrawMpdFlattener:
+    '''
+    Flattens the subfiles of an mpd file, a mapping of names and their lines like LdrawMpdReader.
+    Flattened submodels are memoised with color 16 unresolved, so the cost scales with the unique submodels and not with how often they are used.
+    References to parts, to embedded .dat files and to files that aren't in the mpd are kept as parts.
+    '''
+    def __init__(self, subfiles):
+        self.subfiles = subfiles
+        self.keys = subfile_keys(subfiles)
+        self.models = {}
+        self.stack = set()
+
+    def flatten(self, key):
+        '''returns the LdrawFlatModel of a subfile'''
+        model = self.models.get(key)
+        if model is not None:
+            return model
+
+        # a model that references itself would never finish, the reference is dropped
+        self.stack.add(key)
+
+        ldraw_file = parse_subfile(self.subfiles[key])
+        matrices = ldraw_parser.matrices_from_values(ldraw_file.ref_matrix)
+        enabled = (ldraw_file.ref_flags & ldraw_parser.REF_DISABLED) == 0
+
+        names = ldraw_file.ref_names()
+        chunks = []
+        part_index = []
+
+        def flush():
+            # consecutive parts are added as one chunk
+            if part_index:
+                index = np.array(part_index)
+                chunks.append(LdrawFlatModel([names[i] for i in part_index], ldraw_file.ref_color[index], matrices[index], [key] * len(part_index)))
+                part_index.clear()
+
+        for i, name in enumerate(names):
+            # commented out logo lines are only relevant for parts
+            if not enabled[i]:
+                continue
+
+            submodel = submodel_key(self.keys, name)
+            if submodel is None:
+                part_index.append(i)
+                continue
+
+            flush()
+            if submodel in self.stack:
+                continue
+            chunks.append(self.flatten(submodel).transformed(matrices[i], ldraw_file.ref_color[i]))
+
+        flush()
+        self.stack.discard(key)
+
+        model = concatenate(chunks)
+        self.models[key] = model
+        return model
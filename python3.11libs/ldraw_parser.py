@@ -0,0 +1,260 @@
+'''
+Houdini independent ldraw parser.
+Turns an ldraw file into compact numpy arrays so it can be used, benchmarked and tested without hou.
+'''
+import os
+import itertools
+import numpy as np
+import ldraw_metrics
+
+# bfc state of a type 3/4 line, relative to the winding the file gets read with
+BFC_INHERIT = 0 # winding of the referencing file
+BFC_INVERT = 1 # 0 BFC CERTIFY CW, inverts the inherited winding
+BFC_CW = 2 # 0 BFC CW
+BFC_CCW = 3 # 0 BFC CCW
+
+# coordinate tokens are converted to float64 in blocks of this many values, so the tokens of a huge file are never held all at once
+VALUE_BLOCK = 1 << 16
+
+# flags of type 1 references
+REF_INVERTNEXT = 1 # preceded by 0 BFC INVERTNEXT
+REF_DISABLED = 2 # commented out logo reference like '0 // 1 16 ... logo.dat', it's swapped to logo4.dat
+
+def color_code(token):
+    '''
+    converts a color token to an int
+    direct colors like 0x2995220 keep their hex value, so they can be recognized with is_direct_color()
+    '''
+    if token[:2] in ('0x', '0X'):
+        return int(token, 16)
+    return int(token)
+
+def is_direct_color(code):
+    return code >= 0x2000000
+
+def color_token(code):
+    '''converts a color code back to the token used in ldraw files'''
+    if is_direct_color(code):
+        return '0x{:07X}'.format(code)
+    return str(code)
+
+def matrices_from_values(values):
+    '''
+    converts the (N, 12) values of type 1 lines into (N, 4, 4) matrices for row vectors
+    the 3x3 part is transposed, so points are transformed with points @ m[:3, :3] + m[3, :3]
+    '''
+    values = np.asarray(values, dtype=np.float64).reshape(-1, 12)
+    m4 = np.zeros((len(values), 4, 4))
+    m4[:, :3, :3] = values[:, 3:12].reshape(-1, 3, 3).transpose(0, 2, 1)
+    m4[:, 3, :3] = values[:, 0:3]
+    m4[:, 3, 3] = 1.0
+    return m4
+
+def flip_winding(winding):
+    if winding == 'CCW':
+        return 'CW'
+    return 'CCW'
+
+def face_winding(bfc_state, winding):
+    '''returns the winding of a type 3/4 line in a file that is read with the given winding'''
+    if bfc_state == BFC_INVERT:
+        return flip_winding(winding)
+    elif bfc_state == BFC_CW:
+        return 'CW'
+    elif bfc_state == BFC_CCW:
+        return 'CCW'
+    return winding
+
+class LdrawFile:
+    '''
+    Struct of arrays representation of one ldraw file.
+
+    title: text of the first line without the line type
+    names: interned names of all referenced files
+    ref_matrix: (N, 12) float64 values of type 1 lines in ldraw order (x y z a b c d e f g h i)
+    ref_color: (N,) int64 color codes of type 1 lines
+    ref_name: (N,) int32 index into names
+    ref_flags: (N,) uint8 REF_ flags
+    face_points: (V, 3) float64 corners of all type 3 and 4 lines in file order
+    face_sizes: (F,) uint8 3 for tris, 4 for quads
+    face_color: (F,) int64 color codes
+    face_bfc: (F,) uint8 BFC_ state
+    line_points: (2 * L, 3) float64 end points of type 2 lines
+    line_color: (L,) int64 color codes
+    '''
+    def __init__(self, title, names, ref_matrix, ref_color, ref_name, ref_flags, face_points, face_sizes, face_color, face_bfc, line_points, line_color):
+        self.title = title
+        self.names = names
+        self.ref_matrix = ref_matrix
+        self.ref_color = ref_color
+        self.ref_name = ref_name
+        self.ref_flags = ref_flags
+        self.face_points = face_points
+        self.face_sizes = face_sizes
+        self.face_color = face_color
+        self.face_bfc = face_bfc
+        self.line_points = line_points
+        self.line_color = line_color
+
+        # start of each face in face_points
+        self.face_offsets = np.zeros(len(face_sizes), dtype=np.int64)
+        if len(face_sizes):
+            self.face_offsets[1:] = np.cumsum(face_sizes[:-1], dtype=np.int64)
+
+    def ref_names(self):
+        '''returns the referenced name of every type 1 line'''
+        return [self.names[i] for i in self.ref_name]
+
+    def nbytes(self):
+        arrays = (self.ref_matrix, self.ref_color, self.ref_name, self.ref_flags, self.face_points, self.face_sizes, self.face_color, self.face_bfc, self.line_points, self.line_color)
+        return sum(a.nbytes for a in arrays)
+
+def parse_lines(lines):
+    '''parses an iterable of ldraw lines into an LdrawFile'''
+    lines = iter(lines)
+    first = next(lines, '')
+    title = first.split(' ', 1)[-1].rstrip('\r\n')
+    return parse_tokens(itertools.chain((first.split(),), map(str.split, lines)), title)
+
+def parse_tokens(records, title=None):
+    '''
+    parses an iterable of token lists, lines that are already split at whitespace, into an LdrawFile
+    the title defaults to the tokens of the first line without the line type
+    coordinates are converted in blocks while parsing, see VALUE_BLOCK
+    '''
+    names = []
+    name_ids = {}
+    color_codes = {}
+
+    ref_values = []
+    ref_blocks = []
+    ref_colors = []
+    ref_names = []
+    ref_flags = []
+
+    face_values = []
+    face_blocks = []
+    face_sizes = []
+    face_colors = []
+    face_bfc = []
+
+    line_values = []
+    line_blocks = []
+    line_colors = []
+
+    bfc_state = BFC_INHERIT
+    pending_flags = 0
+
+    for i, tokens in enumerate(records):
+        if i == 0 and title is None:
+            title = ' '.join(tokens[1:])
+
+        if len(tokens) < 3:
+            continue
+
+        line_type = tokens[0]
+
+        # meta: checking for winding order and inversion
+        if line_type == '0':
+            if tokens[1] == 'BFC':
+                if tokens[2] == 'CERTIFY':
+                    if len(tokens) > 3 and tokens[3] == 'CW':
+                        bfc_state = BFC_INVERT
+                elif tokens[2] == 'CW':
+                    bfc_state = BFC_CW
+                elif tokens[2] == 'CCW':
+                    bfc_state = BFC_CCW
+                elif tokens[2] == 'INVERTNEXT':
+                    pending_flags |= REF_INVERTNEXT
+
+            # deactivated logo line, it's up to the consumer to use it
+            elif tokens[2] == '1' and len(tokens) >= 17 and 'logo' in tokens[-1]:
+                tokens = tokens[2:]
+                tokens[-1] = 'logo4.dat'
+                pending_flags |= REF_DISABLED
+                line_type = '1'
+            else:
+                continue
+
+        if line_type == '1':
+            if len(tokens) < 15:
+                continue
+            name = ' '.join(tokens[14:])
+            name_id = name_ids.get(name)
+            if name_id is None:
+                name_id = name_ids[name] = len(names)
+                names.append(name)
+
+            ref_values.extend(tokens[2:14])
+            if len(ref_values) >= VALUE_BLOCK:
+                ref_blocks.append(np.array(ref_values, dtype=np.float64))
+                ref_values.clear()
+            ref_colors.append(tokens[1])
+            ref_names.append(name_id)
+            ref_flags.append(pending_flags)
+            pending_flags = 0
+
+        elif line_type == '3' or line_type == '4':
+            size = int(line_type)
+            if len(tokens) < 2 + size * 3:
+                continue
+            face_values.extend(tokens[2:2 + size * 3])
+            if len(face_values) >= VALUE_BLOCK:
+                face_blocks.append(np.array(face_values, dtype=np.float64))
+                face_values.clear()
+            face_sizes.append(size)
+            face_colors.append(tokens[1])
+            face_bfc.append(bfc_state)
+
+        elif line_type == '2':
+            if len(tokens) < 8:
+                continue
+            line_values.extend(tokens[2:8])
+            if len(line_values) >= VALUE_BLOCK:
+                line_blocks.append(np.array(line_values, dtype=np.float64))
+                line_values.clear()
+            line_colors.append(tokens[1])
+
+    def to_values(blocks, values, columns):
+        blocks.append(np.array(values, dtype=np.float64))
+        return np.concatenate(blocks).reshape(-1, columns)
+
+    def to_codes(tokens):
+        codes = np.empty(len(tokens), dtype=np.int64)
+        for i, token in enumerate(tokens):
+            code = color_codes.get(token)
+            if code is None:
+                try:
+                    code = color_code(token)
+                except ValueError:
+                    code = -1
+                color_codes[token] = code
+            codes[i] = code
+        return codes
+
+    return LdrawFile(
+        title or '',
+        names,
+        to_values(ref_blocks, ref_values, 12),
+        to_codes(ref_colors),
+        np.array(ref_names, dtype=np.int32),
+        np.array(ref_flags, dtype=np.uint8),
+        to_values(face_blocks, face_values, 3),
+        np.array(face_sizes, dtype=np.uint8),
+        to_codes(face_colors),
+        np.array(face_bfc, dtype=np.uint8),
+        to_values(line_blocks, line_values, 3),
+        to_codes(line_colors),
+    )
+
+def parse_file(path):
+    '''parses an ldraw file on disk into an LdrawFile, the file is read in one go before it gets parsed'''
+    with ldraw_metrics.stage('read'):
+        with open(path, encoding='utf-8', errors='replace') as f:
+            text = f.read()
+            size = os.fstat(f.fileno()).st_size
+    ldraw_metrics.count('files_opened')
+    ldraw_metrics.count('bytes_read', size)
+
+    with ldraw_metrics.stage('parse'):
+        return parse_lines(text.split('\n'))
@@ -1,17 +1,25 @@
 # pyright: reportMissingImports=false
-from pathlib import Path, PureWindowsPath
+from pathlib import Path
 import ldraw
-import hou
-import re
+import ldraw_parser
+import ldraw_compiler
+import ldraw_metrics
+import ldraw_headless
+import numpy as np
 import importlib
 
+hou = ldraw_headless.backend()
+
 importlib.reload(ldraw)
 
+# edge group of all ldraw lines, the bevel of the hda can use it without looking for open polygons
+EDGE_GROUP = 'ldraw_edges'
+
 class ldrawPart:
     def __init__(self, node, parms):
         self.ldraw_lib = ldraw.ldraw_lib()
-        self.color_dict = ldraw.color_lib()
-        self.material_groups = ldraw.material_group()
+        self.color_table = ldraw.color_table()
+        self.color_dict = self.color_table.colors
         self.default_color = hou.Vector3(1, 1, 1)
 
         # python sop
@@ -27,6 +35,13 @@ class ldrawPart:
         self.parm_edges = parms.get('parm_edges')
         self.parm_material_group = parms.get('parm_material_group')
         self.parm_material = parms.get('parm_material')
+        # welding isn't a parm of the hda, a weld spare parm or user data turns it on per node, see ldraw.welding
+        self.parm_weld = parms.get('parm_weld', ldraw.welding(node))
+        # instancing of primitives, see ldraw.instance_policy, the hda can't copy the primitives onto the instance points
+        # so it's only on for the part nodes of the compact import, see ldraw.instancing
+        self.parm_instance = parms.get('parm_instance', ldraw.instancing(node))
+        # embedded parts of the mpd file the node was imported from, see ldraw.mpd_overlay
+        self.overlay = ldraw.model_overlay(node)
 
         # store this geo
         self.geo = self.node.geometry()
@@ -54,419 +69,185 @@ class ldrawPart:
             self.geo.addAttrib(hou.attribType.Global, 'print', '')
             self.geo.setGlobalAttribValue('print', str(self.texture_path))
 
-        self.subpart_cache = {}
-
-    def extract_points(self, line, vertnum, winding):
-        '''extract the vert positions and put them into the correct winding order'''
-        line = line[2:]
-        line = list(map(float, line))
-        points = []
-        for i in range(vertnum):
-            points.append((line[i*3],line[i*3+1],line[i*3+2]))
-
-        # reverse point order according to winding variable
-        if winding == 'CCW':
-            if vertnum == 4:
-                points = (points[0], points[3], points[2], points[1])
-            if vertnum == 3:
-                points = (points[0], points[2], points[1])
-
-        return points
-
-    def create_lines(self, points, line_geo):
-        '''create lines from points'''
-        poly = line_geo.createPolygon()
-        for position in points:
-            point = line_geo.createPoint()
-            point.setPosition(position)
-            poly.addVertex(point)
-            poly.setIsClosed(False)
-
-        return line_geo
-
-    def create_polys(self, polys_data, part_geo):
+        if self.parm_weld:
+            self.geo.addAttrib(hou.attribType.Global, 'weld_ratio', 1.0)
+
+    def resolve_colors(self, prim_color, prim_closed):
+        '''
+        get color and material type of every primitive from the color table
+        16 is a special code, the color is determined by the referenced dat file
+        direct colors look like this: 0x2995220, they are converted manually and get color code 0
+        ldraw lines keep the attribute defaults
+        '''
+        rgb, mat_type, valid = self.color_table.lookup(prim_color)
+        mat_type = np.where(valid, mat_type, self.parm_material_group)
+        color_code = prim_color.copy()
+
+        direct = ldraw_parser.is_direct_color(prim_color)
+        for code in np.unique(prim_color[direct]):
+            rgb[prim_color == code] = ldraw.hex_to_acescg(ldraw_parser.color_token(code)[3:9])
+        color_code[direct] = 0
+
+        inherit = prim_color == 16
+        rgb[inherit] = self.color_dict[str(self.parm_material)]['rgb']
+        mat_type[inherit] = self.parm_material_group
+
+        lines = ~prim_closed
+        rgb[lines] = self.default_color
+        mat_type[lines] = self.parm_material_group
+
+        # color_mode marks all prims that have a color of their own
+        color_mode = (prim_closed & ~inherit).astype(np.int64)
+
+        return rgb, mat_type, color_code, color_mode
+
+    def create_geometry(self, mesh):
         '''
-        Batch create polygons and set attributes in bulk.
-        polys_data: list of dicts with keys: points, color, static_color, color_code, info, mat_type
+        create all points and polygons of the compiled part in one go and set attributes in bulk
+        ldraw lines are open polygons, they are created in runs to keep the primitive order
         '''
-        # Collect all data
-        all_points = []
-        polygons_indices = []
-        color_codes = []
-        infos = []
-        colors = []
-        mat_types = []
-        color_modes = []
-
-        for poly in polys_data:
-            start_idx = len(all_points)
-            all_points.extend(poly['points'])
-            polygons_indices.append(tuple(range(start_idx, start_idx + len(poly['points'])))
-            )
-            color_codes.append(int(poly['color_code']))
-            infos.append(poly['info'])
-            if not self.parm_pack:
-                colors.append(poly['color'])
-                mat_types.append(poly['mat_type'])
-            else:
-                colors.append(poly['color'])
-                mat_types.append(poly['mat_type'])
-                color_modes.append(1 if poly['static_color'] else 0)
-
-        # Create all points
-        point_objs = part_geo.createPoints(all_points)
-
-        # Create polygons using tuples of point objects
-        polygons = []
-        for poly_indices in polygons_indices:
-            polygons.append(tuple(point_objs[idx] for idx in poly_indices))
-        part_geo.createPolygons(polygons)
-
-        # Flatten colors
-        flat_colors = [f for c in colors for f in c]
-
-        # Set attributes in bulk
-        part_geo.setPrimIntAttribValues('color_code', color_codes)
-        part_geo.setPrimStringAttribValues('info', infos)
-        part_geo.setPrimFloatAttribValues(self.col_attr, flat_colors)
-        part_geo.setPrimIntAttribValues(self.mat_attr, mat_types)
-        
-        if  self.parm_pack:
-            part_geo.setPrimIntAttribValues('color_mode', color_modes)
-
-        return part_geo
-
-    def determine_winding(self, winding_group, m4, invert_next):
+        if self.parm_pack:
+            self.geo.addAttrib(hou.attribType.Prim, 'color_mode', 0)
+
+        self.geo.addAttrib(hou.attribType.Prim, self.col_attr, self.default_color)
+        self.geo.addAttrib(hou.attribType.Prim, self.mat_attr, self.parm_material_group)
+        self.geo.addAttrib(hou.attribType.Prim, 'info', '')
+        self.geo.addAttrib(hou.attribType.Prim, 'color_code', 0)
+
+        if len(mesh) == 0:
+            return
+
+        with ldraw_metrics.stage('geometry'):
+            # transform to houdini coord sys
+            m4_ldu = ldraw.houdini_basis
+            positions = mesh.points @ m4_ldu[:3, :3] + m4_ldu[3, :3]
+
+            point_objs = self.geo.createPoints(positions.tolist())
+            polygons = [tuple(point_objs[idx] for idx in poly) for poly in mesh.polygons()]
+
+            closed = mesh.prim_closed
+            runs = np.flatnonzero(closed[1:] != closed[:-1]) + 1
+            for start, end in zip(np.r_[0, runs], np.r_[runs, len(closed)]):
+                self.geo.createPolygons(polygons[start:end], bool(closed[start]))
+
+            if self.parm_edges:
+                self.create_edge_group(mesh, point_objs[0].number())
+
+        ldraw_metrics.count('points_created', len(point_objs))
+        ldraw_metrics.count('prims_created', len(polygons))
+
+        if self.parm_weld:
+            # unwelded meshes have a point per corner, so the ratio is known for cached parts as well
+            self.geo.setGlobalAttribValue('weld_ratio', len(mesh.vertices) / len(mesh.points))
+            ldraw_metrics.count('points_welded', len(mesh.vertices) - len(mesh.points))
+
+        with ldraw_metrics.stage('colors'):
+            rgb, mat_type, color_code, color_mode = self.resolve_colors(mesh.prim_color, mesh.prim_closed)
+
+        with ldraw_metrics.stage('geometry'):
+            # Set attributes in bulk
+            self.geo.setPrimIntAttribValues('color_code', color_code.tolist())
+            self.geo.setPrimStringAttribValues('info', [ldraw_compiler.INFO[i] for i in mesh.prim_info.tolist()])
+            self.geo.setPrimFloatAttribValues(self.col_attr, rgb.ravel().tolist())
+            self.geo.setPrimIntAttribValues(self.mat_attr, mat_type.tolist())
+
+            if self.parm_pack:
+                self.geo.setPrimIntAttribValues('color_mode', color_mode.tolist())
+
+    def create_instances(self, instances):
         '''
-        this function determines winding order
-        invert winding again if orientation matrix is reversed (negative determinant)
-        cancel out inversion if INVERTNEXT statement is found before subpart reference
+        creates a point for every instanced primitive, P and the 3x3 inst_transform attribute place it in houdini space
+        the attributes have an inst_ prefix, so they don't clash with the primitive attributes of the part when it gets packed or promoted
+        the names of all primitives are in the inst_prototypes detail attribute, part nodes of them can be copied onto the points
         '''
-        m4_det = m4.determinant()
-        if m4_det < 0:
-            if winding_group == 'CCW':
-                winding_group = 'CW'
-            else:
-                winding_group = 'CCW'
-
-        if invert_next == True:
-            if winding_group == 'CCW':
-                winding_group = 'CW'
-            else:
-                winding_group = 'CCW'
-        return winding_group
-    
-    def get_color(self, color_code):
+        names = [part[:-4] if part.endswith('.dat') else part for part in instances.part.tolist()]
+        self.geo.addArrayAttrib(hou.attribType.Global, 'inst_prototypes', hou.attribData.String)
+        self.geo.setGlobalAttribValue('inst_prototypes', sorted(set(names)))
+
+        with ldraw_metrics.stage('colors'):
+            rgb, mat_type, color_code, _ = self.resolve_colors(instances.color, np.ones(len(instances), dtype=bool))
+
+        col_attr = 'inst_' + self.col_attr
+        mat_attr = 'inst_' + self.mat_attr
+
+        with ldraw_metrics.stage('geometry'):
+            m4 = ldraw.houdini_matrices(instances.matrix)
+            padding = len(self.geo.points())
+            self.geo.createPoints(m4[:, 3, :3].tolist())
+
+            # bulk setters need a value for every point, the points of the polygons get the defaults
+            identity = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0]
+
+            self.geo.addAttrib(hou.attribType.Point, 'inst_name', '')
+            self.geo.addAttrib(hou.attribType.Point, 'inst_transform', tuple(identity))
+            self.geo.addAttrib(hou.attribType.Point, 'inst_color_code', 0)
+            self.geo.addAttrib(hou.attribType.Point, 'inst_info', '')
+            self.geo.addAttrib(hou.attribType.Point, col_attr, self.default_color)
+            self.geo.addAttrib(hou.attribType.Point, mat_attr, self.parm_material_group)
+
+            self.geo.setPointStringAttribValues('inst_name', [''] * padding + names)
+            self.geo.setPointFloatAttribValues('inst_transform', identity * padding + m4[:, :3, :3].ravel().tolist())
+            self.geo.setPointIntAttribValues('inst_color_code', [0] * padding + color_code.tolist())
+            self.geo.setPointStringAttribValues('inst_info', [''] * padding + [ldraw_compiler.INFO[i] for i in instances.info.tolist()])
+            self.geo.setPointFloatAttribValues(col_attr, list(self.default_color) * padding + rgb.ravel().tolist())
+            self.geo.setPointIntAttribValues(mat_attr, [self.parm_material_group] * padding + mat_type.tolist())
+
+        ldraw_metrics.count('points_created', len(instances))
+
+    def create_edge_group(self, mesh, first_point):
         '''
-        get color from ld color json
-        16 is a special code, the color is determined by the referenced dat file
+        puts all ldraw lines into one edge group, lines that repeat an earlier one are left out
+        the duplicates stay in the geometry, removing them would shift the primitive numbers part_properties.json relies on
+        the edges are looked up with a single pattern like 'p0-1 p2-3' instead of one findEdge call per line
         '''
-        static_color = True
-        mat_type = self.parm_material_group
-        color = hou.Vector3(1, 0, 0.5)
-
-        if color_code == '16':
-            color = self.color_dict[str(self.parm_material)]['rgb']
-            static_color = False
-        else:
-            # if x in color it's a direct color that looks like this: 0x2995220
-            # and we need to convert it manually
-            if 'x' in color_code:
-                color = ldraw.hex_to_acescg(color_code[3:9])
-                color_code = '0'
-            else:
-                try:
-                    color = self.color_dict[color_code]['rgb']
-                    mat_type = self.material_groups.index(self.color_dict[color_code]['category'])
-                except:
-                    pass
-
-        return color, static_color, color_code, mat_type
+        edges = self.geo.createEdgeGroup(EDGE_GROUP)
+        start = mesh.prim_offsets()[ldraw_compiler.unique_lines(mesh)]
+        if not len(start):
+            return
+
+        ends = mesh.vertices[np.stack((start, start + 1), axis=1)] + first_point
+        edges.add(self.geo.globEdges(' '.join('p{}-{}'.format(a, b) for a, b in ends.tolist())))
 
     def path_resolve(self, part):
         '''
         Efficiently find part in ldraw lib.
+        This is a dict lookup in the library index, which also holds the highres overrides.
         '''
-        # Normalize part name
-        part = str(PureWindowsPath(part)).replace(' ', '')
-        part_lower = part.lower()
-
-        # Try both original and lowercase
-        part_names = [part, part_lower]
-
-        # List of (directory, highres_directory) tuples to search
-        search_paths = [
-            (ldraw.p, None),
-            (ldraw.ps, None),
-            (ldraw.pr, ldraw.pr48),
-            (ldraw.p_u, None),
-            (ldraw.ps_u, None),
-            (ldraw.pr_u, ldraw.pr48_u),
-            (ldraw.pr_l2h, None),
-        ]
-
-        for name in part_names:
-            for base_dir, highres_dir in search_paths:
-                part_dir = base_dir / name
-                if part_dir.exists():
-                    # Check for highres override if requested
-                    if self.parm_highres and highres_dir is not None:
-                        highres_part = highres_dir / name
-                        if highres_part.exists():
-                            return highres_part
-                    return part_dir
-
-        # Fallback if not found
-        return ldraw.pr_l2h / 'box-part-not-found.dat'
-
-    def read_part(self, part, winding, color_code, info, stud_processing):
+        return ldraw.resolve_part(part, self.parm_highres, self.overlay)
+
+    def record_dependencies(self, dependencies):
         '''
-        recursive function that reads the part and then either creates
-        lines, tris, quads or reads subparts inside the part
-        subparts are stored in a dict and then reused for all remaining instances
+        Records all files the part was built from, so reload_brickini_nodes only reloads it if one of them changed.
+        If a file wasn't found the library folders are recorded as well, adding the missing file to the library counts as a change.
         '''
-        if not part.exists():
-            return
+        paths = [Path(path) for path in dependencies.values()]
+        paths.append(self.color_table.path)
 
-        with open(part) as f:
-            invert_next = False
-            winding_sub = winding
-            info_group = info
-            color_group = color_code
-            static_color = False
+        if ldraw.pr_l2h / 'box-part-not-found.dat' in paths:
+            paths.extend(base for base, _ in ldraw.search_paths)
+            if self.overlay is not None:
+                paths.extend(base for base, _ in ldraw.overlay_paths(self.overlay))
 
-            part_geo = hou.Geometry()
-            temp_geo = hou.Geometry()
-            temp_geo2 = hou.Geometry()
-            line_geo = hou.Geometry()
+        ldraw.record_dependencies(self.node, paths)
 
-            if self.parm_pack:
-                part_geo.addAttrib(hou.attribType.Prim, 'color_mode', 0)
-
-            part_geo.addAttrib(hou.attribType.Prim, self.col_attr, self.default_color)
-            part_geo.addAttrib(hou.attribType.Prim, self.mat_attr, self.parm_material_group)
-            part_geo.addAttrib(hou.attribType.Prim, 'info', '')
-            part_geo.addAttrib(hou.attribType.Prim, 'color_code', 0)
-
-            # write description from first line if it matches the part number
-            if self.parm_part == part.stem:
-                description = f.readline().split(' ', 1)[-1].replace(' ', '_').strip()
-                self.geo.setGlobalAttribValue('description', description)
-
-            # Collect polygon data for batch creation
-            polys_data = []
-
-            for line in f:
-                line = line.split()
-                winding_group = winding
-
-                if len(line) < 3:
-                    continue
-
-                # meta: checking for winding order and inversion
-                elif line[0] == '0':
-                    # invert winding according to header
-                    if line[1] == 'BFC' and line[2] == 'CERTIFY':
-                        if line[3] == 'CW':
-                            if winding == 'CCW':
-                                winding_sub = 'CW'
-                            else:
-                                winding_sub = 'CCW'
-
-                    # inverse winding order until end of file or until next such statement found
-                    elif line[1] == 'BFC' and line[2] == 'CW':
-                        winding_sub = 'CW'
-                    elif line[1] == 'BFC' and line[2] == 'CCW':
-                        winding_sub = 'CCW'
-
-                    # subpart that we'll find in the line after this one needs to be inversed
-                    elif line[1] == 'BFC' and line[2] == 'INVERTNEXT':
-                        invert_next = True
-
-                    # check for deactivated logo line, swap to logo4.dat (best looking one) and activate the line
-                    if self.parm_logo == 1:
-                        if 'logo' in line[-1]:
-                            line = line[2:]
-                            line[-1] = 'logo4.dat'
-
-                # part/prim reference
-                if line[0] == '1':
-                    part = ' '.join(line[14:])
-
-                    # if separate mode we don't process studs from base part, but only from the printed one
-                    if stud_processing == 0 and 'stu' in part:
-                        continue
-
-                    # load special stud-instance which is just a helper prim to be able to instance the actual stud geo in the hda network
-                    if self.parm_stud:
-                        if part == 'stud.dat':
-                            part = 'stud-instance.dat'
-                            info_group = 'stud-instance'
-                        elif part == 'stud2.dat':
-                            part = 'stud-instance.dat'
-                            info_group = 'stud2-instance'
-                        elif 'stu' in part:
-                            info_group = 'stud'
-                        else:
-                            info_group = info
-
-                    if 'logo' in part:
-                        info_group = 'logo'
-
-                    # we only process edges if checked.
-                    # It's needed for beveling and consistent primitive count
-                    if not self.parm_edges:
-                        if 'edge' in part:
-                            continue
-
-                    color_code = line[1]
-                    # to allow group colors penetrating through sub files
-                    if color_code == '16':
-                        color_code = color_group
-  
-                    m4 = ldraw.get_matrix(line)
-
-                    winding_group = self.determine_winding(winding_group, m4, invert_next)
-                    invert_next = False
-
-                    # Adding the winding_group to the part name means we are potentially storing 2 versions of any given subpart.
-                    # This feels somewhat dumb, but since there is no 'flip vertex order function', there isn't really any smarter alternative I can think of.
-                    part_name = '{}_{}'.format(part, winding_group)
-
-                    # check if subpart was already built and store in temp_geo
-                    if part_name in self.subpart_cache:
-                        if info_group != 'print' or (info_group == 'print' and (color_code != '16' or 16 not in self.subpart_cache[part_name].primIntAttribValues('color_code'))): # make sure in separate mode that studs are processed correctly
-                            temp_geo.copyPrims(self.subpart_cache[part_name])
-                        else:
-                            continue
-                    else:
-                        part = self.path_resolve(part)
-                        
-                        part_geo_group = self.read_part(part, winding_group, color_code, info_group, stud_processing)
-                        #store subpart
-                        if len(part_geo_group.prims()) > 0:
-                            self.subpart_cache[part_name]=part_geo_group                        
-                        temp_geo.copyPrims(part_geo_group)
-
-                    color, static_color, color_code, mat_type = self.get_color(line[1])
-                    
-                    # the following sets the correct attributes based on parent parts/subparts
-                    # it's waaay faster to use primXAttribValues on the geo rather than looping over the prims and setting values directly
-                    color_codes = temp_geo.primIntAttribValues('color_code')
-                    colors = temp_geo.primFloatAttribValues(self.col_attr)
-                    mat_types = temp_geo.primIntAttribValues(self.mat_attr)
-                    infos = temp_geo.primStringAttribValues('info')
-
-                    new_color_codes = list(color_codes)
-                    new_colors = list(colors)
-                    new_mat_types = list(mat_types)
-                    new_infos = list(infos)
-                    new_color_modes = list()
-
-                    if self.parm_pack:
-                        color_modes = temp_geo.primIntAttribValues('color_mode')
-                        new_color_modes = list(color_modes)
-
-                    for i, code in enumerate(color_codes):
-                        if code == 16:
-                            s = i * 3
-                            new_colors[s:s+3] = color
-                            new_color_codes[i] = int(color_code)
-                            new_mat_types[i] = mat_type
-                            if infos[i] == '':
-                                new_infos[i] = info_group
-                            if static_color and self.parm_pack:
-                                new_color_modes[i] = 1
-
-                    # Write back in bulk
-                    temp_geo.setPrimFloatAttribValues(self.col_attr, new_colors)
-                    temp_geo.setPrimIntAttribValues('color_code', new_color_codes)
-                    temp_geo.setPrimIntAttribValues(self.mat_attr, new_mat_types)
-                    temp_geo.setPrimStringAttribValues('info', new_infos)
-                    if self.parm_pack:
-                        temp_geo.setPrimIntAttribValues('color_mode', new_color_modes)
-
-                    temp_geo.transform(m4)                    
-                    temp_geo2.mergePrims(temp_geo)
-
-                # tri
-                elif line[0] == '3':
-                    color, static_color, color_code, mat_type = self.get_color(line[1])
-                    points = self.extract_points(line, 3, winding_sub)
-                    if info != 'print' or (info == 'print' and (color_code != '16' or color_group != '16')): # make sure in separate mode that studs are processed correctly
-                        polys_data.append({
-                            'points': points,
-                            'color': color,
-                            'static_color': static_color,
-                            'color_code': color_code,
-                            'info': info,
-                            'mat_type': mat_type
-                        })
-
-                # quad
-                elif line[0] == '4':
-                    color, static_color, color_code, mat_type = self.get_color(line[1])
-                    points = self.extract_points(line, 4, winding_sub)
-                    if info != 'print' or (info == 'print' and (color_code != '16' or color_group != '16')): # make sure in separate mode that studs are processed correctly
-                        polys_data.append({
-                            'points': points,
-                            'color': color,
-                            'static_color': static_color,
-                            'color_code': color_code,
-                            'info': info,
-                            'mat_type': mat_type
-                        })
-
-                # lines
-                if self.parm_edges and info == 'base':
-                    if line[0] == '2':
-                        color = [0,0,0]
-                        static_color = False
-                        points = self.extract_points(line, 2, winding_sub)
-                        line_geo = self.create_lines(points, line_geo)
-
-            # Batch create polygons and set attributes
-            if polys_data:
-                part_geo = self.create_polys(polys_data, part_geo)
-
-            part_geo.mergePrims(temp_geo2)
-            part_geo.mergePrims(line_geo)
-        return part_geo
+    def build(self):
+        # options the compiled part depends on, pack and materials are only applied when creating the geometry
+        options = (self.parm_highres, self.parm_logo, self.parm_stud, self.parm_edges, self.parm_print)
+        instance_policy = ldraw.instance_policy(self.parm_part) if self.parm_instance else None
+        mesh, description, dependencies = ldraw.compile_part(self.parm_part, options, self.path_resolve, instance_policy, self.parm_weld)
+
+        self.record_dependencies(dependencies)
+
+        if description is not None:
+            self.geo.setGlobalAttribValue('description', description)
+
+        self.create_geometry(mesh)
+        if mesh.instances is not None:
+            self.create_instances(mesh.instances)
 
     def __call__(self):
-        # print handling
-        # load brick as set in parm parameter by default
-        # load base brick if mode is set to separate and only keep print geo from actual brick
-        # load base brick if mode is set to texture and we create uvs in the hda
-
-        m4_ldu = ldraw.xform_to_houdini()
-
-        base_part = self.parm_part
-        print_str = re.search('[pP].*', self.parm_part)
-        composite_str = re.search('[cC].*', self.parm_part)
-        stud_processing = 1
-
-        if print_str != None:
-            print_str = print_str.group()
-            base_part = self.parm_part.replace(print_str, '')
-            base_part = re.sub(r'\d+-', '', base_part) # remove model string from unofficial mpd part files
-
-        # if part is a composite we won't apply separation since base composite part might not exist
-        if self.parm_print > 0 and print_str != None and composite_str == None:
-            if self.parm_print == 1:
-                part_path = self.path_resolve(self.parm_part + '.dat')
-                part_geo_print = self.read_part(part_path, 'CCW', '16', 'print', 1)
-                stud_processing = 0
-                part_geo_print.transform(m4_ldu)
-                self.geo.mergePrims(part_geo_print)
-                # clear subpart cache so printed areas don't conflict with non printed ones
-                self.subpart_cache.clear()
-
-            self.parm_part = base_part
-
-        part_path = self.path_resolve(self.parm_part + '.dat')
-        part_geo_base = self.read_part(part_path, 'CCW', '16', 'base', stud_processing)
-    
-        # transform and add to main geo object
-        part_geo_base.transform(m4_ldu)
-        self.geo.mergePrims(part_geo_base)
\ No newline at end of file
+        metrics = ldraw.begin_metrics('part', self.parm_part)
+        try:
+            self.build()
+        finally:
+            ldraw.end_metrics(metrics, self.geo)
@@ -1,8 +1,11 @@
 import ldraw
-import json
-import hou
+import ldraw_metrics
+import ldraw_headless
+import numpy as np
 import re
 
+hou = ldraw_headless.backend()
+
 class ldrawPartProperties:
     def __init__(self, node, parms):
         # python sop
@@ -12,66 +15,72 @@ class ldrawPartProperties:
 
         self.parm_part = parms.get('parm_part')
 
-    def part_properties(self, property):
-        properties = ldraw.resources() / 'part_properties.json'
-        with open(properties) as f:
-            data = json.load(f)
-        property = data[property]
-
-        return property
-
-    def set_vertex_attribute(self, attribute, value, prim_list=[]):
-        prims = self.geo.prims()
-        for p in prims:
-            if p.number() in prim_list or not prim_list:
-                prim_vertices = p.vertices()
-                for v in prim_vertices:
-                    v.setAttribValue(attribute, value)
+    def vertex_start(self, prim_number, vertex_count):
+        '''returns the number of the first vertex of a primitive, vertex_count for numbers beyond the last primitive'''
+        prim = self.geo.prim(prim_number)
+        if prim is None:
+            return vertex_count
+        return prim.vertices()[0].linearNumber()
 
-    def convert_houdini_list(self, prim_string):
+    def set_vertex_attribute(self, attribute, value, ranges=None):
         '''
-        converts a houdini list that looks like this: '1-3 6 9-12' into a numbered list
+        sets a float vertex attribute on all vertices of the primitives in ranges, see ldraw.parse_prim_ranges
+        vertices are numbered primitive by primitive, so a range is the slice from the first vertex of its first primitive
+        to the first vertex of the primitive after it, only those are looked up and all values are written in one go
         '''
-        prim_list = []
-        for part in prim_string.split():
-            if '-' in part:
-                start, end = map(int, part.split('-'))
-                prim_list.extend(range(start, end + 1))
-            else:
-                prim_list.append(int(part))
-        return prim_list
+        values = np.array(self.geo.vertexFloatAttribValues(attribute), dtype=np.float64)
 
-    def __call__(self):
+        if ranges is None or len(ranges) == 0:
+            values[:] = value
+        else:
+            for start, end in ranges.tolist():
+                values[self.vertex_start(start, len(values)):self.vertex_start(end + 1, len(values))] = value
+
+        self.geo.setVertexFloatAttribValues(attribute, values.tolist())
+
+    def assign_properties(self):
         base_part = self.parm_part
         base_part = re.sub('[a-zA-Z].*', '', base_part) # remove variant string
         base_part = re.sub('\d+-', '', base_part) # remove model string from unofficial mpd part files
 
+        table = ldraw.part_properties()
+        ldraw.record_dependencies(self.node, [table.path])
+        properties = table.lookup(base_part)
+
         # slope attribute
-        if base_part in self.part_properties('slopes'):
+        if properties.get('slope'):
             self.geo.addAttrib(hou.attribType.Global, 'slope_part', 1)
 
         # softness attribute
-        softness = self.part_properties('softness').get(base_part)
-        if softness:
-            self.geo.addAttrib(hou.attribType.Vertex, 'softness', float(softness))
+        softness = properties.get('softness')
+        if softness is not None:
+            self.geo.addAttrib(hou.attribType.Vertex, 'softness', softness)
 
         # roughness attribute
-        roughness = self.part_properties('roughness').get(base_part)
-        if roughness:
-            self.geo.addAttrib(hou.attribType.Vertex, 'roughness', float(roughness))
+        roughness = properties.get('roughness')
+        if roughness is not None:
+            self.geo.addAttrib(hou.attribType.Vertex, 'roughness', roughness)
 
         # graininess attribute
-        graininess = self.part_properties('graininess').get(base_part)
+        graininess = properties.get('graininess')
         if graininess:
-            if graininess[1] != '':            
+            value, ranges = graininess
+            if ranges is not None:
                 self.geo.addAttrib(hou.attribType.Vertex, 'graininess', 0.0)
-                vertex_list = self.convert_houdini_list(graininess[1])
-                self.set_vertex_attribute('graininess', float(graininess[0]), vertex_list)
+                self.set_vertex_attribute('graininess', value, ranges)
             else:
-                self.geo.addAttrib(hou.attribType.Vertex, 'graininess', float(graininess[0]))
+                self.geo.addAttrib(hou.attribType.Vertex, 'graininess', value)
 
         # injection point attribute
-        injection_point = self.part_properties('injection_point').get(base_part)
-        if injection_point:            
+        injection_point = properties.get('injection_point')
+        if injection_point:
             self.geo.addArrayAttrib(hou.attribType.Global, 'injection_point', hou.attribData.String)
-            self.geo.setGlobalAttribValue('injection_point', injection_point)
\ No newline at end of file
+            self.geo.setGlobalAttribValue('injection_point', injection_point)
+
+    def __call__(self):
+        metrics = ldraw.begin_metrics('properties', self.parm_part)
+        try:
+            with ldraw_metrics.stage('properties'):
+                self.assign_properties()
+        finally:
+            ldraw.end_metrics(metrics, self.geo)
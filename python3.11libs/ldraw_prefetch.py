@@ -0,0 +1,115 @@
+'''
+Houdini independent prefetch of compiled parts.
+Compiles all parts of a model that aren't in the part cache yet in a pool of worker processes,
+so the part nodes only have to load the cached arrays when they cook.
+It's meant for the import step, the pool is started by a worker script of its own and never from inside a cook.
+'''
+import os
+import pickle
+import subprocess
+import sys
+from pathlib import Path
+import ldraw_library
+import ldraw_compiler
+import ldraw_cache
+
+# entry script of the worker processes, see prefetch_parts
+worker_script = Path(__file__).with_name('ldraw_prefetch_worker.py')
+
+class PartResolver:
+    '''resolves referenced files the same way as ldrawPart.path_resolve, without hou'''
+    def __init__(self, index, highres, fallback):
+        self.index = index
+        self.highres = highres
+        self.fallback = Path(fallback)
+
+    def __call__(self, part):
+        part_path = self.index.resolve(part, self.highres)
+        if part_path is None:
+            return self.fallback
+        return part_path
+
+def open_index(library):
+    '''
+    returns the session wide index of a library
+    library is a tuple of the search paths, the index file, the search paths of the embedded parts of a model or None and their position
+    '''
+    search_paths, index_file, overlay_paths, overlay_position = library
+    index = ldraw_library.library_index(search_paths, index_file)
+    if overlay_paths:
+        index = ldraw_library.overlay_index(index, overlay_paths, overlay_position)
+    return index
+
+def compile_part(library, fallback, cache_dir, part, options):
+    '''
+    compiles a single part and writes it to the part cache
+    runs in the worker processes, the library index and the subpart cache are kept alive between parts
+    '''
+    highres, logo, stud, edges, print_handling = options
+    resolve = PartResolver(open_index(library), highres, fallback)
+
+    compiler = ldraw_compiler.LdrawPartCompiler(resolve, part, highres, logo, stud, edges)
+    mesh = compiler.compile(print_handling)
+    ldraw_cache.LdrawPartCache(cache_dir).save(part, options, mesh, compiler.description, compiler.dependencies)
+    return part
+
+def worker_python(hfs=None):
+    '''
+    returns the python interpreter used for the worker processes
+    inside houdini sys.executable is the houdini binary, so we use the python that ships with houdini.
+    can be overridden with the LDRAW_WORKER_PYTHON environment variable
+    '''
+    python = os.environ.get('LDRAW_WORKER_PYTHON')
+    if python:
+        return python
+
+    if Path(sys.executable).stem.lower().startswith('python'):
+        return sys.executable
+
+    if hfs:
+        version = '{}.{}'.format(*sys.version_info[:2])
+        candidates = [
+            Path(hfs) / 'python' / 'bin' / 'python{}'.format(version), # linux
+            Path(hfs) / 'python{}{}'.format(*sys.version_info[:2]) / 'python.exe', # windows
+            Path(hfs) / 'Frameworks' / 'Python.framework' / 'Versions' / version / 'bin' / 'python{}'.format(version), # macos
+        ]
+        for candidate in candidates:
+            if candidate.exists():
+                return str(candidate)
+    return None
+
+def worker_count(jobs):
+    '''number of worker processes, can be set with LDRAW_PREFETCH_WORKERS, 0 disables the prefetch'''
+    workers = os.environ.get('LDRAW_PREFETCH_WORKERS')
+    if workers:
+        workers = int(workers)
+    else:
+        workers = max((os.cpu_count() or 1) - 1, 1)
+    return min(workers, jobs)
+
+def prefetch_parts(parts, options, library, fallback, cache_dir, hfs=None):
+    '''
+    compiles all parts that don't have a valid entry in the part cache yet, library is described in open_index
+    returns the list of parts that were compiled, failed parts are left to the part nodes
+    the pool runs in ldraw_prefetch_worker, a process of its own, so nothing of the interpreter that calls this is shared with the workers
+    '''
+    resolve = PartResolver(open_index(library), options[0], fallback)
+    part_cache = ldraw_cache.LdrawPartCache(cache_dir)
+    missing = [part for part in dict.fromkeys(parts) if not part_cache.contains(part, options, resolve)]
+
+    # starting the pool isn't worth it for a single part, the node compiles it just as fast
+    workers = worker_count(len(missing))
+    python = worker_python(hfs)
+    if len(missing) < 2 or workers < 1 or python is None:
+        return []
+
+    job = pickle.dumps((missing, options, library, fallback, cache_dir, workers))
+    try:
+        result = subprocess.run(
+            [python, str(worker_script)], input=job, stdout=subprocess.PIPE,
+            # no console window pops up for the worker on windows
+            creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0),
+        )
+        return pickle.loads(result.stdout) if result.returncode == 0 else []
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return []
@@ -0,0 +1,41 @@
+'''
+Entry script of the prefetch, see ldraw_prefetch.prefetch_parts.
+It's started with the python that ships with houdini, reads the job from stdin and writes the list of compiled parts to stdout.
+The parts are compiled by a pool of spawned processes, this script is the main module they start from.
+'''
+import multiprocessing
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import ldraw_prefetch
+
+def prefetch(missing, options, library, fallback, cache_dir, workers):
+    '''compiles the missing parts and returns the ones that were written to the part cache'''
+    # the pool workers run the same interpreter as this script
+    context = multiprocessing.get_context('spawn')
+    context.set_executable(sys.executable)
+
+    compiled = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [pool.submit(ldraw_prefetch.compile_part, library, fallback, cache_dir, part, options) for part in missing]
+            for future in as_completed(futures):
+                try:
+                    compiled.append(future.result())
+                except BrokenProcessPool:
+                    raise
+                except Exception:
+                    continue
+    except (OSError, BrokenProcessPool):
+        pass
+    return compiled
+
+def main():
+    job = pickle.load(sys.stdin.buffer)
+    compiled = prefetch(*job)
+    sys.stdout.buffer.write(pickle.dumps(compiled))
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
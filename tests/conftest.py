@@ -0,0 +1,63 @@
+'''
+Shared setup of the tests.
+They run on the headless backend against a small ldraw library in a temp folder.
+ldraw.py reads LDRAW_LIB when it's imported, so the environment is set before any module of python3.11libs gets loaded.
+'''
+import os
+import sys
+import tempfile
+from pathlib import Path
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+TEMP = Path(tempfile.mkdtemp(prefix='ldraw_tests_'))
+
+os.environ['LDRAW_HEADLESS'] = '1'
+os.environ['LDRAW_LIB'] = str(TEMP / 'ldraw')
+os.environ['LDRAW_CACHE_DIR'] = str(TEMP / 'cache')
+os.environ['LDRAW2HOUDINI'] = str(ROOT)
+os.environ['LDRAW_PART_CACHE'] = '0'
+sys.path.insert(0, str(ROOT / 'python3.11libs'))
+
+class LdrawTestLibrary:
+    '''
+    Writes parts and primitives into the library of the test session.
+    Session caches are keyed by path, so every test should use its own file names.
+    '''
+    def __init__(self, root):
+        self.root = root
+
+    def write(self, rel, *lines):
+        path = self.root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('\n'.join(lines) + '\n')
+        return path
+
+    def resolve(self, name):
+        '''stand-in for the library index, looks a referenced file up in parts and p'''
+        name = name.lower().replace('\\', '/')
+        for folder in ('parts', 'p'):
+            path = self.root / folder / name
+            if path.exists():
+                return path
+        return None
+
+    def cook(self, part, parent=None, **parms):
+        '''cooks an ldrawPart on a headless node and returns its geometry, parent is the node of the hda it cooks in'''
+        import ldraw
+        import ldraw_headless
+        import ldraw_part
+        # the index is only checked once per session, the test wrote new files since
+        ldraw.library_index(refresh=True)
+        parms = dict(dict(parm_part=part, parm_highres=0, parm_logo=1, parm_stud=1, parm_pack=0, parm_print=0, parm_edges=1, parm_material_group=0, parm_material=4), **parms)
+        node = ldraw_headless.Node(part, parent=parent)
+        ldraw_part.ldrawPart(node, parms)()
+        return node.geometry()
+
+    def compile(self, part, edges=1, **kwargs):
+        import ldraw_compiler
+        return ldraw_compiler.LdrawPartCompiler(self.resolve, part, edges=edges, **kwargs).compile()
+
+@pytest.fixture
+def library():
+    return LdrawTestLibrary(TEMP / 'ldraw')
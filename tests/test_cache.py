@@ -0,0 +1,26 @@
+import numpy as np
+import ldraw_cache
+import ldraw_compiler
+
+def test_entries_are_invalidated_by_the_content_of_their_dependencies(library, tmp_path):
+    primitive = library.write('p/t006p.dat', '3 16 0 0 0 1 0 0 0 0 1')
+    library.write('parts/t006.dat', '0 BFC CERTIFY CCW', '1 16 0 0 0 1 0 0 0 1 0 0 0 1 t006p.dat')
+    options = (0, 1, 1, 1, 1)
+
+    compiler = ldraw_compiler.LdrawPartCompiler(library.resolve, 't006')
+    mesh = compiler.compile()
+    part_cache = ldraw_cache.LdrawPartCache(tmp_path)
+    part_cache.save('t006', options, mesh, compiler.description, compiler.dependencies)
+
+    assert part_cache.contains('t006', options, library.resolve)
+    cached, _, dependencies = part_cache.load('t006', options, library.resolve)
+    assert np.array_equal(cached.points, mesh.points)
+    assert dependencies['t006p.dat'] == primitive
+
+    # other options are another entry
+    assert not part_cache.contains('t006', (1, 1, 1, 1, 1), library.resolve)
+
+    # the part itself didn't change, the primitive it references did
+    library.write('p/t006p.dat', '4 16 0 0 0 1 0 0 1 0 1 0 0 1')
+    assert not part_cache.contains('t006', options, library.resolve)
+    assert part_cache.load('t006', options, library.resolve) is None
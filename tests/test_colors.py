@@ -0,0 +1,41 @@
+import json
+import os
+import numpy as np
+import ldraw
+
+def write_colors(path, colors):
+    path.write_text(json.dumps({code: {'category': category, 'name': name, 'rgb': rgb} for code, (category, name, rgb) in colors.items()}))
+    return path
+
+def test_colors_are_looked_up_in_dense_arrays(tmp_path):
+    table = ldraw.LdrawColorTable(write_colors(tmp_path / 'ld_colors.json', {
+        '0': ('Solid', 'Black', [0.0, 0.0, 0.0]),
+        '4': ('Solid', 'Red', [0.5, 0.0, 0.0]),
+        '34': ('Transparent', 'Trans_Green', [0.0, 0.5, 0.0]),
+    }))
+    assert table.categories == ['Solid', 'Transparent']
+    assert table.names == ['Black', 'Red', 'Trans_Green']
+
+    rgb, category, valid = table.lookup(np.array([4, 34, 7, -1, 100000]))
+    assert valid.tolist() == [True, True, False, False, False]
+    assert category.tolist() == [0, 1, -1, -1, -1]
+    assert rgb[:2].tolist() == [[0.5, 0.0, 0.0], [0.0, 0.5, 0.0]]
+    assert (rgb[2:] == ldraw.not_found_color).all()
+
+    assert table.code_index('34') == 34
+    assert table.code_index('7') == -1
+    assert table.code_index('0x2FF0000') == -1
+
+def test_color_table_is_only_reloaded_when_the_json_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(ldraw, 'resources', lambda: tmp_path)
+    path = write_colors(tmp_path / 'ld_colors.json', {'4': ('Solid', 'Red', [0.5, 0.0, 0.0])})
+
+    table = ldraw.color_table()
+    assert ldraw.color_table() is table
+    assert not ldraw.colors_changed()
+
+    write_colors(path, {'4': ('Solid', 'Dark_Red', [0.3, 0.0, 0.0])})
+    os.utime(path, ns=(table.mtime + 10**9, table.mtime + 10**9))
+    assert ldraw.colors_changed()
+    assert ldraw.color_table() is not table
+    assert ldraw.get_color_name('4') == 'Dark_Red'
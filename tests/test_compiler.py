@@ -0,0 +1,155 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import ldraw
+import ldraw_compiler
+
+def corners(mesh, prims):
+    '''returns the corner positions of the given primitives, rounded so they can be compared'''
+    offsets = mesh.prim_offsets()
+    return [np.round(mesh.points[mesh.vertices[offsets[i]:offsets[i] + mesh.prim_sizes[i]]], 4).tolist() for i in prims]
+
+def write_repeated_edges(library, name):
+    '''
+    a part with lines that repeat the edges of its primitives in both directions
+    the primitive is referenced twice at the same spot, the lines of the second one come before the face of the last reference
+    '''
+    library.write('p/{}e.dat'.format(name), '0 BFC CERTIFY CCW', '3 16 0 0 0 1 0 1 0 0 1', '2 24 0 0 0 1 0 0', '2 24 1 0 0 1 0 1')
+    library.write('p/{}f.dat'.format(name), '0 BFC CERTIFY CCW', '3 16 0 0 0 0 1 0 1 1 0')
+    library.write('parts/{}.dat'.format(name),
+        '0 BFC CERTIFY CCW',
+        '2 24 1 0 0 0 0 0',
+        '3 16 0 0 0 1 0 0 1 0 1',
+        '1 16 0 0 0 1 0 0 0 1 0 0 0 1 {}e.dat'.format(name),
+        '1 16 0 0 0 1 0 0 0 1 0 0 0 1 {}e.dat'.format(name),
+        '1 16 0 0 0 1 0 0 0 1 0 0 0 1 {}f.dat'.format(name),
+        '4 16 0 0 0 1 0 0 1 1 0 0 1 0',
+        '2 24 1 0 1 1 0 0',
+        '2 24 0 0 0 0 1 0')
+
+def test_repeated_lines_keep_face_numbers(library):
+    # part_properties.json addresses faces by primitive number, edges must not renumber them
+    write_repeated_edges(library, 't024d')
+    mesh = library.compile('t024d', edges=1)
+    baseline = library.compile('t024d', edges=0)
+
+    assert (~mesh.prim_closed).sum() == 7
+    closed = np.flatnonzero(mesh.prim_closed)
+    assert closed.tolist() == [0, 1, 2, 5, 8]
+    assert corners(mesh, closed) == corners(baseline, np.flatnonzero(baseline.prim_closed))
+
+def test_unique_lines(library):
+    write_repeated_edges(library, 't024b')
+    mesh = library.compile('t024b')
+    lines = np.flatnonzero(~mesh.prim_closed)
+    unique = ldraw_compiler.unique_lines(mesh)
+    # the second reference and two lines of the part repeat the lines of the first reference, which are kept
+    assert len(unique) == 3
+    assert unique.tolist()[:2] == lines.tolist()[:2]
+    assert unique.tolist() == sorted(unique.tolist())
+    assert set(unique.tolist()) <= set(lines.tolist())
+
+    deduped = ldraw_compiler.dedupe_lines(mesh)
+    assert len(deduped) == len(mesh) - 4
+    assert corners(deduped, np.flatnonzero(~deduped.prim_closed)) == corners(mesh, unique)
+
+def test_reference_colors_are_applied_after_the_cache_lookup(library):
+    # the subpart cache key leaves out the color of non print references, so one compiled subpart serves all colors
+    library.write('parts/s/t005s.dat', '0 BFC CERTIFY CCW', '3 16 0 0 0 1 0 0 0 0 1', '3 15 0 0 0 0 1 0 1 0 0', '1 16 0 0 0 1 0 0 0 1 0 0 0 1 t005p.dat')
+    library.write('p/t005p.dat', '0 BFC CERTIFY CCW', '3 16 0 0 0 0 0 1 0 1 0', '3 0x2FF0000 0 0 0 1 1 1 0 1 0')
+    library.write('parts/t005.dat',
+        '0 BFC CERTIFY CCW',
+        '1 4 0 0 0 1 0 0 0 1 0 0 0 1 s/t005s.dat',
+        '1 2 10 0 0 1 0 0 0 1 0 0 0 1 s/t005s.dat',
+        '1 16 20 0 0 1 0 0 0 1 0 0 0 1 s/t005s.dat')
+
+    for _ in range(2):
+        # the second compile gets the subparts from the session wide cache
+        mesh = library.compile('t005')
+        colors = mesh.prim_color[mesh.prim_closed].tolist()
+        assert colors == [4, 15, 4, 0x2FF0000, 2, 15, 2, 0x2FF0000, 16, 15, 16, 0x2FF0000]
+
+def compile_in_new_process(part):
+    '''compiles a part through the part cache in a fresh python and returns the highest point'''
+    code = 'import ldraw, ldraw_model; print(ldraw.compile_part({!r}, ldraw_model.static_part_options, ldraw.resolve_part)[0].points.max())'.format(part)
+    result = subprocess.run([sys.executable, '-c', code], env=dict(os.environ), capture_output=True, text=True, check=True)
+    return float(result.stdout.split()[-1])
+
+def test_edited_nested_primitives_invalidate_cached_subparts(library, tmp_path, monkeypatch):
+    monkeypatch.setenv('LDRAW_PART_CACHE', '1')
+    monkeypatch.setenv('LDRAW_CACHE_DIR', str(tmp_path))
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join([os.path.dirname(ldraw.__file__), os.environ.get('PYTHONPATH', '')]))
+    primitive = library.write('p/t005n.dat', '0 BFC CERTIFY CCW', '3 16 0 0 0 1 0 0 0 1 0')
+    library.write('parts/s/t005m.dat', '0 BFC CERTIFY CCW', '1 16 0 0 0 1 0 0 0 1 0 0 0 1 t005n.dat')
+    library.write('parts/t005m.dat', '0 BFC CERTIFY CCW', '1 16 0 0 0 1 0 0 0 1 0 0 0 1 s/t005m.dat')
+    ldraw.library_index(refresh=True)
+
+    def compile_here():
+        return ldraw.compile_part('t005m', (0, 1, 1, 1, 0), ldraw.resolve_part)[0].points.max()
+
+    assert compile_here() == 1.0
+    assert compile_in_new_process('t005m') == 1.0
+
+    # only the primitive two levels down changes, the subpart in between keeps its mtime
+    mtime = os.stat(primitive).st_mtime_ns
+    library.write('p/t005n.dat', '0 BFC CERTIFY CCW', '3 16 0 0 0 5 0 0 0 1 0')
+    os.utime(primitive, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+
+    assert compile_here() == 5.0
+    assert compile_in_new_process('t005m') == 5.0
+
+def normals_z(mesh):
+    '''returns the sign of the normal of every face in the xy plane'''
+    offsets = mesh.prim_offsets()
+    signs = []
+    for i in np.flatnonzero(mesh.prim_closed):
+        a, b, c = mesh.points[mesh.vertices[offsets[i]:offsets[i] + 3]]
+        signs.append(int(np.sign(np.cross(b - a, c - a)[2])))
+    return signs
+
+def test_compiled_winding(library):
+    # every triangle is counter clockwise in its file, seen from +z
+    library.write('p/t003s.dat', '0 BFC CERTIFY CCW', '3 16 0 0 0 1 0 0 0 1 0')
+    library.write('parts/t003w.dat',
+        '0 BFC CERTIFY CCW',
+        '3 16 0 0 0 1 0 0 0 1 0',
+        '1 16 0 0 0 1 0 0 0 1 0 0 0 1 t003s.dat',
+        '0 BFC INVERTNEXT',
+        '1 16 0 0 0 1 0 0 0 1 0 0 0 1 t003s.dat',
+        '1 16 0 0 0 1 0 0 0 1 0 0 0 -1 t003s.dat',
+        '0 BFC INVERTNEXT',
+        '1 16 0 0 0 1 0 0 0 1 0 0 0 -1 t003s.dat',
+        '0 BFC CW',
+        '3 16 0 0 0 1 0 0 0 1 0')
+    library.write('parts/t003c.dat', '0 BFC CERTIFY CW', '3 16 0 0 0 1 0 0 0 1 0')
+
+    # houdini faces are clockwise, so ccw faces get reversed, inverted and mirrored references cancel out
+    # the faces of the part itself come first, then the references in file order
+    assert normals_z(library.compile('t003w', edges=0)) == [-1, 1, -1, 1, 1, -1]
+    assert normals_z(library.compile('t003c', edges=0)) == [1]
+
+def test_weld_mesh():
+    points = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [1.0000001, 0, 0], [0, 1, 0], [1, 1, 0]], dtype=np.float64)
+    mesh = ldraw_compiler.LdrawMesh(points, np.arange(6), np.array([3, 3]), np.array([16, 4]), np.zeros(2, dtype=np.uint8), np.ones(2, dtype=bool), np.ones(2, dtype=bool))
+    welded = ldraw_compiler.weld_mesh(mesh)
+
+    # corners within the tolerance share a point, points keep the order they are first used in
+    assert welded.polygons() == [(0, 1, 2), (1, 2, 3)]
+    assert np.allclose(welded.points, [[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 1, 0]])
+    assert welded.prim_color is mesh.prim_color
+
+def test_select_prims():
+    points = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 1, 0], [2, 2, 0]], dtype=np.float64)
+    mesh = ldraw_compiler.LdrawMesh(points, np.array([0, 1, 2, 1, 3, 2, 3, 4]), np.array([3, 3, 2]), np.array([16, 4, 24]),
+        np.zeros(3, dtype=np.uint8), np.array([True, True, False]), np.array([True, False, False]))
+
+    selected = ldraw_compiler.select_prims(mesh, np.array([False, True, True]))
+    # point 0 is only used by the dropped face, the others are renumbered
+    assert np.allclose(selected.points, points[1:])
+    assert selected.polygons() == [(0, 2, 1), (2, 3)]
+    assert selected.prim_color.tolist() == [4, 24]
+    assert selected.prim_closed.tolist() == [True, False]
+    assert selected.prim_flip.tolist() == [False, False]
+
+    assert ldraw_compiler.select_prims(mesh, np.ones(3, dtype=bool)) is mesh
@@ -0,0 +1,18 @@
+import ldraw
+import ldraw_headless
+
+def test_nodes_without_record_count_as_changed(tmp_path):
+    node = ldraw_headless.Node('bldp_deps_', 'brickini_ldraw_part')
+    # e.g. a node of a loaded hip file that didn't cook yet
+    assert ldraw.dependencies_changed(node)
+
+    path = tmp_path / 'part.dat'
+    path.write_text('0 part\n')
+    ldraw.record_dependencies(node, [path])
+    assert not ldraw.dependencies_changed(node)
+
+    path.write_text('0 changed part\n')
+    assert ldraw.dependencies_changed(node)
+
+    ldraw.forget_dependencies(node)
+    assert ldraw.dependencies_changed(node)
@@ -0,0 +1,50 @@
+import ldraw_library
+
+def write(path, text='0 part\n'):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return path
+
+def test_index_is_only_checked_on_refresh(tmp_path):
+    write(tmp_path / 'lib' / 'parts' / '3001.dat')
+    search_paths = [(tmp_path / 'lib' / 'parts', None)]
+    index_file = tmp_path / 'cache' / 'index.json'
+
+    index = ldraw_library.library_index(search_paths, index_file)
+    assert index.resolve('3001.DAT') == tmp_path / 'lib' / 'parts' / '3001.dat'
+    assert index.resolve('3002.dat') is None
+
+    # a file added later isn't seen until the index is refreshed, e.g. by the reload button
+    write(tmp_path / 'lib' / 'parts' / 's' / '3002s01.dat')
+    assert ldraw_library.library_index(search_paths, index_file) is index
+    assert index.resolve('s\\3002s01.dat') is None
+    assert ldraw_library.library_index(search_paths, index_file, refresh=True) is index
+    # resolved names are remembered until a root is rescanned
+    assert index.resolve('s\\3002s01.dat') == tmp_path / 'lib' / 'parts' / 's' / '3002s01.dat'
+    assert index.resolve('S\\3002S01.DAT') == tmp_path / 'lib' / 'parts' / 's' / '3002s01.dat'
+
+def test_stored_index_is_rescanned_when_stale(tmp_path):
+    write(tmp_path / 'lib' / 'parts' / '3001.dat')
+    search_paths = [(tmp_path / 'lib' / 'parts', None)]
+    index_file = tmp_path / 'cache' / 'index.json'
+
+    ldraw_library.LdrawLibraryIndex(search_paths, index_file)
+    # the stored index is up to date, another session doesn't rescan the library
+    assert not ldraw_library.LdrawLibraryIndex(search_paths, index_file).refresh()
+
+    write(tmp_path / 'lib' / 'parts' / '3002.dat')
+    index = ldraw_library.LdrawLibraryIndex(search_paths, index_file)
+    assert index.resolve('3002.dat') == tmp_path / 'lib' / 'parts' / '3002.dat'
+    assert not index.refresh()
+
+def test_highres_override(tmp_path):
+    write(tmp_path / 'lib' / 'p' / 'stud.dat')
+    write(tmp_path / 'lib' / 'p' / '48' / 'stud.dat')
+    index = ldraw_library.LdrawLibraryIndex([(tmp_path / 'lib' / 'p', tmp_path / 'lib' / 'p' / '48')])
+
+    assert index.resolve('stud.dat') == tmp_path / 'lib' / 'p' / 'stud.dat'
+    assert index.resolve('stud.dat', highres=True) == tmp_path / 'lib' / 'p' / '48' / 'stud.dat'
+
+def test_normalize_name():
+    assert ldraw_library.normalize_name('S\\3001S01.DAT') == 's/3001s01.dat'
+    assert ldraw_library.normalize_name('48\\1-4 cyli.dat') == '48/1-4cyli.dat'
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+import ldraw
+import ldraw_headless
+
+VALUES = [
+    ['10', '-24', '30', '1', '0', '0', '0', '1', '0', '0', '0', '1'],
+    ['0', '8', '-20', '0', '0', '1', '0', '1', '0', '-1', '0', '0'],
+    # mirrored and scaled
+    ['5', '0', '0', '-2', '0', '0', '0', '1', '0', '0', '0', '1'],
+]
+
+def test_batch_conversion_matches_single_matrices():
+    xform = ldraw.xform_to_houdini()
+    expected = [np.array((xform.inverted() * ldraw.matrix_from_values(values) * xform).asTupleOfTuples()) for values in VALUES]
+    assert ldraw.houdini_matrices(VALUES) == pytest.approx(np.array(expected))
+
+def test_exploded_matrices_build_the_same_transform():
+    matrices = ldraw.houdini_matrices(VALUES)
+    translate, rotate, scale = ldraw.explode_matrices(matrices)
+    assert scale[2, 0] < 0
+
+    for m4, t, r, s in zip(matrices, translate, rotate, scale):
+        rebuilt = ldraw_headless.hmath.buildTransform({'translate': t, 'rotate': r, 'scale': s}, transform_order='srt', rotate_order='xyz')
+        assert np.array(rebuilt.asTupleOfTuples()) == pytest.approx(m4)
@@ -0,0 +1,18 @@
+import ldraw_metrics
+
+def test_nested_stages_only_get_their_exclusive_time(monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(ldraw_metrics.time, 'perf_counter', lambda: float(next(clock)))
+
+    # the clock ticks once per call: begin 0, instance 1..6, cache 2..3, parse 4..5, end 7
+    metrics = ldraw_metrics.begin('model', 'stages')
+    with ldraw_metrics.stage('instance'):
+        with ldraw_metrics.stage('cache'):
+            pass
+        with ldraw_metrics.stage('parse'):
+            pass
+    ldraw_metrics.end(metrics)
+
+    assert metrics.stages == {'cache': 1.0, 'parse': 1.0, 'instance': 3.0}
+    assert metrics.seconds == 7.0
+    assert sum(metrics.stages.values()) <= metrics.seconds
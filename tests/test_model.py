@@ -0,0 +1,297 @@
+import collections
+import numpy as np
+import pytest
+import ldraw
+import ldraw_headless
+import ldraw_model
+import ldraw_mpd
+import ldraw_parser
+
+def write_instanced_part(library, name):
+    '''a part that references its primitive three times, once inverted'''
+    library.write('p/{}c.dat'.format(name), '0 BFC CERTIFY CCW', '3 16 0 0 0 1 0 0 0 0 1', '4 16 0 0 0 0 1 0 1 1 0 1 0 0')
+    library.write('parts/{}.dat'.format(name),
+        '0 BFC CERTIFY CCW',
+        '4 16 0 0 0 10 0 0 10 0 10 0 0 10',
+        '1 16 0 0 0 1 0 0 0 1 0 0 0 1 {}c.dat'.format(name),
+        '1 4 5 0 0 0 0 1 0 1 0 -1 0 0 {}c.dat'.format(name),
+        '0 BFC INVERTNEXT',
+        '1 16 0 5 0 1 0 0 0 1 0 0 0 1 {}c.dat'.format(name))
+
+def faces(mesh, matrix):
+    '''returns the sorted corners of all faces of a mesh placed with a row vector matrix'''
+    points = mesh.points @ matrix[:3, :3] + matrix[3, :3]
+    offsets = mesh.prim_offsets()
+    result = []
+    for i in np.flatnonzero(mesh.prim_closed):
+        corners = points[mesh.vertices[offsets[i]:offsets[i] + mesh.prim_sizes[i]]]
+        result.append(tuple(sorted(map(tuple, np.round(corners, 4).tolist()))))
+    return sorted(result)
+
+def test_compact_import_adds_instanced_primitives(library, monkeypatch):
+    write_instanced_part(library, 't025a')
+    ldraw.library_index(refresh=True)
+    monkeypatch.setenv('LDRAW_INSTANCE', '1')
+    monkeypatch.setenv('LDRAW_INSTANCE_THRESHOLD', '1')
+
+    matrices = ldraw_parser.matrices_from_values([[0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1], [20, 0, 0, 0, 0, 1, 0, 1, 0, -1, 0, 0]])
+    bricks = ldraw_mpd.LdrawFlatModel(['t025a.dat', 't025a.dat'], np.array([1, 16]), matrices, ['main', 'main'])
+    helper = ldraw_model.ldrawModelCompact(library.root / 't025a.ldr').instance_helper
+    flat = helper.add_primitives(bricks)
+
+    # the inverted reference stays in the part, the other two are copied onto every brick
+    assert flat.parts == ['t025a.dat'] * 2 + ['t025ac.dat'] * 4
+    assert helper.primitives == {'t025ac.dat'}
+    assert flat.colors.tolist() == [1, 16, 1, 4, 16, 4]
+
+    policy = ldraw.instance_policy('t025a')
+    body, _, _ = ldraw.compile_part('t025a', ldraw_model.static_part_options, ldraw.resolve_part, policy)
+    primitive, _, _ = ldraw.compile_part('t025ac', ldraw_model.static_part_options, ldraw.resolve_part)
+    plain, _, _ = ldraw.compile_part('t025a', ldraw_model.static_part_options, ldraw.resolve_part)
+    for n, matrix in enumerate(matrices):
+        copied = faces(body, matrix)
+        for m in range(2 + 2 * n, 4 + 2 * n):
+            copied.extend(faces(primitive, flat.matrices[m]))
+        assert sorted(copied) == faces(plain, matrix)
+
+def write_mpd(tmp_path):
+    '''an mpd file whose submodel is used twice and references the main model back'''
+    path = tmp_path / 'cycle.mpd'
+    path.write_text('\n'.join([
+        '0 FILE Main Model.ldr',
+        '1 4 0 0 0 1 0 0 0 1 0 0 0 1 3001.dat',
+        '1 16 0 -24 0 1 0 0 0 1 0 0 0 1 Sub Model.ldr',
+        '1 2 40 0 0 1 0 0 0 1 0 0 0 1 sub model.ldr',
+        '0 FILE Sub Model.ldr',
+        '1 16 10 0 0 1 0 0 0 1 0 0 0 1 3002.dat',
+        '1 16 0 0 0 1 0 0 0 1 0 0 0 1 Main Model.ldr',
+        '',
+    ]))
+    return path
+
+def model_points(path, **parms):
+    hda = ldraw_headless.Node('bldm_cycle', 'brickini_ldraw_model', parms=parms)
+    node = ldraw_headless.Node('python1', parent=hda)
+    ldraw_model.ldrawModelDynamic(path, node).build()
+    geo = node.geometry()
+    xform = np.array(geo.pointFloatAttribValues('xform')).reshape(-1, 4, 4)
+    return geo, xform
+
+def test_dynamic_mpd_keeps_subcomponents(tmp_path):
+    geo, _ = model_points(write_mpd(tmp_path))
+    # every submodel reference is a subcomponent point the hda assembles from the points of its modelname
+    assert geo.pointStringAttribValues('part') == ('3001', 'sub model.ldr', 'sub model.ldr', '3002', 'main model.ldr')
+    assert geo.pointStringAttribValues('type') == ('part', 'subcomponent', 'subcomponent', 'part', 'subcomponent')
+    assert geo.pointStringAttribValues('modelname') == ('main model.ldr',) * 3 + ('sub model.ldr',) * 2
+    assert geo.pointIntAttribValues('color_code') == (4, 16, 2, 16, 16)
+
+def test_dynamic_mpd_flattening_drops_cycles(tmp_path):
+    geo, xform = model_points(write_mpd(tmp_path), flatten_mpd=1)
+    # the reference back to the main model is dropped, the submodel is placed twice
+    assert geo.pointStringAttribValues('part') == ('3001', '3002', '3002')
+    assert geo.pointStringAttribValues('type') == ('part',) * 3
+    assert geo.pointIntAttribValues('color_code') == (4, 16, 2)
+    assert len(set(geo.pointStringAttribValues('modelname'))) == 1
+    assert np.allclose(xform[:, 3, :3], ldraw.matrices_to_houdini(ldraw_parser.matrices_from_values([
+        [0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1], [10, -24, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1], [50, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1]]))[:, 3, :3])
+
+def test_mpd_reader_is_closed_after_import(tmp_path, monkeypatch):
+    readers = []
+    init = ldraw_mpd.LdrawMpdReader.__init__
+    def tracked_init(self, path):
+        init(self, path)
+        readers.append(self)
+    monkeypatch.setattr(ldraw_mpd.LdrawMpdReader, '__init__', tracked_init)
+
+    model_points(write_mpd(tmp_path), flatten_mpd=1)
+    # an open mapping keeps the file locked on windows
+    assert readers and all(reader.data.closed for reader in readers)
+
+def test_write_subfile_streams_lines(tmp_path):
+    path = write_mpd(tmp_path)
+    target = tmp_path / 'parts' / 'sub.ldr'
+    with ldraw_mpd.LdrawMpdReader(path) as subfiles:
+        lines = subfiles['SubModel.ldr']
+        assert ldraw_mpd.write_subfile(target, lines)
+        assert not ldraw_mpd.write_subfile(target, lines)
+        assert target.read_text() == ''.join(lines)
+
+        target.write_text(''.join(lines) + '0 extra\n')
+        assert ldraw_mpd.write_subfile(target, lines)
+        assert target.read_text() == ''.join(lines)
+
+def place_part(self, color_code, part, geo_node):
+    '''a part and color sop without the parms of the real hdas'''
+    part_name = part.replace('.dat', '')
+    part_sop = self.part_list.get(part_name)
+    if part_sop is None:
+        part_sop = ldraw_headless.Node('bldp_{}_'.format(part_name), 'brickini_ldraw_part', geo_node, {'part': part_name})
+        self.part_list[part_name] = part_sop
+    material_sop = geo_node.createNode('brickini_material', 'bm_{}'.format(color_code))
+    material_sop.setInput(0, part_sop, 0)
+    return material_sop
+
+def transform_part(self, node, translate, rotate, scale, geo_node):
+    t = geo_node.createNode('xform', 'transform1')
+    t.setInput(0, node, 0)
+    return t
+
+def build_network(path, geo_node):
+    model = ldraw_model.ldrawModelMpd(path, geo_node=geo_node)
+    model.load_state(geo_node)
+    model.build_network(geo_node)
+    return sorted(child.type().name() for child in geo_node.children())
+
+def test_reload_replaces_inputs_that_change_kind(tmp_path, monkeypatch):
+    patch_static_helper(monkeypatch)
+
+    path = tmp_path / 'kind.mpd'
+    main = ['0 FILE main.ldr', '1 4 0 0 0 1 0 0 0 1 0 0 0 1 3001.dat', '1 16 0 -24 0 1 0 0 0 1 0 0 0 1 wing.ldr']
+    sub = ['0 FILE wing.ldr', '1 16 0 0 0 1 0 0 0 1 0 0 0 1 3002.dat']
+    geo = ldraw_headless.Node('geo_kind', 'geo')
+
+    # without its subfile wing.ldr is loaded as a part
+    path.write_text('\n'.join(main) + '\n')
+    assert build_network(path, geo) == ['brickini_ldraw_part'] * 2 + ['brickini_material'] * 2 + ['merge'] + ['xform'] * 2
+
+    # the same line now transforms the submodel, the color and part sop of the wing part are gone
+    path.write_text('\n'.join(main + sub) + '\n')
+    assert build_network(path, geo) == ['brickini_ldraw_part'] * 2 + ['brickini_material'] * 2 + ['merge'] * 2 + ['xform'] * 3
+    assert 'wing.ldr' not in [child.parm('part').eval() for child in geo.children() if child.type().name() == 'brickini_ldraw_part']
+
+    # and back to a part, the submodel merge and everything in it is removed
+    path.write_text('\n'.join(main) + '\n')
+    assert build_network(path, geo) == ['brickini_ldraw_part'] * 2 + ['brickini_material'] * 2 + ['merge'] + ['xform'] * 2
+    wing = next(child for child in geo.children() if child.parm('part') is not None and child.parm('part').eval() == 'wing.ldr')
+    assert [t.type().name() for material in wing.outputs() for t in material.outputs()] == ['xform']
+
+def patch_static_helper(monkeypatch):
+    monkeypatch.setattr(ldraw_model.LdrawStaticHelper, 'prefetch_parts', lambda self, references: None)
+    monkeypatch.setattr(ldraw_model.LdrawStaticHelper, 'place_part', place_part)
+    monkeypatch.setattr(ldraw_model.LdrawStaticHelper, 'transform_part', transform_part)
+
+def test_submodels_are_built_once_per_color(tmp_path, monkeypatch):
+    patch_static_helper(monkeypatch)
+    path = tmp_path / 'wheels.mpd'
+    path.write_text('\n'.join([
+        '0 FILE main.ldr',
+        '1 4 0 0 0 1 0 0 0 1 0 0 0 1 wheel.ldr',
+        '1 4 40 0 0 1 0 0 0 1 0 0 0 1 wheel.ldr',
+        '1 1 80 0 0 1 0 0 0 1 0 0 0 1 wheel.ldr',
+        '0 FILE wheel.ldr',
+        '1 16 0 0 0 1 0 0 0 1 0 0 0 1 3003.dat',
+        '1 0 0 0 0 1 0 0 0 1 0 0 0 1 3004.dat',
+    ]) + '\n')
+    geo = ldraw_headless.Node('geo_wheels', 'geo')
+
+    # the main model and one wheel per color, the references only transform them
+    children = build_network(path, geo)
+    assert children.count('merge') == 3
+    assert children.count('xform') == 3 + 2 * 2
+    assert children.count('brickini_material') == 4
+
+    wheels = [child.input(0) for child in geo.children() if child.type().name() == 'xform' and child.input(0).type().name() == 'merge']
+    assert sorted(collections.Counter(wheel.name() for wheel in wheels).values()) == [1, 2]
+
+def test_reload_only_rebuilds_changed_references(tmp_path, monkeypatch):
+    patch_static_helper(monkeypatch)
+    path = tmp_path / 'reload.mpd'
+    bricks = ['1 4 0 0 0 1 0 0 0 1 0 0 0 1 3001.dat', '1 4 40 0 0 1 0 0 0 1 0 0 0 1 3001.dat', '1 1 80 0 0 1 0 0 0 1 0 0 0 1 3003.dat']
+    geo = ldraw_headless.Node('geo_reload', 'geo')
+
+    def transforms():
+        return {child.name(): child.sessionId() for child in geo.children() if child.type().name() == 'xform'}
+
+    path.write_text('\n'.join(['0 FILE main.ldr'] + bricks) + '\n')
+    build_network(path, geo)
+    before = transforms()
+    assert len(before) == 3
+
+    # nothing changed, every node is kept
+    build_network(path, geo)
+    assert transforms() == before
+
+    # a moved brick gets a new transform, the others are kept
+    bricks[1] = '1 4 40 -24 0 1 0 0 0 1 0 0 0 1 3001.dat'
+    path.write_text('\n'.join(['0 FILE main.ldr'] + bricks) + '\n')
+    build_network(path, geo)
+    after = transforms()
+    assert len(after) == 3
+    assert len(set(after.items()) & set(before.items())) == 2
+
+    # a removed brick takes its color and part sop with it, the stand-in place_part gives every brick a color sop of its own
+    path.write_text('\n'.join(['0 FILE main.ldr'] + bricks[:2]) + '\n')
+    assert build_network(path, geo) == ['brickini_ldraw_part'] + ['brickini_material'] * 2 + ['merge'] + ['xform'] * 2
+
+def write_embedding_mpd(tmp_path, name, size):
+    '''an mpd file that embeds a part t014c.dat with a triangle of the given size'''
+    path = tmp_path / name
+    path.write_text('\n'.join([
+        '0 FILE main.ldr',
+        '1 4 0 0 0 1 0 0 0 1 0 0 0 1 t014c.dat',
+        '0 FILE t014c.dat',
+        '0 Embedded part',
+        '0 !LDRAW_ORG Unofficial_Part',
+        '0 BFC CERTIFY CCW',
+        '3 16 0 0 0 {0} 0 0 0 {0} 0'.format(size),
+        '',
+    ]))
+    return path
+
+def import_dynamic(path):
+    hda = ldraw_headless.Node('bldm_{}'.format(path.stem), 'brickini_ldraw_model')
+    ldraw_model.ldrawModelDynamic(path, ldraw_headless.Node('python1', parent=hda)).build()
+    return hda
+
+def test_embedded_parts_resolve_after_the_import(tmp_path, library):
+    # the library index is refreshed before the import writes the part, it's found without another refresh
+    ldraw.library_index(refresh=True)
+    hda = import_dynamic(write_embedding_mpd(tmp_path, 'embedded.mpd', 1))
+    overlay = ldraw.model_overlay(hda)
+    assert ldraw.resolve_part('t014c.dat', 0, overlay) == overlay / 'parts' / 't014c.dat'
+    assert ldraw.resolve_part('t014c.dat') == ldraw.pr_l2h / 'box-part-not-found.dat'
+
+    # part nodes inside the hda resolve through the embedded parts of its model
+    geo = library.cook('t014c', parent=hda)
+    assert len(geo.prims()) == 1
+
+def test_models_keep_their_own_embedded_parts(tmp_path, library):
+    small = import_dynamic(write_embedding_mpd(tmp_path, 'small.mpd', 1))
+    large = import_dynamic(write_embedding_mpd(tmp_path, 'large.mpd', 5))
+    assert ldraw.model_overlay(small) != ldraw.model_overlay(large)
+
+    def extent(hda):
+        return max(max(point.position()) for point in library.cook('t014c', parent=hda).points())
+
+    # the later import doesn't overwrite the part of the other model
+    assert extent(large) == pytest.approx(5 * extent(small))
+    assert extent(small) == pytest.approx(extent(large) / 5)
+
+def test_dynamic_import_reads_the_file_once(tmp_path, monkeypatch):
+    path = write_mpd(tmp_path)
+    opened = []
+    builtin_open = open
+    def tracked_open(file, *args, **kwargs):
+        if str(file) == str(path):
+            opened.append(file)
+        return builtin_open(file, *args, **kwargs)
+    monkeypatch.setattr('builtins.open', tracked_open)
+
+    geo, _ = model_points(path)
+    assert len(geo.points()) == 5
+    assert len(opened) == 1
+
+def test_only_the_dynamic_import_step_prefetches(tmp_path, library, monkeypatch):
+    library.write('parts/t008c.dat', '0 BFC CERTIFY CCW', '3 16 0 0 0 1 0 0 0 0 1')
+    prefetched = []
+    monkeypatch.setattr(ldraw, 'prefetch_parts', lambda parts, options, overlay=None: prefetched.append((parts, overlay)))
+    path = tmp_path / 'prefetch.ldr'
+    path.write_text('1 16 0 0 0 1 0 0 0 1 0 0 0 1 t008c.dat\n1 4 0 0 0 1 0 0 0 1 0 0 0 1 s\\t008c.dat\n')
+
+    # the hda cooks without starting worker processes
+    import_dynamic(path)
+    assert prefetched == []
+
+    hda = ldraw_headless.Node('bldm_prefetch', 'brickini_ldraw_model')
+    ldraw_model.ldrawModelDynamicShelf(path).prefetch_parts(hda)
+    assert prefetched == [(['t008c'], None)]
@@ -0,0 +1,65 @@
+import numpy as np
+import ldraw_parser
+
+def test_bfc_states_and_invertnext():
+    ldraw_file = ldraw_parser.parse_lines([
+        '0 Brick 1 x 1',
+        '3 16 0 0 0 1 0 0 0 1 0',
+        '0 BFC CERTIFY CW',
+        '4 16 0 0 0 1 0 0 1 1 0 0 1 0',
+        '0 BFC CCW',
+        '3 16 0 0 0 1 0 0 0 1 0',
+        '0 BFC CW',
+        '3 16 0 0 0 1 0 0 0 1 0',
+        '0 BFC INVERTNEXT',
+        '1 16 0 0 0 1 0 0 0 1 0 0 0 1 s\\stud.dat',
+        '1 16 0 0 0 1 0 0 0 1 0 0 0 1 s\\stud.dat',
+        '0 // 1 16 0 0 0 1 0 0 0 1 0 0 0 1 logo.dat',
+        '2 24 0 0 0 1 0 0',
+    ])
+    assert ldraw_file.title == 'Brick 1 x 1'
+    assert ldraw_file.face_bfc.tolist() == [ldraw_parser.BFC_INHERIT, ldraw_parser.BFC_INVERT, ldraw_parser.BFC_CCW, ldraw_parser.BFC_CW]
+    assert ldraw_file.face_sizes.tolist() == [3, 4, 3, 3]
+    assert ldraw_file.face_offsets.tolist() == [0, 3, 7, 10]
+    # the flag only applies to the reference right after it
+    assert ldraw_file.ref_flags.tolist() == [ldraw_parser.REF_INVERTNEXT, 0, ldraw_parser.REF_DISABLED]
+    assert ldraw_file.ref_names() == ['s\\stud.dat', 's\\stud.dat', 'logo4.dat']
+    assert len(ldraw_file.line_points) == 2
+
+    for state, winding in ((ldraw_parser.BFC_INHERIT, 'CW'), (ldraw_parser.BFC_INVERT, 'CCW'), (ldraw_parser.BFC_CW, 'CW'), (ldraw_parser.BFC_CCW, 'CCW')):
+        assert ldraw_parser.face_winding(state, 'CW') == winding
+
+def test_direct_colors():
+    ldraw_file = ldraw_parser.parse_lines([
+        '0 colors',
+        '3 0x2FF0000 0 0 0 1 0 0 0 1 0',
+        '3 0X2ff0000 0 0 0 1 0 0 0 1 0',
+        '3 4 0 0 0 1 0 0 0 1 0',
+        '1 0x20000FF 0 0 0 1 0 0 0 1 0 0 0 1 3001.dat',
+        '2 bad 0 0 0 1 0 0',
+    ])
+    assert ldraw_file.face_color.tolist() == [0x2FF0000, 0x2FF0000, 4]
+    assert ldraw_file.ref_color.tolist() == [0x20000FF]
+    # unreadable colors become -1 instead of failing the whole file
+    assert ldraw_file.line_color.tolist() == [-1]
+
+    assert ldraw_parser.is_direct_color(0x2FF0000) and not ldraw_parser.is_direct_color(16)
+    assert ldraw_parser.color_token(0x2FF0000) == '0x2FF0000'
+    assert ldraw_parser.color_token(4) == '4'
+
+def test_reference_matrices():
+    ldraw_file = ldraw_parser.parse_lines(['0 ref', '1 16 10 20 30 0 0 1 0 1 0 -1 0 0 3001.dat'])
+    matrix = ldraw_parser.matrices_from_values(ldraw_file.ref_matrix)[0]
+    # row vectors, so the ldraw rotation is transposed
+    assert np.allclose(np.array([1, 0, 0]) @ matrix[:3, :3] + matrix[3, :3], [10, 20, 29])
+
+def test_tokens_are_converted_in_blocks(monkeypatch):
+    lines = ['0 blocks'] + ['3 16 0 0 {0} 1 0 {0} 0 1 {0}'.format(i) for i in range(10)] + ['1 16 {0} 0 0 1 0 0 0 1 0 0 0 1 stud.dat'.format(i) for i in range(3)]
+    expected = ldraw_parser.parse_lines(lines)
+
+    monkeypatch.setattr(ldraw_parser, 'VALUE_BLOCK', 7)
+    ldraw_file = ldraw_parser.parse_tokens(line.split() for line in lines)
+    assert ldraw_file.title == expected.title == 'blocks'
+    assert np.array_equal(ldraw_file.face_points, expected.face_points)
+    assert np.array_equal(ldraw_file.ref_matrix, expected.ref_matrix)
+    assert ldraw_file.face_points[:, 2].tolist() == [i for i in range(10) for _ in range(3)]
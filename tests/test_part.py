@@ -0,0 +1,53 @@
+import test_compiler
+
+def test_edge_group_skips_repeated_lines(library):
+    test_compiler.write_repeated_edges(library, 't024e')
+    geo = library.cook('t024e')
+    prims = geo.prims()
+    # the repeated lines stay in the geometry, so the faces keep their numbers
+    assert [p.number() for p in prims if p.isClosed()] == [0, 1, 2, 5, 8]
+    assert len(geo.findEdgeGroup('ldraw_edges').edges()) == 3
+
+def test_instancing_only_in_compact_part_nodes(library, monkeypatch):
+    import ldraw_headless
+    import test_model
+    test_model.write_instanced_part(library, 't025b')
+    monkeypatch.setenv('LDRAW_INSTANCE', '1')
+    monkeypatch.setenv('LDRAW_INSTANCE_THRESHOLD', '1')
+
+    # part nodes the compact import didn't create keep all primitives
+    geo = library.cook('t025b')
+    assert geo.findPointAttrib('inst_name') is None
+    assert len(geo.prims()) == 7
+
+    hda = ldraw_headless.Node('bldp_t025b_', 'brickini_ldraw_part')
+    hda.setUserData('ldraw_instance', '1')
+    geo = library.cook('t025b', parent=hda)
+    assert len(geo.prims()) == 3
+    assert geo.pointStringAttribValues('inst_name')[-2:] == ('t025bc', 't025bc')
+    assert geo.pointIntAttribValues('inst_color_code')[-2:] == (16, 4)
+    assert geo.findPointAttrib('Cd') is None and geo.findPointAttrib('info') is None
+
+def test_weld_per_part_node(library, monkeypatch):
+    import ldraw_headless
+    library.write('parts/t023a.dat', '0 BFC CERTIFY CCW', '4 16 0 0 0 1 0 0 1 1 0 0 1 0', '4 16 1 0 0 2 0 0 2 1 0 1 1 0')
+    monkeypatch.setenv('LDRAW_WELD', '0')
+
+    geo = library.cook('t023a')
+    assert len(geo.points()) == 8 and geo.findGlobalAttrib('weld_ratio') is None
+
+    # a weld spare parm on the part hda
+    hda = ldraw_headless.Node('bldp_t023a_', 'brickini_ldraw_part', parms={'weld': 1})
+    geo = library.cook('t023a', parent=hda)
+    assert len(geo.points()) == 6
+    assert geo.attribValue('weld_ratio') == 8 / 6
+
+    # user data on a parent of the hda, e.g. the geo node of a model
+    geo_node = ldraw_headless.Node('geo_weld', 'geo')
+    geo_node.setUserData('ldraw_weld', '1')
+    hda = ldraw_headless.Node('bldp_t023a_', 'brickini_ldraw_part', parent=geo_node)
+    assert len(library.cook('t023a', parent=hda).points()) == 6
+
+    # the spare parm wins over the user data
+    hda = ldraw_headless.Node('bldp_t023a_', 'brickini_ldraw_part', parent=geo_node, parms={'weld': 0})
+    assert len(library.cook('t023a', parent=hda).points()) == 8
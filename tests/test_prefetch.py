@@ -0,0 +1,29 @@
+import sys
+import ldraw
+import ldraw_cache
+import ldraw_model
+import ldraw_prefetch
+
+def test_missing_parts_are_compiled_by_the_worker_script(tmp_path, library, monkeypatch):
+    library.write('parts/t008a.dat', '0 BFC CERTIFY CCW', '4 16 0 0 0 1 0 0 1 0 1 0 0 1')
+    library.write('parts/t008b.dat', '0 BFC CERTIFY CCW', '3 16 0 0 0 1 0 0 0 0 1')
+    monkeypatch.setenv('LDRAW_WORKER_PYTHON', sys.executable)
+    monkeypatch.setenv('LDRAW_PREFETCH_WORKERS', '2')
+
+    main_module = sys.modules['__main__']
+    main_attrs = dict(main_module.__dict__)
+
+    options = ldraw_model.static_part_options
+    prefetch_library = (ldraw.search_paths, tmp_path / 'library_index.json', None, ldraw.overlay_position)
+    fallback = ldraw.pr_l2h / 'box-part-not-found.dat'
+    compiled = ldraw_prefetch.prefetch_parts(['t008a', 't008b', 't008a'], options, prefetch_library, fallback, tmp_path / 'parts')
+    assert sorted(compiled) == ['t008a', 't008b']
+
+    # the interpreter that starts the prefetch is left alone
+    assert main_module.__dict__ == main_attrs
+
+    resolve = ldraw_prefetch.PartResolver(ldraw_prefetch.open_index(prefetch_library), 0, fallback)
+    part_cache = ldraw_cache.LdrawPartCache(tmp_path / 'parts')
+    assert part_cache.contains('t008a', options, resolve)
+    assert part_cache.contains('t008b', options, resolve)
+    assert ldraw_prefetch.prefetch_parts(['t008a', 't008b'], options, prefetch_library, fallback, tmp_path / 'parts') == []
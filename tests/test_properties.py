@@ -0,0 +1,43 @@
+import json
+import numpy as np
+import pytest
+import ldraw
+import ldraw_headless
+import ldraw_part_properties
+
+def test_malformed_entries_are_skipped(tmp_path):
+    path = tmp_path / 'part_properties.json'
+    path.write_text(json.dumps({
+        'slopes': ['3040'],
+        'softness': {'3040': '0.5', '3001': 'soft', '3002': ''},
+        'graininess': {'2524': ['0.2', '0-3 7 5-6'], '2554': ['0.1'], '3001': ['0.3', '']},
+    }))
+    table = ldraw.LdrawPartProperties(path)
+
+    assert table.lookup('3040') == {'slope': True, 'softness': 0.5}
+    assert table.lookup('3002') == {}
+    assert table.lookup('9999') == {}
+
+    value, ranges = table.lookup('2524')['graininess']
+    assert value == 0.2 and ranges.tolist() == [[0, 3], [5, 7]]
+
+    # only the broken property is skipped, the rest of the part still works
+    with pytest.warns(UserWarning, match='softness of part 3001'):
+        assert table.lookup('3001') == {'graininess': (0.3, None)}
+    with pytest.warns(UserWarning, match='graininess of part 2554'):
+        assert table.lookup('2554') == {}
+
+def test_vertex_attribute_ranges():
+    node = ldraw_headless.Node('properties')
+    geo = node.geometry()
+    points = geo.createPoints([(i, 0, 0) for i in range(4)])
+    # triangles, quads and a line, so the vertex offsets of the primitives differ
+    sizes = [3, 4, 2, 4, 3, 3, 4]
+    geo.createPolygons([tuple(points[:size]) for size in sizes])
+    geo.addAttrib(ldraw_headless.attribType.Vertex, 'graininess', 0.0)
+
+    properties = ldraw_part_properties.ldrawPartProperties(node, dict(parm_part='2524'))
+    properties.set_vertex_attribute('graininess', 0.5, ldraw.parse_prim_ranges('1-2 5 6-9'))
+
+    mask = np.isin(np.arange(len(sizes)), [1, 2, 5, 6])
+    assert geo.vertexFloatAttribValues('graininess') == tuple(np.repeat(np.where(mask, 0.5, 0.0), sizes).tolist())